@@ -0,0 +1,145 @@
+import itertools
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+from django.core.management.base import BaseCommand
+
+# methods answered with a sent message, the key is the media the message gets
+MESSAGE_METHODS = {
+    'sendMessage': None,
+    'sendLocation': 'location',
+    'sendDocument': 'document',
+    'sendPhoto': 'photo',
+    'sendVideo': 'video',
+}
+
+
+class FakeTelegram:
+    """
+    State of the fake Bot API: every call is recorded, every rate_limit_every-th send is answered with 429
+    and chats in blocked_chats with 403
+    """
+
+    def __init__(self, rate_limit_every=0, retry_after=1, blocked_chats=(), latency_ms=0):
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.blocked_chats = {str(chat_id) for chat_id in blocked_chats}
+        self.latency_ms = latency_ms
+        self.calls = []
+        self.sends = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.lock = threading.Lock()
+
+    def call(self, method, params) -> tuple:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        with self.lock:
+            self.calls.append({'method': method, 'params': params, 'time': time.time()})
+            if method not in MESSAGE_METHODS:
+                return 200, {'ok': True, 'result': self.other_result(method)}
+            if self.rate_limit_every and next(self.sends) % self.rate_limit_every == 0:
+                return 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': self.retry_after},
+                             'description': f'Too Many Requests: retry after {self.retry_after}'}
+            if str(params.get('chat_id')) in self.blocked_chats:
+                return 403, {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'}
+            return 200, {'ok': True, 'result': self.message(method, params, next(self.message_ids))}
+
+    @staticmethod
+    def other_result(method):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'fake', 'username': 'fake_bot'}
+        return True
+
+    @staticmethod
+    def message(method, params, message_id) -> dict:
+        chat_id = params.get('chat_id', 0)
+        message = {'message_id': message_id, 'date': int(time.time()),
+                   'chat': {'id': int(chat_id) if str(chat_id).lstrip('-').isdigit() else 0, 'type': 'private'}}
+        media = MESSAGE_METHODS[method]
+        file = {'file_id': f'fake-file-{message_id}', 'file_unique_id': f'fake-unique-{message_id}'}
+        if media == 'location':
+            message['location'] = {'latitude': float(params.get('latitude', 0)),
+                                   'longitude': float(params.get('longitude', 0))}
+        elif media == 'photo':
+            message['photo'] = [{**file, 'width': 90, 'height': 90}]
+        elif media == 'video':
+            message['video'] = {**file, 'width': 90, 'height': 90, 'duration': 1}
+        elif media:
+            message[media] = file
+        else:
+            message['text'] = params.get('text', '')
+        reply_parameters = json.loads(params.get('reply_parameters') or '{}')
+        reply_to = params.get('reply_to_message_id') or reply_parameters.get('message_id')
+        if reply_to:
+            message['reply_to_message'] = {'message_id': int(reply_to), 'date': message['date'],
+                                           'chat': message['chat']}
+        return message
+
+
+def request_handler(telegram: FakeTelegram, verbosity=1):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.handle_call()
+
+        def do_POST(self):
+            self.handle_call()
+
+        def handle_call(self):
+            url = urlsplit(self.path)
+            if url.path == '/calls':
+                return self.answer(200, telegram.calls)
+
+            # /bot<token>/<method>
+            parts = url.path.strip('/').split('/')
+            if len(parts) != 2 or not parts[0].startswith('bot'):
+                return self.answer(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            params = dict(parse_qsl(url.query))
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            content_type = self.headers.get('Content-Type', '')
+            if content_type.startswith('application/x-www-form-urlencoded'):
+                params.update(parse_qsl(body.decode()))
+            elif content_type.startswith('application/json') and body:
+                params.update(json.loads(body))
+            status, answer = telegram.call(parts[1], params)
+            self.answer(status, answer)
+
+        def answer(self, status, data):
+            body = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if verbosity > 1:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class Command(BaseCommand):
+    help = ('Local stand-in for the Telegram Bot API to run bots and the outbound queue against '
+            '(TELEGRAM_API_URL=http://127.0.0.1:<port>). GET /calls lists the calls it got')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every n-th send with 429')
+        parser.add_argument('--retry-after', type=int, default=1, help='retry_after of the 429 answers')
+        parser.add_argument('--blocked-chat', action='append', default=[], help='Chat answered with 403')
+        parser.add_argument('--latency-ms', type=int, default=0, help='Delay of every answer')
+
+    def handle(self, *args, **options):
+        telegram = FakeTelegram(options['rate_limit_every'], options['retry_after'], options['blocked_chat'],
+                                options['latency_ms'])
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), request_handler(telegram, options['verbosity']))
+        self.stdout.write(f'Fake Telegram Bot API on http://127.0.0.1:{options["port"]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
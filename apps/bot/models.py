@@ -1,6 +1,7 @@
 from django.db import models
 
-from config.core.choices import CAR_OR_AIR_CHOICE
+from config.core.choices import CAR_OR_AIR_CHOICE, OUTBOUND_STATUS_CHOICE, OUTBOUND_PENDING, OUTBOUND_METHOD_CHOICE
+from config.models import BaseModel
 
 
 class StartedTG(models.Model):
@@ -9,3 +10,43 @@ class StartedTG(models.Model):
 
     class Meta:
         db_table = 'StartedTG'
+
+
+class TelegramMedia(BaseModel):
+    """
+    file_id telegram gave for an uploaded file, per bot (file_ids don't work across bots) and file content
+    """
+    bot_id = models.CharField(max_length=32)
+    sha256 = models.CharField(max_length=64)
+    file_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=300, null=True, blank=True)
+
+    class Meta:
+        db_table = 'TelegramMedia'
+        constraints = [
+            models.UniqueConstraint(fields=['bot_id', 'sha256'], name='unique_bot_id_sha256'),
+        ]
+
+
+class OutboundMessage(BaseModel):
+    """
+    Telegram message queued by a view or handler, sent by the send_outbound_message task (apps.bot.utils.outbound)
+    """
+    bot_type = models.CharField(choices=CAR_OR_AIR_CHOICE, max_length=4)
+    chat_id = models.CharField(max_length=155)
+    method = models.CharField(choices=OUTBOUND_METHOD_CHOICE, max_length=20)
+    payload = models.JSONField(default=dict)
+    # sent only after this one, e.g. the second part of a conversation or a reply to it
+    previous = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='next')
+    reply_to_previous = models.BooleanField(default=False)
+    status = models.CharField(choices=OUTBOUND_STATUS_CHOICE, max_length=7, default=OUTBOUND_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    message_id = models.BigIntegerField(null=True, blank=True)  # telegram message id once sent
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'OutboundMessage'
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='outbound_message_status'),
+        ]
@@ -0,0 +1,25 @@
+from celery import shared_task
+
+
+@shared_task(name='process_bot_updates')
+def process_bot_updates(bot_type, chat_id):
+    """
+    Run the bot handlers for the webhook updates queued for a chat
+    """
+    from apps.bot.utils.updates import process_chat_updates
+
+    process_chat_updates(bot_type, chat_id)
+    return {'detail': f'{bot_type} chat {chat_id} processed', 'status': 200}
+
+
+@shared_task(name='send_outbound_message')
+def send_outbound_message(message_id):
+    """
+    Send a message queued with apps.bot.utils.outbound.queue_message
+    """
+    from apps.bot.utils.outbound import send_outbound
+
+    message = send_outbound(message_id)
+    if message is None:
+        return {'detail': f'Outbound message #{message_id} not found', 'status': 404}
+    return {'detail': f'Outbound message #{message_id} {message.status}', 'status': 200}
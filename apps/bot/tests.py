@@ -1,3 +1,74 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from apps.bot.models import OutboundMessage
+from apps.bot.utils.outbound import queue_message, send_outbound, claim_message, stale_messages, STALE_AFTER
+from config.core.choices import OUTBOUND_PENDING, OUTBOUND_SENDING, OUTBOUND_SENT
+
+
+# no broker and no redis here: the task is recorded, the rate limits let everything through
+@mock.patch('apps.bot.utils.outbound.telegram_chat_bucket')
+@mock.patch('apps.bot.utils.outbound.telegram_bucket')
+@mock.patch('apps.bot.utils.outbound.send_outbound_message')
+class OutboundQueueTest(TestCase):
+    def queued(self, task) -> list:
+        return [call.args[0] for call in task.delay.call_args_list]
+
+    def send(self, message_id):
+        bot = mock.Mock(**{'send_message.return_value': SimpleNamespace(message_id=1)})
+        with mock.patch.dict('apps.bot.views.customer_bots', {'AVIA': bot}):
+            return send_outbound(message_id)
+
+    def test_group_is_queued_on_commit(self, task, *buckets):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                first = queue_message('AVIA', 1, text='first')
+                second = queue_message('AVIA', 1, previous=first, text='second')
+                self.assertEqual(self.queued(task), [])
+
+        # the second one waits for the first
+        self.assertEqual(self.queued(task), [first.id])
+        self.send(first.id)
+        self.assertEqual(self.queued(task), [first.id, second.id])
+
+    def test_message_stored_after_its_previous_was_sent_queues_itself(self, task, *buckets):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = queue_message('AVIA', 1, text='first')
+        self.send(first.id)
+        task.reset_mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = queue_message('AVIA', 1, previous=first, text='second')
+
+        self.assertEqual(self.queued(task), [second.id])
+
+    def test_message_is_claimed_once(self, task, *buckets):
+        message = queue_message('AVIA', 1, text='first')
+
+        self.assertEqual(claim_message(message.id).status, OUTBOUND_SENDING)
+        self.assertIsNone(claim_message(message.id))
+        self.assertIsNone(self.send(message.id).sent_at)
+
+    def test_sent_message_is_not_sent_again(self, task, *buckets):
+        message = queue_message('AVIA', 1, text='first')
+        self.assertEqual(self.send(message.id).status, OUTBOUND_SENT)
+
+        self.assertIsNone(claim_message(message.id))
+
+    def test_stale_messages(self, task, *buckets):
+        lost = queue_message('AVIA', 1, text='lost')
+        dead_worker = queue_message('AVIA', 1, text='dead worker')
+        waiting = queue_message('AVIA', 1, previous=dead_worker, text='waiting')
+        fresh = queue_message('AVIA', 1, text='fresh')
+        OutboundMessage.objects.filter(pk=dead_worker.pk).update(status=OUTBOUND_SENDING)
+        OutboundMessage.objects.exclude(pk=fresh.pk).update(updated_at=timezone.now() - STALE_AFTER - timedelta(1))
 
-# Create your tests here.
+        self.assertEqual(set(stale_messages().values_list('id', flat=True)), {lost.id, dead_worker.id})
+        # the worker which died doesn't block the message
+        self.assertEqual(claim_message(dead_worker.id).status, OUTBOUND_SENDING)
+        self.assertEqual(OutboundMessage.objects.get(pk=waiting.pk).status, OUTBOUND_PENDING)
@@ -0,0 +1,68 @@
+import logging
+import os
+
+from telebot import TeleBot
+from telebot.apihelper import ApiTelegramException
+
+from apps.bot.models import TelegramMedia
+from apps.files.utils import file_sha256
+
+logger = logging.getLogger()
+
+# path: (size, mtime, sha256), a file is hashed again only when it changed on disk
+_file_hashes = {}
+
+
+def cached_file_sha256(path: str) -> str:
+    stat = os.stat(path)
+    cached = _file_hashes.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
+    _file_hashes[path] = (stat.st_size, stat.st_mtime_ns, file_sha256(path))
+    return _file_hashes[path][2]
+
+
+def bot_id(bot: TeleBot) -> str:
+    return bot.token.split(':')[0]
+
+
+def cached_file_id(bot: TeleBot, sha256: str):
+    return (TelegramMedia.objects.filter(bot_id=bot_id(bot), sha256=sha256)
+            .values_list('file_id', flat=True).first())
+
+
+def remember_file_id(bot: TeleBot, sha256: str, file_id: str, name: str = None):
+    TelegramMedia.objects.update_or_create(bot_id=bot_id(bot), sha256=sha256,
+                                           defaults={'file_id': file_id, 'name': name})
+
+
+def sent_file_id(message):
+    if message.photo:
+        return message.photo[-1].file_id
+    for media in [message.document, message.video, message.animation, message.audio, message.voice]:
+        if media:
+            return media.file_id
+    return None
+
+
+def send_cached_document(bot: TeleBot, chat_id, path: str, **kwargs):
+    """
+    Send a file from disk by the file_id of its first upload to this bot; uploads it when its content is new
+    or telegram doesn't know the file_id anymore
+    """
+    sha256 = cached_file_sha256(path)
+    file_id = cached_file_id(bot, sha256)
+    if file_id:
+        try:
+            return bot.send_document(chat_id, file_id, **kwargs)
+        except ApiTelegramException as exc:
+            if 'file identifier' not in (exc.description or ''):
+                raise
+            logger.warning('cached file_id of %s was rejected, uploading it again: %s', path, exc.description)
+
+    with open(path, 'rb') as document:
+        sent = bot.send_document(chat_id, document, **kwargs)
+    file_id = sent_file_id(sent)
+    if file_id:
+        remember_file_id(bot, sha256, file_id, os.path.basename(path))
+    return sent
@@ -0,0 +1,141 @@
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from telebot.apihelper import ApiTelegramException
+
+from apps.bot.models import OutboundMessage
+from apps.bot.tasks import send_outbound_message
+from apps.tools.utils.rate_limit import telegram_bucket, telegram_chat_bucket
+from config.core.choices import OUTBOUND_SEND_MESSAGE, OUTBOUND_SEND_LOCATION, OUTBOUND_SEND_INSTRUCTION, \
+    OUTBOUND_PENDING, OUTBOUND_SENDING, OUTBOUND_SENT, OUTBOUND_FAILED
+
+logger = logging.getLogger()
+
+MAX_SEND_ATTEMPTS = 6
+MAX_BACKOFF = 300
+# a message untouched for longer lost its task or its worker (a retry waits MAX_BACKOFF at most),
+# the resume_outbound_messages cron queues it again
+STALE_AFTER = timedelta(minutes=15)
+WAITING_STATUSES = [OUTBOUND_PENDING, OUTBOUND_SENDING]
+
+
+def queue_message(bot_type: str, chat_id, method=OUTBOUND_SEND_MESSAGE, previous: OutboundMessage = None,
+                  reply_to_previous=False, **payload) -> OutboundMessage:
+    """
+    Store a message for the bot to send and send it from a worker once the current transaction commits;
+    with previous it waits until that message is sent. payload are the keyword arguments of the bot method,
+    keyboards are stored as their json. Outside of a transaction on_commit runs at once, so queue messages
+    depending on each other inside transaction.atomic()
+    """
+    payload = {key: value.to_json() if hasattr(value, 'to_json') else value for key, value in payload.items()}
+    message = OutboundMessage.objects.create(bot_type=bot_type, chat_id=str(chat_id), method=method,
+                                             payload=payload, previous=previous, reply_to_previous=reply_to_previous)
+    if previous is None:
+        transaction.on_commit(lambda: send_outbound_message.delay(message.id))
+    else:
+        # the previous message may be done before this row is committed, its worker didn't see this one then
+        transaction.on_commit(lambda: queue_if_ready(message.id))
+    return message
+
+
+def ready_messages():
+    """
+    PENDING messages whose previous message is done (or which have none)
+    """
+    return OutboundMessage.objects.filter(status=OUTBOUND_PENDING).exclude(previous__status__in=WAITING_STATUSES)
+
+
+def queue_if_ready(message_id):
+    if ready_messages().filter(pk=message_id).exists():
+        send_outbound_message.delay(message_id)
+
+
+def stale_messages():
+    """
+    Ready messages no task holds any more: untouched PENDING ones and SENDING ones of a worker which died
+    """
+    stale_time = timezone.now() - STALE_AFTER
+    return (OutboundMessage.objects.filter(updated_at__lt=stale_time)
+            .filter(Q(status=OUTBOUND_SENDING) | Q(id__in=ready_messages().values('id'))))
+
+
+def claim_message(message_id):
+    """
+    Mark the message SENDING in one UPDATE, None when it's done, waits for its previous message or another
+    worker has it (the previous message's worker, queue_if_ready and the cron may all queue it)
+    """
+    stale_time = timezone.now() - STALE_AFTER
+    claimed = (OutboundMessage.objects
+               .filter(Q(id__in=ready_messages().values('id')) | Q(status=OUTBOUND_SENDING, updated_at__lt=stale_time),
+                       pk=message_id)
+               .update(status=OUTBOUND_SENDING, updated_at=timezone.now()))
+    return OutboundMessage.objects.select_related('previous').get(pk=message_id) if claimed else None
+
+
+def send_instruction_message(bot, chat_id, **payload):
+    from apps.bot.utils.tools import send_instruction
+
+    return send_instruction(str(chat_id), bot, **payload)
+
+
+send_methods = {
+    OUTBOUND_SEND_MESSAGE: lambda bot, chat_id, **payload: bot.send_message(chat_id, **payload),
+    OUTBOUND_SEND_LOCATION: lambda bot, chat_id, **payload: bot.send_location(chat_id, **payload),
+    OUTBOUND_SEND_INSTRUCTION: send_instruction_message,
+}
+
+
+def send_outbound(message_id):
+    """
+    Send a queued message within the telegram rate limits. 429 is retried after its retry_after,
+    network and telegram server errors with exponential backoff; other telegram errors (blocked bot,
+    chat not found) fail the message. Messages waiting for this one are queued once it's done
+    """
+    from apps.bot.views import customer_bots
+
+    message = claim_message(message_id)
+    if message is None:
+        return OutboundMessage.objects.filter(pk=message_id).first()
+
+    payload = dict(message.payload)
+    if message.reply_to_previous and message.previous and message.previous.message_id:
+        payload['reply_to_message_id'] = message.previous.message_id
+
+    telegram_chat_bucket(message.bot_type, message.chat_id).acquire()
+    telegram_bucket(message.bot_type).acquire()
+    message.attempts += 1
+    retry_in = None
+    try:
+        sent = send_methods[message.method](customer_bots[message.bot_type], message.chat_id, **payload)
+    except ApiTelegramException as exc:
+        message.error = exc.description
+        if exc.error_code == 429:
+            retry_in = exc.result_json.get('parameters', {}).get('retry_after', 1)
+        elif exc.error_code >= 500:
+            retry_in = min(2 ** message.attempts, MAX_BACKOFF)
+    except Exception as exc:
+        message.error = str(exc)
+        retry_in = min(2 ** message.attempts, MAX_BACKOFF)
+    else:
+        message.status, message.error, message.sent_at = OUTBOUND_SENT, None, timezone.now()
+        message.message_id = getattr(sent, 'message_id', None)
+
+    if message.status == OUTBOUND_SENDING:
+        if retry_in is not None and message.attempts < MAX_SEND_ATTEMPTS:
+            message.status = OUTBOUND_PENDING
+            message.save(update_fields=['status', 'attempts', 'error', 'updated_at'])
+            send_outbound_message.apply_async((message.id,), countdown=retry_in)
+            return message
+        logger.warning('outbound %s message %s to %s failed: %s', message.bot_type, message.id, message.chat_id,
+                       message.error)
+        message.status = OUTBOUND_FAILED
+
+    message.save(update_fields=['status', 'attempts', 'error', 'message_id', 'sent_at', 'updated_at'])
+    # the next messages go out even when this one failed, only without the reply; read after the save,
+    # the ones committed later see this message done and queue themselves
+    for next_id in message.next.filter(status=OUTBOUND_PENDING).values_list('id', flat=True):
+        send_outbound_message.delay(next_id)
+    return message
@@ -0,0 +1,101 @@
+import json
+import logging
+import uuid
+
+import redis
+from django.db import transaction
+from telebot.types import Update
+
+from apps.bot.tasks import process_bot_updates
+from apps.tools.utils.rate_limit import get_redis
+
+logger = logging.getLogger()
+
+UPDATE_SEEN_KEY = 'bot:update:{}:{}'
+CHAT_UPDATES_KEY = 'bot:chat-updates:{}:{}'
+CHAT_LOCK_KEY = 'bot:chat-lock:{}:{}'
+UPDATE_SEEN_TTL = 24 * 60 * 60  # telegram stops redelivering an update long before that
+CHAT_UPDATES_TTL = 24 * 60 * 60
+CHAT_LOCK_TTL = 300  # renewed before every update, only expires when a worker died holding it
+
+# deletes the lock only when it's still ours, it may have expired and been taken by another worker
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# update types which carry the chat they belong to, directly or in their message
+CHAT_UPDATE_TYPES = ['message', 'edited_message', 'callback_query', 'my_chat_member', 'chat_member',
+                     'chat_join_request', 'channel_post', 'edited_channel_post']
+
+
+def update_chat_id(data: dict):
+    for update_type in CHAT_UPDATE_TYPES:
+        payload = data.get(update_type)
+        if payload:
+            chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+            if chat:
+                return chat['id']
+            return (payload.get('from') or {}).get('id')
+    return None
+
+
+def enqueue_update(bot_type: str, data: dict) -> bool:
+    """
+    Put a raw webhook update on its chat's queue and schedule the chat to be processed;
+    False when the update_id was seen already (telegram redelivers updates it got no quick answer for)
+    """
+    update_id = data.get('update_id')
+    client = get_redis()
+    seen_key = UPDATE_SEEN_KEY.format(bot_type, update_id)
+    if update_id is not None and not client.set(seen_key, 1, nx=True, ex=UPDATE_SEEN_TTL):
+        return False
+
+    # updates without a chat have nothing to be ordered with
+    chat_id = update_chat_id(data) or f'update-{update_id}'
+    updates_key = CHAT_UPDATES_KEY.format(bot_type, chat_id)
+    try:
+        pipe = client.pipeline()
+        pipe.rpush(updates_key, json.dumps(data))
+        pipe.expire(updates_key, CHAT_UPDATES_TTL)
+        pipe.execute()
+    except redis.RedisError:
+        # let telegram redeliver it
+        client.delete(seen_key)
+        raise
+    transaction.on_commit(lambda: process_bot_updates.delay(bot_type, chat_id))
+    return True
+
+
+def process_chat_updates(bot_type: str, chat_id):
+    """
+    Handle the queued updates of a chat in the order they came. One worker at a time holds the chat lock,
+    a worker which doesn't get it leaves its updates to the holder
+    """
+    client = get_redis()
+    release = client.register_script(RELEASE_LOCK_SCRIPT)
+    updates_key, lock_key = CHAT_UPDATES_KEY.format(bot_type, chat_id), CHAT_LOCK_KEY.format(bot_type, chat_id)
+    token = uuid.uuid4().hex
+
+    while client.set(lock_key, token, nx=True, ex=CHAT_LOCK_TTL):
+        try:
+            while (raw := client.lpop(updates_key)) is not None:
+                client.expire(lock_key, CHAT_LOCK_TTL)
+                process_update(bot_type, json.loads(raw))
+        finally:
+            release(keys=[lock_key], args=[token])
+        # an update pushed while the lock was released found it taken, its task left it to us
+        if not client.llen(updates_key):
+            break
+
+
+def process_update(bot_type: str, data: dict):
+    from apps.bot.views import customer_bots
+
+    try:
+        customer_bots[bot_type].process_new_updates([Update.de_json(data)])
+    except Exception:
+        # a failing update must not hold back the rest of the chat
+        logger.exception('telegram %s update %s failed', bot_type, data.get('update_id'))
@@ -1,6 +1,7 @@
 import logging
 
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 from django.utils.timezone import localdate
 from rest_framework import status
@@ -8,20 +9,33 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from telebot import TeleBot, types
-from telebot.types import Update, ReplyKeyboardRemove
+from telebot import TeleBot, types, apihelper
+from telebot.types import ReplyKeyboardRemove
 
 from apps.bot.models import StartedTG
 from apps.bot.templates.text import success_location, welcome_bot_message, after_start_message, delivery_text
 from apps.bot.utils.keyboards import language_keyboard, web_app_keyboard
+from apps.bot.utils.outbound import queue_message
 from apps.bot.utils.service import language_handler
+from apps.bot.utils.updates import enqueue_update
 from apps.user.models import Customer
+from config.core.choices import OUTBOUND_SEND_LOCATION
 
 logger = logging.getLogger()
 bot_tokens = settings.BOT_TOKENS
 
-avia_customer_bot = TeleBot(bot_tokens['avia_customer'])
-auto_customer_bot = TeleBot(bot_tokens['auto_customer'])
+if settings.TELEGRAM_API_URL:
+    apihelper.API_URL = settings.TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+    apihelper.FILE_URL = settings.TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+
+# handlers run in the process_bot_updates task one update after another, not in telebot's thread pool
+avia_customer_bot = TeleBot(bot_tokens['avia_customer'], threaded=False)
+auto_customer_bot = TeleBot(bot_tokens['auto_customer'], threaded=False)
+
+customer_bots = {
+    'AVIA': avia_customer_bot,
+    'AUTO': auto_customer_bot,
+}
 
 user_states = {}
 
@@ -31,8 +45,8 @@ class AviaBotWebhook(APIView):
 
     @staticmethod
     def post(request):
-        update = Update.de_json(request.data)
-        avia_customer_bot.process_new_updates([update])
+        # acknowledged right away, telegram redelivers updates of slow webhooks
+        enqueue_update('AVIA', request.data)
         return Response({'message': 'Success!',
                          'status': status.HTTP_200_OK})
 
@@ -42,8 +56,8 @@ class AutoBotWebhook(APIView):
 
     @staticmethod
     def post(request):
-        update = Update.de_json(request.data)
-        auto_customer_bot.process_new_updates([update])
+        # acknowledged right away, telegram redelivers updates of slow webhooks
+        enqueue_update('AUTO', request.data)
         return Response({'message': 'Success!',
                          'status': status.HTTP_200_OK})
 
@@ -90,30 +104,31 @@ def handle_content_avia(message: types.Message):
         tg_id = message.chat.id
         customer = get_object_or_404(Customer, tg_id=tg_id, user_type='AVIA')
         location = message.location.to_dict()
-        customer.location = location
-        customer.save()
-        delivery = customer.deliveries.filter(message_sent=False).order_by('-id').first()
-        if delivery:
-            load = delivery.load
-            channel_message = delivery_text.format(date=localdate(timezone.now()).strftime("%d.%m.%Y"),
-                                                   weight=load.weight,
-                                                   delivery_type=delivery.get_delivery_type_display(),
-                                                   comment=delivery.comment,
-                                                   phone_number=customer.phone_number,
-                                                   track_link='',
-                                                   customer_id=f'{customer.prefix}{customer.code}')
-            delivery_message = avia_customer_bot.send_message(chat_id=-1002187675934, text=channel_message,
-                                                              parse_mode='HTML')
-            avia_customer_bot.send_message(chat_id=tg_id, text=success_location, reply_markup=ReplyKeyboardRemove())
-            avia_customer_bot.send_location(chat_id=-1002187675934, reply_to_message_id=delivery_message.message_id,
-                                            latitude=location['latitude'], longitude=location['longitude'])
-            load.is_active = False
-            load.status = 'DONE'
-            load.save()
-            delivery.message_sent = True
-            delivery.save()
+        # the messages are queued when the delivery is marked sent, the location after the channel post is stored
+        with transaction.atomic():
+            customer.location = location
+            customer.save()
+            delivery = customer.deliveries.filter(message_sent=False).order_by('-id').first()
+            if delivery:
+                load = delivery.load
+                channel_message = delivery_text.format(date=localdate(timezone.now()).strftime("%d.%m.%Y"),
+                                                       weight=load.weight,
+                                                       delivery_type=delivery.get_delivery_type_display(),
+                                                       comment=delivery.comment,
+                                                       phone_number=customer.phone_number,
+                                                       track_link='',
+                                                       customer_id=f'{customer.prefix}{customer.code}')
+                delivery_message = queue_message('AVIA', -1002187675934, text=channel_message, parse_mode='HTML')
+                queue_message('AVIA', tg_id, text=success_location, reply_markup=ReplyKeyboardRemove())
+                queue_message('AVIA', -1002187675934, OUTBOUND_SEND_LOCATION, previous=delivery_message,
+                              reply_to_previous=True, latitude=location['latitude'], longitude=location['longitude'])
+                load.is_active = False
+                load.status = 'DONE'
+                load.save()
+                delivery.message_sent = True
+                delivery.save()
     except Exception as exc:
-        logger.debug(f'Telegram AVIA location_handler error occurred: {exc.args}')
+        logger.debug('Telegram AVIA location_handler error occurred: %s', exc.args)
 
 
 @auto_customer_bot.message_handler(content_types=['location'])
@@ -122,27 +137,28 @@ def handle_content_auto(message: types.Message):
         tg_id = message.chat.id
         customer = get_object_or_404(Customer, tg_id=tg_id, user_type='AUTO')
         location = message.location.to_dict()
-        customer.location = location
-        customer.save()
-        delivery = customer.deliveries.filter(message_sent=False).order_by('-id').first()
-        if delivery:
-            load = delivery.load
-            channel_message = delivery_text.format(date=localdate(timezone.now()).strftime("%d.%m.%Y"),
-                                                   weight=load.weight,
-                                                   delivery_type=delivery.get_delivery_type_display(),
-                                                   comment=delivery.comment,
-                                                   phone_number=customer.phone_number,
-                                                   track_link='',
-                                                   customer_id=f'{customer.prefix}{customer.code}')
-            delivery_message = auto_customer_bot.send_message(chat_id=-1002187675934, text=channel_message,
-                                                              parse_mode='HTML')
-            auto_customer_bot.send_message(chat_id=tg_id, text=success_location, reply_markup=ReplyKeyboardRemove())
-            auto_customer_bot.send_location(chat_id=-1002187675934, reply_to_message_id=delivery_message.message_id,
-                                            latitude=location['latitude'], longitude=location['longitude'])
-            load.is_active = False
-            load.status = 'DONE'
-            load.save()
-            delivery.message_sent = True
-            delivery.save()
+        # the messages are queued when the delivery is marked sent, the location after the channel post is stored
+        with transaction.atomic():
+            customer.location = location
+            customer.save()
+            delivery = customer.deliveries.filter(message_sent=False).order_by('-id').first()
+            if delivery:
+                load = delivery.load
+                channel_message = delivery_text.format(date=localdate(timezone.now()).strftime("%d.%m.%Y"),
+                                                       weight=load.weight,
+                                                       delivery_type=delivery.get_delivery_type_display(),
+                                                       comment=delivery.comment,
+                                                       phone_number=customer.phone_number,
+                                                       track_link='',
+                                                       customer_id=f'{customer.prefix}{customer.code}')
+                delivery_message = queue_message('AUTO', -1002187675934, text=channel_message, parse_mode='HTML')
+                queue_message('AUTO', tg_id, text=success_location, reply_markup=ReplyKeyboardRemove())
+                queue_message('AUTO', -1002187675934, OUTBOUND_SEND_LOCATION, previous=delivery_message,
+                              reply_to_previous=True, latitude=location['latitude'], longitude=location['longitude'])
+                load.is_active = False
+                load.status = 'DONE'
+                load.save()
+                delivery.message_sent = True
+                delivery.save()
     except Exception as exc:
-        logger.debug(f'Telegram AUTO location_handler error occurred: {exc.args}')
+        logger.debug('Telegram AUTO location_handler error occurred: %s', exc.args)
@@ -0,0 +1,34 @@
+import redis
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.files.utils.cleanup import collect_orphan_files, gc_stats
+
+
+class Command(BaseCommand):
+    help = ('Delete File rows nothing links to which are older than --min-age-hours, their unshared content and '
+            'variants, and abandoned resumable uploads; --dry-run reports what would go. Runs nightly from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report the files and bytes')
+        parser.add_argument('--min-age-hours', type=int, default=settings.FILE_GC['min_age_hours'])
+        parser.add_argument('--batch-size', type=int, default=settings.FILE_GC['batch_size'])
+
+    def handle(self, *args, **options):
+        if options['min_age_hours'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--min-age-hours and --batch-size must be positive')
+
+        report = collect_orphan_files(dry_run=options['dry_run'], batch_size=options['batch_size'],
+                                      min_age_hours=options['min_age_hours'])
+        verb = 'to delete' if report['dry_run'] else 'deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['deleted_files']} files and {report['deleted_uploads']} uploads {verb}, "
+            f"{report['reclaimed_bytes'] / 1024 / 1024:.1f} MB in {report['seconds']}s"))
+        try:
+            stats = gc_stats()
+        except redis.RedisError as exc:
+            self.stderr.write(f'totals are not available: {exc}')
+            return
+        if stats:
+            self.stdout.write(f"all runs: {stats['runs']} runs, {stats['deleted_files']} files, "
+                              f"{stats['reclaimed_bytes'] / 1024 / 1024:.1f} MB reclaimed, last {stats['last_run']}")
@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models.functions import Lower
+from PIL import Image
+
+from apps.files.models import File
+from apps.files.utils import stored_path
+from apps.files.utils.images import IMAGE_EXTENSIONS, render_variants, variant_targets, variants_of, save_variants
+
+
+def render_job(job):
+    # runs in a pool process, errors are returned so one broken image doesn't stop the batch
+    source, targets = job
+    try:
+        return render_variants(source, targets), None
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        return None, str(exc)
+
+
+class Command(BaseCommand):
+    help = ('Make the webp variants of stored images which have none yet (all of them with --all); '
+            'rendering runs in --processes pool processes, the rows are updated from this one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Pool processes, 1 renders inline')
+        parser.add_argument('--all', action='store_true', help='Render images which have variants again')
+        parser.add_argument('--batch-size', type=int, default=200, help='Images handed to the pool at once')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--processes and --batch-size must be positive')
+
+        images = (File.objects.annotate(extension_lower=Lower('extension'))
+                  .filter(extension_lower__in=IMAGE_EXTENSIONS, gen_name__isnull=False))
+        if not options['all']:
+            images = images.filter(variants__isnull=True)
+        # rows sharing content share the variants, every stored file is rendered once
+        stored = [File(gen_name=gen_name, sha256=sha256)
+                  for gen_name, sha256 in images.order_by('gen_name').values_list('gen_name', 'sha256').distinct()]
+        self.stdout.write(f'{len(stored)} images to render in {options["processes"]} process(es)')
+
+        started, failed = time.perf_counter(), 0
+        if options['processes'] > 1:
+            # forked workers must not inherit (and close on exit) the database connection
+            connections.close_all()
+        pool = ProcessPoolExecutor(options['processes']) if options['processes'] > 1 else None
+        try:
+            for i in range(0, len(stored), options['batch_size']):
+                batch = stored[i:i + options['batch_size']]
+                jobs = [(stored_path(file.gen_name), variant_targets(file)) for file in batch]
+                results = pool.map(render_job, jobs) if pool else map(render_job, jobs)
+                for file, (rendered, error) in zip(batch, results):
+                    if error:
+                        failed += 1
+                        self.stderr.write(f'{file.gen_name}: {error}')
+                    save_variants(file, variants_of(file, rendered) if rendered else {})
+                self.stdout.write(f'{min(i + options["batch_size"], len(stored))}/{len(stored)}')
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'{len(stored) - failed} images rendered, {failed} failed '
+                                             f'in {time.perf_counter() - started:.1f}s'))
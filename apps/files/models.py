@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 from config.models import BaseModel
@@ -10,6 +12,10 @@ class File(BaseModel):
     path = models.TextField(null=True)
     content_type = models.CharField(max_length=100, null=True)
     extension = models.CharField(max_length=30, null=True)
+    # rows with equal content share gen_name
+    sha256 = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # webp variants of images: {name: {path, width, height, size}}, {} when it isn't a readable image
+    variants = models.JSONField(null=True, blank=True)
     china_product = models.ForeignKey("loads.Product", on_delete=models.SET_NULL, null=True, blank=True,
                                       related_name='china_files')
     loads = models.ForeignKey("loads.Load", on_delete=models.SET_NULL, null=True, blank=True,
@@ -21,3 +27,18 @@ class File(BaseModel):
 
     class Meta:
         db_table = "File"
+
+
+class FileUpload(BaseModel):
+    """
+    Resumable upload sent in chunks, the received bytes are in FILE_UPLOAD_DIR/.partial/<id> until it's complete
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=300)
+    size = models.BigIntegerField()
+    received = models.BigIntegerField(default=0)
+    content_type = models.CharField(max_length=100, null=True, blank=True)
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+
+    class Meta:
+        db_table = "FileUpload"
@@ -1,13 +1,60 @@
 from rest_framework import serializers
 
-from apps.files.models import File
+from apps.files.models import File, FileUpload
+from apps.files.utils import MAX_UPLOAD_SIZE
+from apps.files.utils.images import variant_path
+from apps.files.utils.serving import signed_url
 
 
 class FileDataSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
+    medium = serializers.SerializerMethodField()
+
     class Meta:
         model = File
         fields = [
             'name',
             'size',
             'path',
+            'thumbnail',
+            'medium',
         ]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for field in ('path', 'thumbnail', 'medium'):
+            data[field] = signed_url(data[field])
+        return data
+
+    @staticmethod
+    def get_thumbnail(obj):
+        return variant_path(obj, 'thumb')
+
+    @staticmethod
+    def get_medium(obj):
+        return variant_path(obj, 'medium')
+
+
+class FileUploadStartSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=300)
+    size = serializers.IntegerField(min_value=1, max_value=MAX_UPLOAD_SIZE)
+    content_type = serializers.CharField(max_length=100, required=False, allow_null=True)
+
+
+class FileUploadChunkSerializer(serializers.Serializer):
+    offset = serializers.IntegerField(min_value=0)
+    chunk = serializers.FileField(allow_empty_file=False)
+
+
+class FileUploadSerializer(serializers.ModelSerializer):
+    file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FileUpload
+        fields = ['id', 'name', 'size', 'received', 'file']
+
+    @staticmethod
+    def get_file(obj):
+        if obj.file_id is None:
+            return None
+        return {'path': signed_url(obj.file.path), 'id': obj.file.id, 'name': obj.file.name}
@@ -0,0 +1,26 @@
+from celery import shared_task
+
+
+@shared_task(name='process_image')
+def process_image(file_id):
+    """
+    Thumbnail and medium webp variants of an uploaded image
+    """
+    from apps.files.models import File
+    from apps.files.utils.images import make_variants
+
+    file = File.objects.filter(pk=file_id).first()
+    if not file:
+        return {'detail': f'File #{file_id} not found', 'status': 404}
+    variants = make_variants(file)
+    return {'detail': f'File #{file_id}: {len(variants)} variants', 'status': 200}
+
+
+@shared_task(name='collect_orphan_files')
+def collect_orphan_files(dry_run=False):
+    """
+    Delete File rows nothing links to, with their content, and abandoned resumable uploads
+    """
+    from apps.files.utils.cleanup import collect_orphan_files as collect
+
+    return collect(dry_run=dry_run)
@@ -1,3 +1,108 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from apps.files.models import File
+from apps.files.utils import upload_file, upload_files, delete_file, stored_path, partial_path
+from apps.files.utils import cleanup
+from config.core.api_exceptions import APIValidation
+
+
+class UploadDirMixin:
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        upload_dir = override_settings(FILE_UPLOAD_DIR=directory.name)
+        upload_dir.enable()
+        self.addCleanup(upload_dir.disable)
+
+    def uploaded(self, content=b'content', name='notes.txt'):
+        return SimpleUploadedFile(name, content, content_type='text/plain')
+
+
+class ContentStorageTest(UploadDirMixin, TestCase):
+    def test_same_content_is_stored_once(self):
+        first, second = upload_file(self.uploaded()), upload_file(self.uploaded(name='copy.txt'))
+
+        self.assertEqual(first.gen_name, second.gen_name)
+        self.assertTrue(os.path.exists(stored_path(first.gen_name)))
+        self.assertEqual(os.listdir(partial_path('')), [])
+
+    def test_content_is_removed_with_its_last_row(self):
+        first, second = upload_files([self.uploaded(), self.uploaded(name='copy.txt')])
+
+        delete_file(first)
+        self.assertTrue(os.path.exists(stored_path(second.gen_name)))
+        delete_file(second)
+        self.assertFalse(os.path.exists(stored_path(second.gen_name)))
+
+    def test_failed_upload_leaves_no_temporary_files(self):
+        with mock.patch.object(File.objects, 'create', side_effect=ValueError('broken')):
+            with self.assertRaises(APIValidation):
+                upload_files([self.uploaded(), self.uploaded(b'other', 'other.txt')])
+
+        self.assertEqual(os.listdir(partial_path('')), [])
+        self.assertFalse(File.objects.exists())
+
+    def test_failed_file_leaves_none_of_the_others(self):
+        create = File.objects.create
+
+        def second_create_fails(**kwargs):
+            if File.objects.filter(name='notes.txt').exists():
+                raise ValueError('broken')
+            return create(**kwargs)
+
+        with mock.patch.object(File.objects, 'create', side_effect=second_create_fails):
+            with self.assertRaises(APIValidation):
+                upload_files([self.uploaded(), self.uploaded(b'other', 'other.txt')])
+
+        self.assertFalse(File.objects.exists())
+        # the content placed for the first file went with its row
+        self.assertEqual([files for directory, dirs, files in os.walk(stored_path('')) if files], [])
+
+    def test_no_files(self):
+        self.assertEqual(upload_files([]), [])
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the content lock is a PostgreSQL advisory lock')
+class ContentRemovalRaceTest(UploadDirMixin, TransactionTestCase):
+    def test_upload_between_usage_check_and_removal_keeps_its_content(self):
+        old = upload_file(self.uploaded())
+        checked, results = threading.Event(), {}
+        remove_file = cleanup.remove_file
+
+        def slow_remove_file(path):
+            # the removal has found the content unused, the upload of the same content starts now
+            checked.set()
+            time.sleep(0.2)
+            return remove_file(path)
+
+        def remove():
+            try:
+                delete_file(old)
+            finally:
+                checked.set()
+                connection.close()
+
+        def upload():
+            try:
+                checked.wait(5)
+                results['new'] = upload_file(self.uploaded(name='again.txt'))
+            finally:
+                connection.close()
+
+        with mock.patch.object(cleanup, 'remove_file', slow_remove_file):
+            threads = [threading.Thread(target=remove), threading.Thread(target=upload)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertTrue(os.path.exists(stored_path(results['new'].gen_name)))
@@ -1,10 +1,13 @@
 from django.urls import path
 
-from apps.files.views import FileCreateAPIView, FileDeleteAPIView, UploadFilesAPIView
+from apps.files.views import FileCreateAPIView, FileDeleteAPIView, UploadFilesAPIView, FileUploadStartAPIView, \
+    FileUploadChunkAPIView
 
 app_name = 'files'
 urlpatterns = [
     path('create/', FileCreateAPIView.as_view(), name='file_create'),
     path('delete/<int:pk>/', FileDeleteAPIView.as_view(), name='file_delete'),
     path('upload-files/', UploadFilesAPIView.as_view(), name='upload_files'),
+    path('upload-chunked/', FileUploadStartAPIView.as_view(), name='upload_chunked_start'),
+    path('upload-chunked/<uuid:pk>/', FileUploadChunkAPIView.as_view(), name='upload_chunked'),
 ]
@@ -2,20 +2,32 @@ import logging
 
 from rest_framework import status
 
-from apps.files.models import File
+from apps.files.models import File, FileUpload
+from apps.files.tasks import process_image
 from django.conf import settings
+from django.db import transaction, connection
+from django.utils.translation import gettext_lazy as _
 from config.core.api_exceptions import APIValidation
 
+from concurrent.futures import ThreadPoolExecutor
 from os.path import join as join_path
 from os import sep
 
 from dotenv import load_dotenv
+import hashlib
+import os
+import tempfile
 import uuid
 import time
 
 load_dotenv()
 logger = logging.getLogger()
 
+MAX_UPLOAD_SIZE = 52_428_800
+HASH_CHUNK_SIZE = 1024 * 1024
+UPLOAD_WORKERS = 4
+PARTIAL_DIR = '.partial'  # in FILE_UPLOAD_DIR, files being written
+
 
 def get_extension(filename: str) -> str:
     return filename.split(".")[-1]
@@ -41,26 +53,186 @@ def gen_hash_name(filename) -> str:
     return "%s.%s" % (unique_code(), get_extension(filename=filename))
 
 
-def upload_file(file):
+def content_name(sha256: str, extension: str) -> str:
+    # identical content gets one name, the two letter directories keep any single directory small
+    return "%s/%s.%s" % (sha256[:2], sha256, extension)
+
+
+def stored_path(gen_name: str) -> str:
+    return join_path(upload_path(), gen_name.replace('/', sep))
+
+
+def partial_path(name: str) -> str:
+    return join_path(upload_path(), PARTIAL_DIR, name)
+
+
+def lock_content(key: str) -> None:
+    """
+    Lock a content address (the sha256 of new files, the gen_name of older ones) till the transaction ends.
+    Storing a file and removing unused content take it, so content is never removed between an upload finding
+    it in place and the upload's row being committed. An advisory lock of PostgreSQL, other databases
+    (development) go without it
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', [f'files:{key}'])
+
+
+def place_content(temp_path: str, gen_name: str) -> None:
+    """
+    Move a fully written temporary file to its content address, or drop it when that content is stored already;
+    called under lock_content
+    """
+    path = stored_path(gen_name)
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, path)
+
+
+def store_chunks(chunks) -> dict:
+    """
+    Write chunks to a temporary file and hash them on the way, create_file stores it by its hash
+    """
+    os.makedirs(partial_path(''), exist_ok=True)
+    digest, size = hashlib.sha256(), 0
+    descriptor, temp_path = tempfile.mkstemp(dir=partial_path(''))
     try:
-        name = file.name
-        size = file.size
-        gen_name = gen_new_name(file)
-        content_type = file.content_type
-        extension = get_extension(filename=file.name)
-        path = media_path(gen_name)
-        uploaded_file = File(name=name,
-                             size=size,
-                             gen_name=gen_name,
-                             path=path,
-                             content_type=content_type,
-                             extension=extension)
-        with open(join_path(upload_path(), gen_name.replace(sep, '/')), 'wb+') as destination:
-            for chunk in file.chunks():
+        with os.fdopen(descriptor, 'wb') as destination:
+            for chunk in chunks:
+                digest.update(chunk)
                 destination.write(chunk)
-        uploaded_file.save()
+                size += len(chunk)
+    except BaseException:
+        remove_temporary([{'temp_path': temp_path}])
+        raise
+    return {'sha256': digest.hexdigest(), 'temp_path': temp_path, 'size': size}
+
+
+def store_upload(file) -> dict:
+    return store_chunks(file.chunks())
+
+
+def remove_temporary(stored: list) -> None:
+    # the files store_chunks wrote which were not placed, after a failure
+    for item in stored:
+        if item and os.path.exists(item['temp_path']):
+            os.remove(item['temp_path'])
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as stored:
+        for chunk in iter(lambda: stored.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def create_file(name, content_type, stored: dict) -> File:
+    """
+    Row of a file written by store_chunks (or of a complete resumable upload): the row is created and the
+    content placed under the content lock, in one transaction
+    """
+    from apps.files.utils.images import is_image
+
+    extension = get_extension(filename=name)
+    gen_name = content_name(stored['sha256'], extension)
+    with transaction.atomic():
+        lock_content(stored['sha256'])
+        file = File.objects.create(name=name,
+                                   size=stored['size'],
+                                   gen_name=gen_name,
+                                   path=media_path(gen_name),
+                                   content_type=content_type,
+                                   extension=extension,
+                                   sha256=stored['sha256'])
+        place_content(stored['temp_path'], gen_name)
+    if is_image(file):
+        transaction.on_commit(lambda: process_image.delay(file.id))
+    return file
 
-        return uploaded_file
+
+def upload_file(file):
+    stored = None
+    try:
+        stored = store_upload(file)
+        return create_file(file.name, file.content_type, stored)
     except Exception as exc:
-        logger.debug(f'file_upload_failed: {exc.__doc__}')
+        remove_temporary([stored])
+        logger.debug('file_upload_failed: %s', exc.__doc__)
         raise APIValidation(detail=f"{exc.__doc__} - {exc.args}", status_code=status.HTTP_400_BAD_REQUEST)
+
+
+def upload_files(files) -> list:
+    """
+    upload_file for several files: they are hashed and written in parallel, then the rows are created in the
+    calling thread in one transaction, so a failed file leaves none of the others behind
+    """
+    from apps.files.utils.cleanup import remove_unused_content
+
+    if not files:
+        return []
+    futures, created = [], []
+    try:
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_WORKERS, len(files))) as pool:
+            futures = [pool.submit(store_upload, file) for file in files]
+        stored = [future.result() for future in futures]
+        with transaction.atomic():
+            # sorted, so two uploads of overlapping files take the content locks in the same order
+            for key in sorted({item['sha256'] for item in stored}):
+                lock_content(key)
+            for file, item in zip(files, stored):
+                created.append(create_file(file.name, file.content_type, item))
+        return created
+    except Exception as exc:
+        # the written files which were not placed yet, and the content placed for the rolled back rows
+        remove_temporary([future.result() for future in futures if not future.exception()])
+        remove_unused_content(created)
+        logger.debug('file_upload_failed: %s', exc.__doc__)
+        raise APIValidation(detail=f"{exc.__doc__} - {exc.args}", status_code=status.HTTP_400_BAD_REQUEST)
+
+
+def delete_file(file: File):
+    """
+    Delete the row, and the stored content and variants when no other row shares them
+    """
+    from apps.files.utils.cleanup import remove_unused_content
+
+    file.delete()
+    remove_unused_content([file])
+
+
+def start_upload(name, size, content_type=None) -> FileUpload:
+    upload = FileUpload.objects.create(name=name, size=size, content_type=content_type)
+    os.makedirs(partial_path(''), exist_ok=True)
+    open(partial_path(str(upload.id)), 'wb').close()
+    return upload
+
+
+def write_chunk(upload: FileUpload, offset: int, chunk) -> FileUpload:
+    """
+    Write a chunk of a resumable upload at offset, which must be where the received bytes end.
+    The upload row is locked by the caller; once all bytes are in, the file is stored and upload.file set
+    """
+    if offset != upload.received:
+        raise APIValidation(detail={'detail': _('Неверное смещение части файла'), 'received': upload.received},
+                            status_code=status.HTTP_409_CONFLICT)
+    if offset + chunk.size > upload.size:
+        raise APIValidation(detail=_('Часть файла выходит за его размер'), status_code=status.HTTP_400_BAD_REQUEST)
+
+    path = partial_path(str(upload.id))
+    with open(path, 'r+b') as destination:
+        # bytes past the offset are from a chunk whose request failed, they are overwritten
+        destination.seek(offset)
+        for part in chunk.chunks():
+            destination.write(part)
+        destination.truncate()
+    upload.received = offset + chunk.size
+
+    if upload.received == upload.size:
+        upload.file = create_file(upload.name, upload.content_type,
+                                  {'sha256': file_sha256(path), 'temp_path': path, 'size': upload.size})
+    upload.save(update_fields=['received', 'file', 'updated_at'])
+    return upload
@@ -0,0 +1,216 @@
+import logging
+import os
+import time
+import uuid
+from datetime import timedelta
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, ForeignKey
+from django.utils import timezone
+
+from apps.files.models import File, FileUpload
+from apps.files.utils import stored_path, partial_path, lock_content
+from apps.files.utils.images import IMAGE_VARIANTS, is_image, variant_name
+from apps.tools.utils.rate_limit import get_redis
+
+logger = logging.getLogger()
+
+GC_STATS_KEY = 'files:gc'
+# relations which don't make a file used: the chunked upload it came from
+GC_IGNORED_RELATIONS = {'uploads'}
+
+
+def orphan_files(min_age_hours=None):
+    """
+    Rows older than min_age_hours which no FK points at. File's own FKs (china_product, loads, payments,
+    customer_registration) are null checks, the FKs of other models (passport_photo, newsletter_uz/ru,
+    manifest_imports, ...) are NOT EXISTS anti-joins; both are read from the models, so a new FK to File
+    keeps its files without changes here
+    """
+    min_age_hours = settings.FILE_GC['min_age_hours'] if min_age_hours is None else min_age_hours
+    orphans = File.objects.filter(created_at__lt=timezone.now() - timedelta(hours=min_age_hours))
+    for field in File._meta.get_fields():
+        if isinstance(field, ForeignKey):
+            orphans = orphans.filter(**{f'{field.name}__isnull': True})
+        elif field.one_to_many and field.name not in GC_IGNORED_RELATIONS:
+            related = field.related_model._base_manager.filter(**{field.field.name: OuterRef('pk')})
+            orphans = orphans.filter(~Exists(related))
+    return orphans
+
+
+def remove_file(path) -> int:
+    # bytes reclaimed, 0 when it was gone already
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+    except FileNotFoundError:
+        return 0
+
+
+def remove_unused_content(files) -> int:
+    """
+    Remove the stored content and the variants of deleted rows which no other row shares, returns the bytes.
+    The usage is checked and the content removed under the content locks, an upload of the same content
+    waits and then stores it again
+    """
+    files = [file for file in files if file.gen_name]
+    with transaction.atomic():
+        # sorted, so two removals of overlapping files take the locks in the same order
+        for key in sorted({file.sha256 or file.gen_name for file in files}):
+            lock_content(key)
+        gen_names = {file.gen_name for file in files}
+        used_names = set(File.objects.filter(gen_name__in=gen_names).values_list('gen_name', flat=True))
+        shas = {file.sha256 for file in files if file.sha256}
+        # the same content with another extension has its own gen_name but the same variants
+        used_shas = set(File.objects.filter(sha256__in=shas).values_list('sha256', flat=True))
+
+        reclaimed, removed = 0, set()
+        for file in files:
+            if file.gen_name in removed:
+                continue
+            removed.add(file.gen_name)
+            if file.gen_name not in used_names:
+                reclaimed += remove_file(stored_path(file.gen_name))
+            variants_used = file.sha256 in used_shas if file.sha256 else file.gen_name in used_names
+            if is_image(file) and not variants_used:
+                reclaimed += sum(remove_file(stored_path(variant_name(file, name))) for name in IMAGE_VARIANTS)
+    return reclaimed
+
+
+def freed_bytes(files, orphans, counted: set) -> int:
+    """
+    Bytes deleting the rows would free, for the report mode: content and variants which only orphans share,
+    counted keeps the gen_names of earlier batches
+    """
+    files = {file.gen_name: file for file in files if file.gen_name and file.gen_name not in counted}
+    shared = set(File.objects.filter(gen_name__in=files).exclude(id__in=orphans.values('id'))
+                 .values_list('gen_name', flat=True))
+    freed = 0
+    for gen_name, file in files.items():
+        counted.add(gen_name)
+        if gen_name not in shared:
+            freed += int(file.size or 0) + sum(variant.get('size', 0) for variant in (file.variants or {}).values())
+    return freed
+
+
+def delete_orphans(ids, min_age_hours=None) -> tuple:
+    """
+    Delete the rows among ids which are still orphans (one could be linked since they were selected),
+    then their unshared content; returns (deleted rows, reclaimed bytes)
+    """
+    with transaction.atomic():
+        files = list(orphan_files(min_age_hours).filter(id__in=ids).select_for_update()
+                     .only('id', 'gen_name', 'sha256', 'extension', 'size'))
+        File.objects.filter(id__in=[file.id for file in files]).delete()
+    return len(files), remove_unused_content(files)
+
+
+def stale_uploads(min_age_hours=None):
+    min_age_hours = settings.FILE_GC['min_age_hours'] if min_age_hours is None else min_age_hours
+    return FileUpload.objects.filter(file__isnull=True,
+                                     updated_at__lt=timezone.now() - timedelta(hours=min_age_hours))
+
+
+def is_uuid(name) -> bool:
+    try:
+        uuid.UUID(name)
+        return True
+    except ValueError:
+        return False
+
+
+def delete_stale_uploads(dry_run=False, min_age_hours=None) -> tuple:
+    """
+    Resumable uploads which got no chunk for min_age_hours and partial files without an upload row;
+    returns (uploads, bytes)
+    """
+    min_age_hours = settings.FILE_GC['min_age_hours'] if min_age_hours is None else min_age_hours
+    stale = {str(upload_id) for upload_id in stale_uploads(min_age_hours).values_list('id', flat=True)}
+    if stale and not dry_run:
+        stale_uploads(min_age_hours).filter(id__in=stale).delete()
+        # the ones which got a chunk meanwhile are kept
+        stale -= {str(upload_id) for upload_id in
+                  FileUpload.objects.filter(id__in=stale).values_list('id', flat=True)}
+
+    directory = partial_path('')
+    names = os.listdir(directory) if os.path.isdir(directory) else []
+    live = {str(upload_id) for upload_id in
+            FileUpload.objects.filter(id__in=[name for name in names if is_uuid(name)]).values_list('id', flat=True)}
+    live -= stale
+    threshold = time.time() - min_age_hours * 3600
+    reclaimed = 0
+    for name in names:
+        if name in live:
+            continue
+        path = partial_path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        # a partial file without a row may be of an upload being started right now
+        if name in stale or stat.st_mtime < threshold:
+            reclaimed += stat.st_size if dry_run else remove_file(path)
+    return len(stale), reclaimed
+
+
+def record_gc(deleted, reclaimed):
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(GC_STATS_KEY, 'runs', 1)
+        pipe.hincrby(GC_STATS_KEY, 'deleted_files', deleted)
+        pipe.hincrby(GC_STATS_KEY, 'reclaimed_bytes', reclaimed)
+        pipe.hset(GC_STATS_KEY, 'last_run', timezone.now().isoformat())
+        pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning('file gc stats were not saved: %s', exc)
+
+
+def gc_stats() -> dict:
+    """
+    Totals of every run: runs, deleted_files, reclaimed_bytes, last_run
+    """
+    stats = {key.decode(): value.decode() for key, value in get_redis().hgetall(GC_STATS_KEY).items()}
+    return {key: value if key == 'last_run' else int(value) for key, value in stats.items()}
+
+
+def collect_orphan_files(dry_run=False, batch_size=None, min_age_hours=None) -> dict:
+    """
+    Delete orphan rows in batches of batch_size, their unshared content and variants, and abandoned
+    resumable uploads; dry_run only reports what would go
+    """
+    started = time.monotonic()
+    batch_size = batch_size or settings.FILE_GC['batch_size']
+    orphans = orphan_files(min_age_hours).order_by('id')
+
+    deleted, reclaimed, last_id, counted = 0, 0, 0, set()
+    while True:
+        batch = list(orphans.filter(id__gt=last_id).only('id', 'gen_name', 'size', 'variants')[:batch_size])
+        if not batch:
+            break
+        last_id = batch[-1].id
+        if dry_run:
+            deleted += len(batch)
+            reclaimed += freed_bytes(batch, orphans, counted)
+        else:
+            batch_deleted, batch_reclaimed = delete_orphans([file.id for file in batch], min_age_hours)
+            deleted += batch_deleted
+            reclaimed += batch_reclaimed
+
+    uploads, upload_bytes = delete_stale_uploads(dry_run, min_age_hours)
+    reclaimed += upload_bytes
+    if not dry_run:
+        record_gc(deleted, reclaimed)
+
+    report = {
+        'dry_run': dry_run,
+        'deleted_files': deleted,
+        'deleted_uploads': uploads,
+        'reclaimed_bytes': reclaimed,
+        'seconds': round(time.monotonic() - started, 3),
+    }
+    logger.info('collect_orphan_files: %s files and %s uploads %s, %s bytes in %ss', deleted, uploads,
+                'to delete' if dry_run else 'deleted', reclaimed, report['seconds'])
+    return report
@@ -0,0 +1,96 @@
+import logging
+import os
+import tempfile
+from os.path import splitext, basename
+
+from PIL import Image, ImageOps
+
+from apps.files.models import File
+from apps.files.utils import stored_path, media_path
+
+logger = logging.getLogger()
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'webp', 'bmp', 'gif', 'tif', 'tiff'}
+# name: longest side in px, webp quality
+IMAGE_VARIANTS = {
+    'thumb': (320, 70),
+    'medium': (1280, 80),
+}
+VARIANTS_DIR = 'variants'  # in FILE_UPLOAD_DIR
+
+
+def is_image(file: File) -> bool:
+    return (file.extension or '').lower() in IMAGE_EXTENSIONS
+
+
+def variant_name(file: File, variant: str) -> str:
+    # rows sharing content share variants as well
+    key = file.sha256 or splitext(basename(file.gen_name))[0]
+    return "%s/%s/%s-%s.webp" % (VARIANTS_DIR, key[:2], key, variant)
+
+
+def variant_path(file: File, variant: str):
+    """
+    Path of a variant for responses: the original until the variant is made, None for files which aren't images
+    """
+    if file is None or not is_image(file):
+        return None
+    return (file.variants or {}).get(variant, {}).get('path') or file.path
+
+
+def render_variants(source: str, targets: dict) -> dict:
+    """
+    Write webp variants of the image at source to targets {name: (path, longest side, quality)}.
+    The orientation from EXIF is applied to the pixels and EXIF isn't written. Needs no database,
+    so it runs in pool processes as well
+    """
+    rendered = {}
+    with Image.open(source) as image:
+        # jpeg decodes straight at a smaller scale, enough for the largest variant
+        largest = max(side for path, side, quality in targets.values())
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'PA', 'P') else 'RGB')
+        for name, (path, side, quality) in targets.items():
+            variant = image.copy()
+            variant.thumbnail((side, side), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(descriptor, 'wb') as destination:
+                variant.save(destination, 'WEBP', quality=quality, method=4)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+            rendered[name] = {'width': variant.width, 'height': variant.height, 'size': os.path.getsize(path)}
+    return rendered
+
+
+def variant_targets(file: File) -> dict:
+    return {name: (stored_path(variant_name(file, name)), side, quality)
+            for name, (side, quality) in IMAGE_VARIANTS.items()}
+
+
+def variants_of(file: File, rendered: dict) -> dict:
+    return {name: {'path': media_path(variant_name(file, name)), **info} for name, info in rendered.items()}
+
+
+def save_variants(file: File, variants: dict):
+    # every row of the same content gets them
+    File.objects.filter(gen_name=file.gen_name).update(variants=variants)
+
+
+def make_variants(file: File) -> dict:
+    """
+    Render and record the variants of an uploaded image; {} when it can't be read as one,
+    so it isn't tried again
+    """
+    done = (File.objects.filter(gen_name=file.gen_name, variants__isnull=False)
+            .values_list('variants', flat=True).first())
+    if done is None:
+        try:
+            done = variants_of(file, render_variants(stored_path(file.gen_name), variant_targets(file)))
+        except (OSError, ValueError, Image.DecompressionBombError) as exc:
+            logger.warning('variants of file #%s failed: %s', file.id, exc)
+            done = {}
+    save_variants(file, done)
+    return done
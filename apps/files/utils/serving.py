@@ -0,0 +1,222 @@
+import mimetypes
+import os
+import posixpath
+import re
+import time
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404, HttpResponse, FileResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import http_date, parse_http_date_safe
+
+from apps.files.models import File
+from apps.files.utils.images import VARIANTS_DIR
+
+UPLOADS_DIR = 'uploads'
+# media anyone may get, e.g. the instruction videos the bots send to everybody
+PUBLIC_DIRS = ('instructions/',)
+URL_LIFETIME = 24 * 60 * 60
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+VARIANT_RE = re.compile(r'^[0-9a-f]{2}/(?P<key>[^/]+)-[a-z]+\.webp$')
+
+signer = signing.Signer(salt='media')
+
+
+def clean_name(name: str) -> str:
+    """
+    Media name of a request path with "." and ".." resolved, 404 for names leaving MEDIA_ROOT
+    """
+    name = posixpath.normpath(name).lstrip('/')
+    if name in ('', '.') or name == '..' or name.startswith('../'):
+        raise Http404
+    return name
+
+
+def media_name(path: str) -> str:
+    """
+    Name under MEDIA_ROOT of a File.path ("media/uploads/ab/<sha256>.jpg", older rows start with a slash)
+    """
+    name = path.lstrip('/')
+    return name[len('media/'):] if name.startswith('media/') else name
+
+
+def signed_url(path):
+    """
+    File.path with a signature which lets the media view serve it without an Authorization header (img tags);
+    valid till the end of the next day, so the url stays the same and cached for a day
+    """
+    if not path:
+        return path
+    expires = (int(time.time()) // URL_LIFETIME + 2) * URL_LIFETIME
+    signature = signer.signature(f'{media_name(path)}:{expires}')
+    return f'{path}?expires={expires}&signature={signature}'
+
+
+def valid_signature(name, expires, signature) -> bool:
+    if not expires or not signature or not expires.isdigit() or int(expires) < time.time():
+        return False
+    return constant_time_compare(signer.signature(f'{name}:{expires}'), signature)
+
+
+def is_operator(user) -> bool:
+    return user.is_authenticated and (user.is_superuser or hasattr(user, 'operator'))
+
+
+def files_of(name: str):
+    """
+    Rows a media name belongs to: the file itself or the rows whose content the variant was made of
+    """
+    if not name.startswith(UPLOADS_DIR + '/'):
+        return File.objects.none()
+    name = name[len(UPLOADS_DIR) + 1:]
+    variant = VARIANT_RE.match(name[len(VARIANTS_DIR) + 1:]) if name.startswith(VARIANTS_DIR + '/') else None
+    if variant:
+        key = variant.group('key')
+        return File.objects.filter(Q(sha256=key) | Q(gen_name__startswith=f'{key}.'))
+    return File.objects.filter(gen_name=name)
+
+
+def can_view(user, name: str) -> bool:
+    """
+    Operators see all media, customers the files of their products, loads, payments, registrations and passport
+    """
+    if name.startswith(PUBLIC_DIRS):
+        return True
+    if is_operator(user):
+        return True
+    customer = getattr(user, 'customer', None) if user.is_authenticated else None
+    if customer is None:
+        return False
+    return files_of(name).filter(
+        Q(china_product__customer=customer) | Q(loads__customer=customer) | Q(payments__customer=customer) |
+        Q(customer_registration__customer=customer) | Q(customer=customer)
+    ).exists()
+
+
+def media_etag(stat) -> str:
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def content_type(name: str) -> str:
+    return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+
+def byte_range(header: str, size: int):
+    """
+    (start, end) of a single "bytes=" range, None to send the whole file (no or several ranges),
+    False when the range is outside of the file
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # the last n bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+class FileRange:
+    """
+    Open file limited to [start, start + length). The descriptor is positioned at start and fileno() is kept,
+    so gunicorn sends it with os.sendfile (it takes the length from Content-Length)
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file, self.remaining = file, length
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def served_path(name: str) -> str:
+    # raises SuspiciousFileOperation for names leaving MEDIA_ROOT
+    return safe_join(settings.MEDIA_ROOT, name)
+
+
+def fresh_range(request, etag, last_modified) -> bool:
+    """
+    If-Range: the range is sent only while the file is the one the client has the start of
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def media_response(request, name: str):
+    """
+    Response with the media file at name, the caller has checked the access. The bytes are sent by the front proxy
+    (X-Accel-Redirect or X-Sendfile) or by FileResponse, which gunicorn hands to os.sendfile
+    """
+    path = served_path(name)
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not S_ISREG(stat.st_mode):
+        raise Http404
+
+    etag, last_modified = media_etag(stat), int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        # access is checked per request, shared caches must not keep it
+        'Cache-Control': f'private, max-age={URL_LIFETIME}',
+    }
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        # 304 or 412
+        for header, value in headers.items():
+            response.headers.setdefault(header, value)
+        return response
+
+    backend = settings.MEDIA_SERVING['backend']
+    if backend == 'accel':
+        # nginx answers Range itself
+        response = HttpResponse(content_type=content_type(name))
+        response['X-Accel-Redirect'] = quote(settings.MEDIA_SERVING['accel_prefix'].rstrip('/') + '/' + name)
+    elif backend == 'sendfile':
+        response = HttpResponse(content_type=content_type(name))
+        response['X-Sendfile'] = path
+    else:
+        span = byte_range(request.headers.get('Range'), stat.st_size) if request.method == 'GET' and \
+            fresh_range(request, etag, last_modified) else None
+        if span is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+        if span:
+            start, end = span
+            response = FileResponse(FileRange(open(path, 'rb'), start, end - start + 1), status=206,
+                                    content_type=content_type(name))
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=content_type(name))
+        response['Accept-Ranges'] = 'bytes'
+    for header, value in headers.items():
+        response[header] = value
+    return response
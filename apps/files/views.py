@@ -1,18 +1,21 @@
 import logging
-from os import remove as delete_file
 
 from django.utils.translation import gettext_lazy as _
+from django.db import transaction
 from django.http import Http404
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
+from rest_framework.generics import get_object_or_404
 from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.files.models import File
-from apps.files.utils import upload_file
+from apps.files.models import File, FileUpload
+from apps.files.serializer import FileUploadStartSerializer, FileUploadChunkSerializer, FileUploadSerializer
+from apps.files.utils import upload_file, upload_files, delete_file, start_upload, write_chunk, MAX_UPLOAD_SIZE
+from apps.files.utils.serving import signed_url, valid_signature, can_view, clean_name, media_response
 from config.core.api_exceptions import APIValidation
 
 logger = logging.getLogger()
@@ -37,7 +40,7 @@ class FileCreateAPIView(APIView):
         file = request.data.get('file')
         if not file:
             raise APIValidation(detail=_('Файл не был отправлен'), code=status.HTTP_400_BAD_REQUEST)
-        if file.size > 52_428_800:
+        if file.size > MAX_UPLOAD_SIZE:
             raise APIValidation(detail=_('Размер файла превысил 50 МБ!'), code=status.HTTP_400_BAD_REQUEST)
 
         e_file = upload_file(file=file)
@@ -58,9 +61,7 @@ class FileDeleteAPIView(APIView):
             raise Http404
 
     def delete(self, request, pk):
-        file = self.get_object(pk)
-        delete_file(file.path)
-        file.delete()
+        delete_file(self.get_object(pk))
         return Response({
             "message": "File successfully deleted",
             "status": status.HTTP_200_OK
@@ -86,18 +87,78 @@ class UploadFilesAPIView(APIView):
     )
     def post(request, *args, **kwargs):
         files = request.FILES.getlist('files')
-        logger.debug(f"Request: {request.FILES}; Files: {files}, Request data: {request.data}")
+        logger.debug("Request: %s; Files: %s, Request data: %s", request.FILES, files, request.data)
         if not files:
             raise APIValidation(detail=_('Файл не был отправлен'), status_code=status.HTTP_400_BAD_REQUEST)
 
-        response = []
         for file in files:
-            if file.size > 52_428_800:
+            if file.size > MAX_UPLOAD_SIZE:
                 raise APIValidation(detail=_('Размер файла превысил 50 МБ!'),
                                     status_code=status.HTTP_400_BAD_REQUEST)
-            e_file = upload_file(file=file)
-            response.append({'path': e_file.path, 'id': e_file.id, 'name': e_file.name})
+        response = [{'path': signed_url(e_file.path), 'id': e_file.id, 'name': e_file.name}
+                    for e_file in upload_files(files)]
         return Response({
             "files": response,
             "status": status.HTTP_201_CREATED
         })
+
+
+class FileUploadStartAPIView(APIView):
+    permission_classes = [AllowAny, ]
+
+    @swagger_auto_schema(
+        operation_description="Start a resumable upload, its chunks are sent to upload-chunked/<id>/",
+        request_body=FileUploadStartSerializer,
+        responses={status.HTTP_201_CREATED: FileUploadSerializer}
+    )
+    def post(self, request):
+        serializer = FileUploadStartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = start_upload(**serializer.validated_data)
+        return Response(FileUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+
+class FileUploadChunkAPIView(APIView):
+    parser_classes = [MultiPartParser, ]
+    permission_classes = [AllowAny, ]
+
+    @swagger_auto_schema(
+        operation_description="Received bytes of a resumable upload, the next chunk starts there",
+        responses={status.HTTP_200_OK: FileUploadSerializer}
+    )
+    def get(self, request, pk):
+        return Response(FileUploadSerializer(get_object_or_404(FileUpload, pk=pk)).data)
+
+    @swagger_auto_schema(
+        operation_description="Send the chunk starting at offset; the file is in the response once all bytes are in",
+        manual_parameters=[
+            openapi.Parameter('offset', in_=openapi.IN_FORM, type=openapi.TYPE_INTEGER, required=True),
+            openapi.Parameter('chunk', in_=openapi.IN_FORM, type=openapi.TYPE_FILE, required=True),
+        ],
+        responses={status.HTTP_200_OK: FileUploadSerializer}
+    )
+    def put(self, request, pk):
+        serializer = FileUploadChunkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            upload = get_object_or_404(FileUpload.objects.select_for_update(), pk=pk)
+            if upload.file_id is not None:
+                raise APIValidation(detail=_('Файл уже загружен'), status_code=status.HTTP_400_BAD_REQUEST)
+            upload = write_chunk(upload, **serializer.validated_data)
+        return Response(FileUploadSerializer(upload).data)
+
+
+class MediaAPIView(APIView):
+    """
+    Files under MEDIA_ROOT for the owners and operators, or for anyone with a signed url (img and video tags
+    can't send the Authorization header). The proxy or sendfile sends the bytes, see MEDIA_SERVING
+    """
+    permission_classes = [AllowAny, ]
+    swagger_schema = None
+
+    def get(self, request, name):
+        name = clean_name(name)
+        if not (valid_signature(name, request.GET.get('expires'), request.GET.get('signature'))
+                or can_view(request.user, name)):
+            raise APIValidation(detail=_('Нет доступа к файлу'), status_code=status.HTTP_403_FORBIDDEN)
+        return media_response(request, name)
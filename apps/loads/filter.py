@@ -3,7 +3,8 @@ from django_filters import FilterSet, DateFilter
 from rest_framework.filters import BaseFilterBackend, SearchFilter
 
 from apps.loads.models import Product, Load
-from apps.tools.utils.helpers import split_code
+from apps.tools.utils.helpers import day_filter
+from apps.tools.utils.search import exact_customer_ids, customer_ids, user_ids, numeric_q
 
 
 class AdminProductFilter(FilterSet):
@@ -11,7 +12,7 @@ class AdminProductFilter(FilterSet):
 
     @staticmethod
     def filter_date(queryset, name, value):
-        return queryset.filter(updated_at__date=value)
+        return queryset.filter(**day_filter('updated_at', value, value))
 
     class Meta:
         model = Product
@@ -24,7 +25,7 @@ class AdminLoadFilter(FilterSet):
 
     @staticmethod
     def filter_date(queryset, name, value):
-        return queryset.filter(updated_at__date=value)
+        return queryset.filter(**day_filter('updated_at', value, value))
 
     class Meta:
         model = Load
@@ -34,31 +35,28 @@ class AdminLoadFilter(FilterSet):
 
 class ProductSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_param = request.query_params.get('search', '')
+        search_param = request.query_params.get('search', '').strip()
         if search_param:
-            prefix, code = split_code(search_param)
+            exact = exact_customer_ids(search_param)
+            if exact:
+                return queryset.filter(customer_id__in=exact)
             queryset = queryset.filter(
                 Q(barcode__icontains=search_param) |
-                Q(accepted_by_china__full_name__icontains=search_param) |
-                Q(
-                    Q(customer__prefix__icontains=prefix) &
-                    Q(customer__code__icontains=code)
-                )
+                Q(accepted_by_china_id__in=user_ids(search_param)) |
+                Q(customer_id__in=customer_ids(search_param))
             )
         return queryset
 
 
 class LoadSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_param = request.query_params.get('search', '')
+        search_param = request.query_params.get('search', '').strip()
         if search_param:
-            prefix, code = split_code(search_param)
+            exact = exact_customer_ids(search_param)
+            if exact:
+                return queryset.filter(customer_id__in=exact)
             queryset = queryset.filter(
-                Q(weight__icontains=search_param) |
-                Q(cost__icontains=search_param) |
-                Q(
-                    Q(customer__prefix__icontains=prefix) &
-                    Q(customer__code__icontains=code)
-                )
+                numeric_q(search_param, 'weight', 'cost') |
+                Q(customer_id__in=customer_ids(search_param))
             )
         return queryset
@@ -0,0 +1,49 @@
+import csv
+import os
+import resource
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.loads.models import ManifestImport
+from apps.loads.utils.manifest import run_manifest_import, customer_code_map, MANIFEST_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Import a generated CSV manifest and report rows/s and peak memory, rolled back unless --keep'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000)
+        parser.add_argument('--batch-size', type=int, default=MANIFEST_BATCH_SIZE)
+        parser.add_argument('--keep', action='store_true', help='Commit the generated products')
+
+    def handle(self, *args, **options):
+        codes = list(customer_code_map().keys())[:1000] or ['0']
+        run_id = uuid.uuid4().hex[:8]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as file:
+            writer = csv.writer(file)
+            writer.writerow(['barcode', 'customer_id'])
+            for i in range(options['rows']):
+                writer.writerow([f'BENCH{run_id}{i:08d}', codes[i % len(codes)]])
+
+        try:
+            started = time.monotonic()
+            with transaction.atomic():
+                manifest = ManifestImport.objects.create()
+                manifest = run_manifest_import(manifest, path=file.name, batch_size=options['batch_size'])
+                if not options['keep']:
+                    transaction.set_rollback(True)
+            seconds = time.monotonic() - started
+        finally:
+            os.remove(file.name)
+
+        # ru_maxrss is in kilobytes on linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(self.style.SUCCESS(
+            f'{manifest.processed_rows} rows in {seconds:.1f}s ({manifest.processed_rows / seconds:.0f} rows/s), '
+            f'created {manifest.created_count}, duplicates {manifest.duplicate_count}, '
+            f'errors {manifest.error_count}, peak memory {peak_mb:.0f} MB'
+        ))
@@ -1,7 +1,10 @@
 from django.db import models
+from django.db.models import Q
 
+from apps.files.models import File
 from apps.user.models import Customer, Operator, User
-from config.core.choices import PRODUCT_STATUS_CHOICE, PRODUCT_ON_WAY, LOAD_STATUS_CHOICE, LOAD_NOT_PAID
+from config.core.choices import PRODUCT_STATUS_CHOICE, PRODUCT_ON_WAY, LOAD_STATUS_CHOICE, LOAD_NOT_PAID, \
+    MANIFEST_STATUS_CHOICE, MANIFEST_PENDING, MANIFEST_DONE
 from config.models import BaseModel
 
 
@@ -21,6 +24,15 @@ class Product(BaseModel):
     # photos file
     class Meta:
         db_table = 'Product'
+        indexes = [
+            # the trigram index on barcode is PostgreSQL only, apps.tools.utils.search.TRIGRAM_INDEXES
+            models.Index(fields=['customer', 'status'], name='product_customer_status'),
+            models.Index(fields=['status', 'created_at'], name='product_status_created'),
+            models.Index(fields=['updated_at'], name='product_updated'),
+            # operators' "accepted today" counters
+            models.Index(fields=['accepted_by_china', 'accepted_time_china'], name='product_china_accepted'),
+            models.Index(fields=['accepted_by_tashkent', 'accepted_time_tashkent'], name='product_tashkent_accepted'),
+        ]
 
 
 class Load(BaseModel):
@@ -38,6 +50,12 @@ class Load(BaseModel):
 
     class Meta:
         db_table = "Load"
+        indexes = [
+            models.Index(fields=['weight'], name='load_weight'),
+            models.Index(fields=['cost'], name='load_cost'),
+            models.Index(fields=['customer'], condition=Q(is_active=True), name='load_active_customer'),
+            models.Index(fields=['updated_at'], name='load_updated'),
+        ]
 
 
 class LoadAccepted(models.Model):
@@ -48,3 +66,33 @@ class LoadAccepted(models.Model):
 
     class Meta:
         db_table = 'LoadAccepted'
+        indexes = [
+            models.Index(fields=['accepted_by', 'accepted_time'], name='load_accepted_by_time'),
+        ]
+
+
+class ManifestImport(BaseModel):
+    file = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='manifest_imports')
+    status = models.CharField(choices=MANIFEST_STATUS_CHOICE, default=MANIFEST_PENDING, max_length=10)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='manifest_imports',
+                                   null=True, blank=True)
+
+    total_rows = models.IntegerField(null=True, blank=True)
+    processed_rows = models.IntegerField(default=0)
+    created_count = models.IntegerField(default=0)
+    duplicate_count = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    report = models.JSONField(default=dict, blank=True)  # rejected rows, see apps.loads.utils.manifest
+    error = models.TextField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ManifestImport'
+
+    @property
+    def progress(self):
+        if self.status == MANIFEST_DONE:
+            return 100
+        if not self.total_rows:
+            return 0
+        # total_rows is counted up front and includes blank lines, so it is an estimate
+        return min(100, round(self.processed_rows * 100 / self.total_rows))
@@ -1,6 +1,9 @@
+import json
 from datetime import datetime
 
+from django.db import transaction
 from django.db.models import Q
+from django.http import StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -13,8 +16,11 @@ from apps.loads.serializers.telegram import BarcodeConnectionSerializer, LoadInf
     ModerationNotProcessedLoadSerializer, CustomerCurrentLoadSerializer, CustomerOwnLoadsSerializer, \
     ModerationProcessedLoadSerializer, ModerationLoadPaymentSerializer, ModerationLoadApplySerializer, \
     ModerationLoadDeclineSerializer, ReleaseLoadInfoSerializer, ReleasePaymentLoadSerializer, \
-    CustomerTrackProductSerializer, ProductSerializer
-from apps.loads.utils.services import process_payment
+    CustomerTrackProductSerializer, ProductSerializer, BarcodeBatchConnectionSerializer, \
+    BarcodeBatchResponseSerializer, BarcodeBatchAcceptSerializer, BarcodeBatchAcceptResponseSerializer
+from apps.loads.utils.services import process_payment, release_load_products, connect_barcodes, BARCODE_CREATED, \
+    BARCODE_DUPLICATE, BARCODE_UNKNOWN_CUSTOMER, accept_barcodes_chunked, accept_barcodes_progress, \
+    pending_application, release_load_queryset
 from apps.payment.models import Payment
 from apps.tools.utils.helpers import products_accepted_today, get_price, loads_accepted_today, split_code
 from apps.user.models import User, Customer
@@ -45,6 +51,23 @@ class BarcodeConnectionAPIView(CreateAPIView):
     permission_classes = [IsChinaTGOperator, ]
 
 
+class BarcodeBatchConnectionAPIView(APIView):
+    serializer_class = BarcodeBatchConnectionSerializer
+    permission_classes = [IsChinaTGOperator, ]
+
+    @swagger_auto_schema(request_body=BarcodeBatchConnectionSerializer,
+                         responses={status.HTTP_200_OK: BarcodeBatchResponseSerializer})
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = connect_barcodes(serializer.validated_data['products'], request.user)
+        return Response({
+            'results': results,
+            **{result_status: sum(1 for result in results if result['status'] == result_status)
+               for result_status in [BARCODE_CREATED, BARCODE_DUPLICATE, BARCODE_UNKNOWN_CUSTOMER]}
+        })
+
+
 class AcceptProductAPIView(APIView):
     queryset = Product.objects.all()
     permission_classes = [IsTashkentTGOperator, ]
@@ -67,6 +90,28 @@ class AcceptProductAPIView(APIView):
         return Response({'detail': 'Product accepted'})
 
 
+class BatchAcceptProductAPIView(APIView):
+    serializer_class = BarcodeBatchAcceptSerializer
+    permission_classes = [IsTashkentTGOperator, ]
+
+    @swagger_auto_schema(request_body=BarcodeBatchAcceptSerializer,
+                         responses={status.HTTP_200_OK: BarcodeBatchAcceptResponseSerializer})
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        barcodes = serializer.validated_data['barcodes']
+        if serializer.validated_data['stream']:
+            progress = (json.dumps(chunk, ensure_ascii=False) + '\n'
+                        for chunk in accept_barcodes_progress(barcodes, request.user))
+            return StreamingHttpResponse(progress, content_type='application/x-ndjson')
+
+        response = {'accepted': [], 'already_accepted': [], 'unknown': []}
+        for chunk in accept_barcodes_chunked(barcodes, request.user):
+            for key in response.keys():
+                response[key] += chunk[key]
+        return Response(response)
+
+
 class LoadInfoAPIView(APIView):
     queryset = Product.objects.all()
     serializer_class = LoadInfoSerializer
@@ -102,9 +147,8 @@ class ReleaseLoadInfoAPIView(APIView):
     def get(self, request, customer_id, *args, **kwargs):
         prefix, code = split_code(customer_id)
         customer = get_object_or_404(Customer, prefix=prefix, code=code)
-        load_instance = customer.loads.filter(is_active=True)
-        if load_instance.exists():
-            load_instance = load_instance.first()
+        load_instance = release_load_queryset().filter(customer_id=customer.id, is_active=True).first()
+        if load_instance:
             serializer = self.serializer_class(load_instance)
             return Response(serializer.data)
         raise APIValidation('Load not found', status_code=status.HTTP_404_NOT_FOUND)
@@ -129,7 +173,7 @@ class ReleasePaymentLoadAPIView(APIView):
                                                                            'request': request})
             serializer.is_valid(raise_exception=True)
             payment_instance = serializer.save()
-            response_serializer = ReleaseLoadInfoSerializer(payment_instance.load)
+            response_serializer = ReleaseLoadInfoSerializer(release_load_queryset().get(pk=payment_instance.load_id))
             return Response(response_serializer.data)
         raise APIValidation('Load not found', status_code=status.HTTP_404_NOT_FOUND)
 
@@ -146,25 +190,23 @@ class ReleaseLoadAPIView(APIView):
                                     status_code=status.HTTP_400_BAD_REQUEST)
             if customer.debt != 0:
                 raise APIValidation('The customer has a debt', status_code=status.HTTP_400_BAD_REQUEST)
-            load_instance.is_active = False
-            load_instance.status = 'DONE'
-            load_products = load_instance.products.all()
-            for product in load_products:
-                product.status = 'DONE'
-                product.save()
-            load_instance.save()
+            with transaction.atomic():
+                load_instance.is_active = False
+                load_instance.status = 'DONE'
+                load_instance.save()
+                release_load_products(load_instance)
             return Response({'message': 'Load successfully released'})
         raise APIValidation('Load not found', status_code=status.HTTP_404_NOT_FOUND)
 
 
 class ModerationNotProcessedLoadAPIView(ListAPIView):
-    queryset = Payment.objects.select_related('customer', 'load').filter(status__isnull=True)
+    queryset = Payment.objects.select_related('customer').filter(status__isnull=True)
     serializer_class = ModerationNotProcessedLoadSerializer
     permission_classes = [IsTashkentTGOperator, ]
 
 
 class ModerationProcessedLoadAPIView(ListAPIView):
-    queryset = Payment.objects.select_related('customer', 'load').filter(status__isnull=False)
+    queryset = Payment.objects.select_related('customer').filter(status__isnull=False)
     serializer_class = ModerationProcessedLoadSerializer
     permission_classes = [IsTashkentTGOperator, ]
 
@@ -198,8 +240,9 @@ class ModerationLoadDeclineAPIView(APIView):
 # CUSTOMER
 class CustomerCurrentLoadAPIView(APIView):
     queryset = (Load.objects
-                .select_related('customer', 'accepted_by')
-                .prefetch_related('products')
+                .select_related('customer')
+                .prefetch_related('products__china_files')
+                .annotate(on_moderation=pending_application())
                 .filter(is_active=True))
     serializer_class = CustomerCurrentLoadSerializer
     permission_classes = [IsCustomer, ]
@@ -214,7 +257,7 @@ class CustomerCurrentLoadAPIView(APIView):
 
 
 class CustomerOwnLoadsHistoryAPIView(ListAPIView):
-    queryset = Load.objects.select_related('customer', 'accepted_by').prefetch_related('products')
+    queryset = Load.objects.all()
     serializer_class = CustomerOwnLoadsSerializer
     permission_classes = [IsCustomer, ]
 
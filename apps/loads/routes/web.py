@@ -1,22 +1,35 @@
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Q, Prefetch
+from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
 
 from rest_framework.filters import SearchFilter
 from rest_framework.generics import CreateAPIView, ListAPIView, UpdateAPIView, DestroyAPIView, RetrieveAPIView
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.files.utils import upload_file
 from apps.loads.filter import AdminProductFilter, AdminLoadFilter, ProductSearchFilter, LoadSearchFilter
-from apps.loads.models import Product, Load
+from apps.loads.models import Product, Load, ManifestImport
 from apps.loads.serializers.web import AdminProductListSerializer, AdminAddProductSerializer, AdminLoadListSerializer, \
-    AdminLoadRetrieveSerializer, AdminLoadUpdateSerializer
+    AdminLoadRetrieveSerializer, AdminLoadUpdateSerializer, ManifestImportSerializer
+from apps.loads.tasks import import_manifest
+from apps.loads.utils.manifest import manifest_extension
+from apps.tools.models import Delivery
+from config.core.api_exceptions import APIValidation
 from config.core.choices import PRODUCT_STATUS_CHOICE
 from config.core.pagination import APIPagination
 from config.core.permissions.web import IsWebOperator
 
 
 class AdminProductListAPIView(ListAPIView):
-    queryset = Product.objects.all()
+    queryset = (Product.objects
+                .select_related('customer', 'accepted_by_china', 'accepted_by_tashkent')
+                .prefetch_related('china_files'))
     serializer_class = AdminProductListSerializer
     permission_classes = [IsWebOperator, ]
     pagination_class = APIPagination
@@ -59,8 +72,44 @@ class AdminDeleteProduct(DestroyAPIView):
     permission_classes = [IsWebOperator, ]
 
 
+class AdminManifestImportAPIView(APIView):
+    parser_classes = [MultiPartParser, ]
+    permission_classes = [IsWebOperator, ]
+
+    @swagger_auto_schema(
+        operation_description="Import products from a CSV/XLSX manifest with barcode and customer_id columns",
+        manual_parameters=[
+            openapi.Parameter(
+                'file', in_=openapi.IN_FORM,
+                type=openapi.TYPE_FILE,
+                required=True,
+                description=_('Manifest file (max size 50 MB)')
+            ),
+        ],
+        responses={status.HTTP_201_CREATED: ManifestImportSerializer}
+    )
+    def post(self, request, *args, **kwargs):
+        file = request.data.get('file')
+        if not file:
+            raise APIValidation(_('Файл не был отправлен'), status_code=status.HTTP_400_BAD_REQUEST)
+        if file.size > 52_428_800:
+            raise APIValidation(_('Размер файла превысил 50 МБ!'), status_code=status.HTTP_400_BAD_REQUEST)
+        manifest_extension(file.name)
+
+        with transaction.atomic():
+            manifest = ManifestImport.objects.create(file=upload_file(file=file), created_by=request.user)
+            transaction.on_commit(lambda: import_manifest.delay(manifest.id))
+        return Response(ManifestImportSerializer(manifest).data, status=status.HTTP_201_CREATED)
+
+
+class AdminManifestImportRetrieveAPIView(RetrieveAPIView):
+    queryset = ManifestImport.objects.select_related('file')
+    serializer_class = ManifestImportSerializer
+    permission_classes = [IsWebOperator, ]
+
+
 class AdminLoadListAPIView(ListAPIView):
-    queryset = Load.objects.select_related('customer', 'accepted_by').prefetch_related('products')
+    queryset = Load.objects.select_related('customer').prefetch_related('files')
     serializer_class = AdminLoadListSerializer
     permission_classes = [IsWebOperator, ]
     filterset_class = AdminLoadFilter
@@ -70,7 +119,10 @@ class AdminLoadListAPIView(ListAPIView):
 
 
 class AdminLoadRetrieveAPIView(RetrieveAPIView):
-    queryset = Load.objects.select_related('customer', 'accepted_by').prefetch_related('products')
+    queryset = Load.objects.select_related('customer').prefetch_related(
+        'products', 'files',
+        Prefetch('deliveries', queryset=Delivery.objects.filter(message_sent=True), to_attr='sent_deliveries')
+    )
     serializer_class = AdminLoadRetrieveSerializer
     permission_classes = [IsWebOperator, ]
 
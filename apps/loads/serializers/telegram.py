@@ -1,5 +1,6 @@
 import logging
 
+from django.db import transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.utils.timezone import localdate, localtime
@@ -10,7 +11,9 @@ from rest_framework.generics import get_object_or_404
 from apps.files.models import File
 from apps.files.serializer import FileDataSerializer
 from apps.loads.models import Product, Load, LoadAccepted
+from apps.loads.utils.services import transition_products, RELEASE_EXCLUDED_STATUSES
 from apps.payment.models import Payment
+from apps.payment.utils.ledger import charge, settle, load_payment_status
 from apps.tools.utils.helpers import split_code, get_price
 from apps.user.models import Customer
 from config.core.api_exceptions import APIValidation
@@ -21,14 +24,17 @@ from config.core.choices import (PRODUCT_NOT_LOADED, PRODUCT_NOT_LOADED_DISPLAY,
 
 logger = logging.getLogger()
 
+BARCODE_BATCH_LIMIT = 2000
+BARCODE_ACCEPT_LIMIT = 20000
+
 
 class BarcodeConnectionSerializer(serializers.ModelSerializer):
     customer_id = serializers.CharField(source='customer.code', allow_null=True)
     china_files = serializers.SlugRelatedField(slug_field='id', many=True, queryset=File.objects.all(), required=False)
 
     def create(self, validated_data):
-        logger.debug(f'china barcode, request_data: {self.context.get("request").data}')
         request = self.context.get('request')
+        logger.debug('china barcode, request_data: %s', request.data)
 
         code = validated_data.pop('customer', '')
         prefix, code = split_code(code.get('code'))
@@ -52,6 +58,43 @@ class BarcodeConnectionSerializer(serializers.ModelSerializer):
                   'china_files', ]
 
 
+class BarcodeBatchItemSerializer(serializers.Serializer):
+    barcode = serializers.CharField(max_length=155)
+    customer_id = serializers.CharField()
+    china_files = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+
+class BarcodeBatchConnectionSerializer(serializers.Serializer):
+    products = BarcodeBatchItemSerializer(many=True, allow_empty=False, max_length=BARCODE_BATCH_LIMIT)
+
+
+class BarcodeBatchResultSerializer(serializers.Serializer):
+    barcode = serializers.CharField()
+    status = serializers.CharField()
+    product_id = serializers.IntegerField(allow_null=True)
+
+
+class BarcodeBatchResponseSerializer(serializers.Serializer):
+    results = BarcodeBatchResultSerializer(many=True)
+    created = serializers.IntegerField()
+    duplicate = serializers.IntegerField()
+    unknown_customer = serializers.IntegerField()
+
+
+class BarcodeBatchAcceptSerializer(serializers.Serializer):
+    barcodes = serializers.ListField(child=serializers.CharField(max_length=155), allow_empty=False,
+                                     max_length=BARCODE_ACCEPT_LIMIT)
+    # ndjson progress after every committed chunk; a last line with "error" means only the processed part was
+    # accepted
+    stream = serializers.BooleanField(required=False, default=False)
+
+
+class BarcodeBatchAcceptResponseSerializer(serializers.Serializer):
+    accepted = serializers.ListField(child=serializers.CharField())
+    already_accepted = serializers.ListField(child=serializers.CharField())
+    unknown = serializers.ListField(child=serializers.CharField())
+
+
 class ProductSerializer(serializers.ModelSerializer):
     status = serializers.SerializerMethodField(read_only=True, allow_null=True)
     status_display = serializers.SerializerMethodField(read_only=True, allow_null=True)
@@ -144,11 +187,19 @@ class AddLoadSerializer(serializers.ModelSerializer):
     def load_cost(self, customer):
         weight = self.validated_data.get('weight')
 
-        price = get_price().get('auto') if customer.user_type == 'AUTO' else get_price().get('avia')
+        price = get_price()
+        price = price.get('auto') if customer.user_type == 'AUTO' else price.get('avia')
         if price:
             return float(price) * weight
         raise APIValidation('Configure price in settings', status_code=status.HTTP_400_BAD_REQUEST)
 
+    @staticmethod
+    def load_products(products):
+        changed = transition_products([product.id for product in products], PRODUCT_DELIVERED, PRODUCT_LOADED)
+        if changed != len(products):
+            raise APIValidation(_('Некоторые товары уже загружены'), status_code=status.HTTP_400_BAD_REQUEST)
+
+    @transaction.atomic
     def create(self, validated_data):
         try:
             customer_id = validated_data.pop('customer_id')
@@ -162,8 +213,7 @@ class AddLoadSerializer(serializers.ModelSerializer):
                 existing_load = existing_load.first()
                 image.loads_id = existing_load.id
                 image.save()
-                customer.debt += l_cost
-                customer.save()
+                charge(customer, l_cost, load=existing_load, operator=self.context.get('request').user)
                 existing_load.loads_count += 1
                 existing_load.cost += l_cost
                 existing_load.weight += validated_data.get('weight')
@@ -177,9 +227,7 @@ class AddLoadSerializer(serializers.ModelSerializer):
                 existing_load.save()
                 LoadAccepted.objects.create(load_id=existing_load.id, accepted_time=timezone.now(),
                                             accepted_by=self.context.get('request').user)
-                for product in products:
-                    product.status = 'LOADED'
-                    product.save()
+                self.load_products(products)
                 return existing_load
             instance = super().create(validated_data)
             instance.cost = l_cost
@@ -191,11 +239,8 @@ class AddLoadSerializer(serializers.ModelSerializer):
             image.save()
             LoadAccepted.objects.create(load_id=instance.id, accepted_time=timezone.now(),
                                         accepted_by=self.context.get('request').user)
-            customer.debt += l_cost
-            customer.save()
-            for product in products:
-                product.status = 'LOADED'
-                product.save()
+            charge(customer, l_cost, load=instance, operator=self.context.get('request').user)
+            self.load_products(products)
             return instance
         except Exception as exc:
             raise APIValidation(f'Error occurred {exc.args}', status_code=status.HTTP_400_BAD_REQUEST)
@@ -217,8 +262,11 @@ class ReleaseLoadInfoSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_products(instance):
-        products_serializer = ProductSerializer(instance.customer.products.exclude(status__in=['ON_WAY', 'DONE']),
-                                                many=True)
+        # prefetched by ReleaseLoadInfoAPIView, see release_load_queryset()
+        products = getattr(instance.customer, 'release_products', None)
+        if products is None:
+            products = instance.customer.products.exclude(status__in=RELEASE_EXCLUDED_STATUSES)
+        products_serializer = ProductSerializer(products, many=True)
         return products_serializer.data
 
     @staticmethod
@@ -245,24 +293,18 @@ class ReleaseLoadInfoSerializer(serializers.ModelSerializer):
 
 class ReleasePaymentLoadSerializer(serializers.ModelSerializer):
 
+    @transaction.atomic
     def create(self, validated_data):
         load = self.context.get('load_instance')
         request = self.context.get('request')
         instance = Payment.objects.create(load_id=load.id, customer_id=load.customer.id, is_operator=True,
-                                          operator_id=request.user.id, status='SUCCESSFUL',
-                                          paid_amount=load.customer.debt, **validated_data)
-        # instance.customer.debt = min(instance.customer.debt - instance.customer.debt, 0)
-        instance.customer.debt = 0
-        instance.customer.save()
-        if instance.customer.debt == 0:
-            load.status = 'PAID'
-            load.save()
-        elif instance.customer.debt == load.cost:
-            load.status = 'NOT_PAID'
-            load.save()
-        elif instance.customer.debt != load.customer:
-            load.status = 'PARTIALLY_PAID'
-            load.save()
+                                          operator_id=request.user.id, status='SUCCESSFUL', **validated_data)
+        entry = settle(instance.customer, payment=instance, load=load, operator=request.user)
+        # without a debt nothing is paid, the load is released as PAID
+        instance.paid_amount = entry.balance_before if entry else 0
+        instance.save()
+        load.status = load_payment_status(instance.customer.debt, load.cost)
+        load.save()
         return instance
 
     class Meta:
@@ -424,14 +466,19 @@ class CustomerCurrentLoadSerializer(serializers.ModelSerializer):
     status_display = serializers.SerializerMethodField(allow_null=True)
 
     @staticmethod
-    def get_status(obj):
-        if obj.payments.filter(status__isnull=True, is_operator=False):
+    def on_moderation(obj):
+        # annotated by CustomerCurrentLoadAPIView, a query per call otherwise
+        if hasattr(obj, 'on_moderation'):
+            return obj.on_moderation
+        return obj.payments.filter(status__isnull=True, is_operator=False).exists()
+
+    def get_status(self, obj):
+        if self.on_moderation(obj):
             return 'ON_MODERATION'
         return obj.status
 
-    @staticmethod
-    def get_status_display(obj):
-        if obj.payments.filter(status__isnull=True, is_operator=False):
+    def get_status_display(self, obj):
+        if self.on_moderation(obj):
             return _('В модерации')
         return obj.get_status_display()
 
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from django.db import transaction
 from django.utils.timezone import localdate, localtime
 from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers, status
@@ -7,7 +8,8 @@ from rest_framework.generics import get_object_or_404
 
 from apps.files.models import File
 from apps.files.serializer import FileDataSerializer
-from apps.loads.models import Product, Load
+from apps.loads.models import Product, Load, ManifestImport
+from apps.payment.utils.ledger import adjust
 from apps.tools.utils.helpers import split_code, get_price
 from apps.user.models import Customer
 from config.core.api_exceptions import APIValidation
@@ -170,9 +172,12 @@ class AdminLoadRetrieveSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_address(obj):
-        delivery = obj.deliveries.filter(message_sent=True)
-        if delivery.exists():
-            delivery = delivery.first()
+        # prefetched by AdminLoadRetrieveAPIView
+        if hasattr(obj, 'sent_deliveries'):
+            delivery = obj.sent_deliveries[0] if obj.sent_deliveries else None
+        else:
+            delivery = obj.deliveries.filter(message_sent=True).first()
+        if delivery:
             if delivery.delivery_type == TAKE_AWAY:
                 return TAKE_AWAY_DISPLAY
             elif delivery.delivery_type == YANDEX:
@@ -207,11 +212,13 @@ class AdminLoadUpdateSerializer(serializers.ModelSerializer):
 
     def load_cost(self, customer):
         weight = self.validated_data.get('weight')
-        price = get_price().get('auto') if customer.user_type == 'AUTO' else get_price().get('avia')
+        price = get_price()
+        price = price.get('auto') if customer.user_type == 'AUTO' else price.get('avia')
         if price:
             return float(price) * weight
         raise APIValidation('Configure price in settings', status_code=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         customer_id = validated_data.pop('customer_id', '')
         if not customer_id:
@@ -221,12 +228,9 @@ class AdminLoadUpdateSerializer(serializers.ModelSerializer):
         customer = get_object_or_404(Customer, prefix=prefix, code=code)
         if validated_data.get('weight'):
             new_cost = self.load_cost(customer)
-            old_cost = instance.cost
-            debt = customer.debt
-            cost_diff = old_cost - new_cost
-            debt += cost_diff
-            customer.debt = debt
-            customer.save()
+            old_cost = instance.cost or 0
+            adjust(customer, new_cost - old_cost, load=instance, operator=self.context.get('request').user,
+                   comment=f'Load #{instance.id} weight changed: {instance.weight} -> {validated_data.get("weight")}')
             instance.cost = new_cost
         if customer_id:
             instance.customer = customer
@@ -249,3 +253,26 @@ class AdminLoadUpdateSerializer(serializers.ModelSerializer):
                   'customer_id',
                   'status',
                   'weight', ]
+
+
+class ManifestImportSerializer(serializers.ModelSerializer):
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    file = FileDataSerializer(read_only=True)
+    progress = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ManifestImport
+        fields = ['id',
+                  'status',
+                  'status_display',
+                  'file',
+                  'progress',
+                  'total_rows',
+                  'processed_rows',
+                  'created_count',
+                  'duplicate_count',
+                  'error_count',
+                  'report',
+                  'error',
+                  'created_at',
+                  'updated_at', ]
@@ -0,0 +1,35 @@
+import logging
+
+from celery import shared_task
+
+logger = logging.getLogger()
+
+
+@shared_task(name='import_manifest', acks_late=True)
+def import_manifest(manifest_id):
+    """
+    Import an uploaded CSV/XLSX manifest, a redelivered task continues after the last stored batch
+    """
+    from apps.loads.models import ManifestImport
+    from apps.loads.utils.manifest import run_manifest_import
+
+    manifest = ManifestImport.objects.filter(pk=manifest_id).select_related('file', 'created_by').first()
+    if not manifest:
+        return {'detail': f'Manifest import #{manifest_id} not found', 'status': 404}
+    if manifest.status in ('DONE', 'FAILED'):
+        return {'detail': f'Manifest import #{manifest_id} was finished already', 'status': 400}
+
+    manifest.status = 'PROCESSING'
+    manifest.save(update_fields=['status', 'updated_at'])
+    try:
+        manifest = run_manifest_import(manifest)
+    except Exception as exc:
+        logger.exception(f'manifest import #{manifest_id} failed')
+        manifest.status = 'FAILED'
+        manifest.error = str(getattr(exc, 'detail', exc))
+        manifest.save(update_fields=['status', 'error', 'updated_at'])
+        return {'detail': f'Manifest import #{manifest_id} failed: {manifest.error}', 'status': 400}
+
+    manifest.status = 'DONE'
+    manifest.save(update_fields=['status', 'updated_at'])
+    return {'detail': f'Manifest import #{manifest_id} done, rows: {manifest.processed_rows}', 'status': 200}
@@ -1,3 +1,65 @@
+from unittest import mock
+
+from django.db import DatabaseError
 from django.test import TestCase
 
-# Create your tests here.
+from apps.loads.models import Product
+from apps.loads.utils import services
+from apps.loads.utils.services import release_load_products, accept_barcodes_progress
+from apps.tools.utils.seed import seed_operator, seed_customer, seed_customer_rows
+from config.core.choices import PRODUCT_ON_WAY, PRODUCT_DELIVERED, PRODUCT_LOADED, PRODUCT_DONE
+
+
+# the rollups refresh after saves goes to redis and celery, which the test doesn't run
+@mock.patch('apps.tools.signals.queue_refresh')
+class ReleaseLoadProductsTest(TestCase):
+    def setUp(self):
+        operator = seed_operator()
+        self.rows = seed_customer_rows(seed_customer(operator=operator), operator)
+        self.load = self.rows['load']
+
+    def test_loaded_products_are_done(self, queue_refresh):
+        self.assertEqual(release_load_products(self.load), 1)
+        self.assertEqual(set(self.load.products.values_list('status', flat=True)), {PRODUCT_DONE})
+
+    def test_products_which_were_not_loaded_are_released_and_logged(self, queue_refresh):
+        delivered = self.rows['products'][PRODUCT_DELIVERED]
+        self.load.products.add(delivered, self.rows['products'][PRODUCT_DONE])
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertEqual(release_load_products(self.load), 2)
+
+        self.assertEqual(set(self.load.products.values_list('status', flat=True)), {PRODUCT_DONE})
+        self.assertIn(f'{delivered.id}: {PRODUCT_DELIVERED!r}', logs.output[0])
+        self.assertNotIn(PRODUCT_LOADED, logs.output[0])
+
+    def test_other_products_of_the_customer_are_kept(self, queue_refresh):
+        release_load_products(self.load)
+
+        self.assertEqual(Product.objects.get(pk=self.rows['products'][PRODUCT_DELIVERED].pk).status,
+                         PRODUCT_DELIVERED)
+
+
+@mock.patch('apps.tools.signals.queue_refresh')
+class AcceptBarcodesProgressTest(TestCase):
+    def test_failed_chunk_ends_the_progress_with_an_error(self, queue_refresh):
+        operator = seed_operator()
+        first, second = [Product.objects.create(barcode=barcode, status=PRODUCT_ON_WAY) for barcode in ['A1', 'A2']]
+        accept_barcodes, chunks = services.accept_barcodes, []
+
+        def second_chunk_fails(barcodes, user):
+            chunks.append(barcodes)
+            if len(chunks) > 1:
+                raise DatabaseError('broken')
+            return accept_barcodes(barcodes, user)
+
+        with mock.patch.object(services, 'accept_barcodes', second_chunk_fails):
+            with self.assertLogs(level='ERROR'):
+                progress = list(accept_barcodes_progress(['A1', 'A2'], operator, chunk_size=1))
+
+        self.assertEqual([item['processed'] for item in progress], [1, 1])
+        self.assertEqual(progress[0]['accepted'], ['A1'])
+        self.assertIn('error', progress[-1])
+        # the chunk before the failure stays accepted
+        self.assertEqual(Product.objects.get(pk=first.pk).status, PRODUCT_DELIVERED)
+        self.assertEqual(Product.objects.get(pk=second.pk).status, PRODUCT_ON_WAY)
@@ -1,12 +1,14 @@
 from django.urls import path
 
 from apps.loads.routes.telegram import BarcodeConnectionAPIView, AcceptProductAPIView, OperatorStatisticsAPIView, \
-    LoadInfoAPIView, AddLoadAPIView, ModerationNotProcessedLoadAPIView, ModerationProcessedLoadAPIView, \
-    CustomerOwnLoadsHistoryAPIView, CustomerCurrentLoadAPIView, ModerationLoadPaymentAPIView, \
-    ModerationLoadApplyAPIView, ModerationLoadDeclineAPIView, ReleaseLoadInfoAPIView, ReleasePaymentLoadAPIView, \
-    ReleaseLoadAPIView, CustomerTrackProductAPIView, CustomerProductsListAPIView
+    BarcodeBatchConnectionAPIView, BatchAcceptProductAPIView, LoadInfoAPIView, AddLoadAPIView, \
+    ModerationNotProcessedLoadAPIView, \
+    ModerationProcessedLoadAPIView, CustomerOwnLoadsHistoryAPIView, CustomerCurrentLoadAPIView, \
+    ModerationLoadPaymentAPIView, ModerationLoadApplyAPIView, ModerationLoadDeclineAPIView, ReleaseLoadInfoAPIView, \
+    ReleasePaymentLoadAPIView, ReleaseLoadAPIView, CustomerTrackProductAPIView, CustomerProductsListAPIView
 from apps.loads.routes.web import AdminProductListAPIView, AdminSelectProductStatus, AdminAddProduct, \
-    AdminUpdateProduct, AdminDeleteProduct, AdminLoadListAPIView, AdminLoadRetrieveAPIView, AdminLoadUpdateAPIView
+    AdminUpdateProduct, AdminDeleteProduct, AdminLoadListAPIView, AdminLoadRetrieveAPIView, AdminLoadUpdateAPIView, \
+    AdminManifestImportAPIView, AdminManifestImportRetrieveAPIView
 from apps.loads.views import OpenProductBarcodeAPIView
 
 app_name = 'api'
@@ -19,13 +21,19 @@ urlpatterns = [
     path('admin/delivery/product-add/', AdminAddProduct.as_view(), name='admin_add_product'),
     path('admin/delivery/product-update/<int:pk>/', AdminUpdateProduct.as_view(), name='admin_update_product'),
     path('admin/delivery/product-delete/<int:pk>/', AdminDeleteProduct.as_view(), name='admin_delete_product'),
+    path('admin/delivery/manifest-import/', AdminManifestImportAPIView.as_view(), name='admin_manifest_import'),
+    path('admin/delivery/manifest-import/<int:pk>/', AdminManifestImportRetrieveAPIView.as_view(),
+         name='admin_manifest_import_retrieve'),
     path('admin/loads/list/', AdminLoadListAPIView.as_view(), name='admin_loads_list'),
     path('admin/loads/retrieve/<int:pk>/', AdminLoadRetrieveAPIView.as_view(), name='admin_loads_retrieve'),
     path('admin/loads/update/<int:pk>/', AdminLoadUpdateAPIView.as_view(), name='admin_loads_update'),
 
     # bot-operator
     path('operator/china/barcode-connection/', BarcodeConnectionAPIView.as_view(), name='china_barcode'),
+    path('operator/china/barcode-connection/batch/', BarcodeBatchConnectionAPIView.as_view(),
+         name='china_barcode_batch'),
     path('operator/tashkent/accept-product/<str:barcode>/', AcceptProductAPIView.as_view(), name='tashkent_accept'),
+    path('operator/tashkent/accept-products/', BatchAcceptProductAPIView.as_view(), name='tashkent_accept_batch'),
     path('operator/daily-stats/', OperatorStatisticsAPIView.as_view(), name='operator_daily_stats'),
 
     path('operator/tashkent/load-info/', LoadInfoAPIView.as_view(), name='tashkent_load_info'),
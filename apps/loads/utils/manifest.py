@@ -0,0 +1,183 @@
+import csv
+import logging
+from os.path import splitext
+
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+
+from apps.files.utils import stored_path
+from apps.loads.models import ManifestImport
+from apps.loads.utils.services import connect_barcodes, BARCODE_CREATED, BARCODE_DUPLICATE
+from apps.user.models import Customer
+from config.core.api_exceptions import APIValidation
+
+logger = logging.getLogger()
+
+MANIFEST_EXTENSIONS = ('csv', 'xlsx')
+MANIFEST_COLUMNS = ('barcode', 'customer_id')
+MANIFEST_BATCH_SIZE = 1000
+MANIFEST_REPORT_LIMIT = 1000  # rejected rows kept in the report, the rest are only counted
+BARCODE_MAX_LENGTH = 155
+
+
+def manifest_extension(path: str) -> str:
+    extension = splitext(path)[1].lstrip('.').lower()
+    if extension not in MANIFEST_EXTENSIONS:
+        raise APIValidation(_('Поддерживаются только файлы CSV и XLSX'), status_code=status.HTTP_400_BAD_REQUEST)
+    return extension
+
+
+def manifest_file_path(manifest: ManifestImport) -> str:
+    return stored_path(manifest.file.gen_name)
+
+
+def csv_rows(path):
+    # utf-8-sig drops the BOM which Excel puts into exported CSV
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        yield from csv.reader(file)
+
+
+def xlsx_rows(path):
+    from openpyxl import load_workbook
+
+    # read_only parses the sheet lazily instead of building the whole workbook in memory
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        yield from workbook.active.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def cell_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        # numeric barcodes come from excel as 1234567.0
+        value = int(value)
+    return str(value).strip()
+
+
+def count_rows(path) -> int:
+    """
+    Count data rows without parsing them (xlsx dimension may be missing, then None is returned)
+    """
+    if manifest_extension(path) == 'xlsx':
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(path, read_only=True)
+        try:
+            max_row = workbook.active.max_row
+        finally:
+            workbook.close()
+        return max_row - 1 if max_row else None
+    with open(path, 'rb') as file:
+        return max(sum(1 for line in file) - 1, 0)
+
+
+def manifest_rows(path):
+    """
+    Stream manifest rows as (row number, barcode, customer code), the first row is a header
+    with barcode and customer_id columns in any order
+    """
+    rows = xlsx_rows(path) if manifest_extension(path) == 'xlsx' else csv_rows(path)
+    header = [cell_value(value).lower() for value in next(rows, [])]
+    missing = [column for column in MANIFEST_COLUMNS if column not in header]
+    if missing:
+        raise APIValidation(_('В файле нет колонок: %s') % ', '.join(missing),
+                            status_code=status.HTTP_400_BAD_REQUEST)
+    barcode_index, customer_index = (header.index(column) for column in MANIFEST_COLUMNS)
+
+    for row_number, row in enumerate(rows, start=2):
+        row = list(row)
+        if not any(cell_value(value) for value in row):
+            continue
+        row += [None] * (len(header) - len(row))
+        yield row_number, cell_value(row[barcode_index]), cell_value(row[customer_index]).upper()
+
+
+def customer_code_map() -> dict:
+    """
+    {customer code: id} of every customer, loaded once per import instead of a lookup per row
+    """
+    customers = Customer.objects.exclude(prefix__isnull=True).values_list('id', 'prefix', 'code')
+    return {f'{prefix}{code}': customer_id for customer_id, prefix, code in customers.iterator(chunk_size=5000)}
+
+
+def row_error(barcode, customer_code):
+    if not barcode:
+        return _('Пустой штрихкод')
+    if len(barcode) > BARCODE_MAX_LENGTH:
+        return _('Штрихкод длиннее %s символов') % BARCODE_MAX_LENGTH
+    if not customer_code:
+        return _('Не указан ID клиента')
+    return None
+
+
+def import_batch(manifest: ManifestImport, batch, customer_ids, report):
+    items = [{'barcode': barcode, 'customer_id': customer_code} for row_number, barcode, customer_code in batch]
+    results = connect_barcodes(items, manifest.created_by, customer_ids=customer_ids)
+
+    counters = {'created_count': 0, 'duplicate_count': 0, 'error_count': 0}
+    for (row_number, barcode, customer_code), result in zip(batch, results):
+        if result['status'] == BARCODE_CREATED:
+            counters['created_count'] += 1
+        elif result['status'] == BARCODE_DUPLICATE:
+            counters['duplicate_count'] += 1
+        else:
+            counters['error_count'] += 1
+            add_report_row(report, row_number, barcode, customer_code, _('Клиент не найден'))
+    return counters
+
+
+def add_report_row(report, row_number, barcode, customer_code, reason):
+    if len(report['errors']) < MANIFEST_REPORT_LIMIT:
+        report['errors'].append({'row': row_number, 'barcode': barcode, 'customer_id': customer_code,
+                                 'reason': str(reason)})
+    else:
+        report['truncated'] = True
+
+
+def run_manifest_import(manifest: ManifestImport, path=None, batch_size=MANIFEST_BATCH_SIZE) -> ManifestImport:
+    """
+    Stream the manifest into products with bulk_create batches, counters are stored after every batch
+    so the import can be polled; rows processed by an interrupted run are skipped when it is restarted
+    """
+    path = path or manifest_file_path(manifest)
+    if manifest.total_rows is None:
+        manifest.total_rows = count_rows(path)
+        manifest.save(update_fields=['total_rows', 'updated_at'])
+
+    customer_ids = customer_code_map()
+    report = {'errors': [], 'truncated': False, **manifest.report}
+    skip_rows, batch, processed = manifest.processed_rows, [], 0
+
+    def flush(rows, invalid):
+        counters = import_batch(manifest, rows, customer_ids, report) if rows else {}
+        counters['error_count'] = counters.get('error_count', 0) + invalid
+        ManifestImport.objects.filter(pk=manifest.pk).update(
+            processed_rows=processed, report=report,
+            **{field: F(field) + value for field, value in counters.items()}
+        )
+
+    invalid = 0
+    for row_number, barcode, customer_code in manifest_rows(path):
+        processed += 1
+        if processed <= skip_rows:
+            continue
+        error = row_error(barcode, customer_code)
+        if error:
+            invalid += 1
+            add_report_row(report, row_number, barcode, customer_code, error)
+        else:
+            batch.append((row_number, barcode, customer_code))
+        if len(batch) + invalid >= batch_size:
+            flush(batch, invalid)
+            batch, invalid = [], 0
+    flush(batch, invalid)
+
+    manifest.refresh_from_db()
+    logger.info(f'manifest import #{manifest.id}: {manifest.processed_rows} rows, '
+                f'{manifest.created_count} created, {manifest.duplicate_count} duplicates, '
+                f'{manifest.error_count} errors')
+    return manifest
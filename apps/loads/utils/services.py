@@ -1,14 +1,214 @@
+import logging
+
+from django.db import transaction
+from django.db.models import Case, When, Value, Exists, OuterRef, Prefetch
+from django.utils import timezone
 from django.utils.timezone import localdate
 from rest_framework import status
 from rest_framework.generics import get_object_or_404
 
+from apps.files.models import File
+from apps.loads.models import Product, Load
 from apps.payment.models import Payment
+from apps.payment.utils.ledger import pay, settle, load_payment_status
+from apps.tools.signals import refresh_daily_stats_on_commit
+from apps.tools.utils.helpers import split_code
+from apps.user.models import Customer
 from config.core.api_exceptions import APIValidation
+from config.core.choices import PRODUCT_ON_WAY, PRODUCT_DELIVERED, PRODUCT_LOADED, PRODUCT_DONE
+
+logger = logging.getLogger()
+
+RELEASE_EXCLUDED_STATUSES = [PRODUCT_ON_WAY, PRODUCT_DONE]
+
+
+def transition_products(product_ids, from_status, to_status) -> int:
+    """
+    Move products from from_status (status or list of statuses) to to_status with one UPDATE,
+    rows in any other status are left as is; returns count of changed products
+    """
+    from_statuses = [from_status] if isinstance(from_status, str) else list(from_status)
+    with transaction.atomic():
+        products = Product.objects.filter(id__in=product_ids, status__in=from_statuses)
+        created_times = list(products.values_list('created_at', flat=True))
+        changed = products.update(status=to_status, updated_at=timezone.now())
+        # queryset.update() skips post_save, refresh status rollups here
+        refresh_daily_stats_on_commit(created_times)
+    return changed
+
+
+def release_load_products(load) -> int:
+    """
+    Mark every product of the released load DONE, as releasing always did. Products which were not LOADED
+    (never scanned into the load, or moved back meanwhile) are released too and logged; returns the changed count
+    """
+    with transaction.atomic():
+        products = list(load.products.exclude(status=PRODUCT_DONE).values_list('id', 'status', 'created_at'))
+        unloaded = {product_id: product_status for product_id, product_status, created_at in products
+                    if product_status != PRODUCT_LOADED}
+        if unloaded:
+            logger.warning('load %s released with products which were not loaded: %s', load.id, unloaded)
+        # the rows were just read, transition_products would select them again for the rollups
+        changed = (Product.objects.filter(id__in=[product_id for product_id, product_status, created_at in products])
+                   .exclude(status=PRODUCT_DONE).update(status=PRODUCT_DONE, updated_at=timezone.now()))
+        refresh_daily_stats_on_commit([created_at for product_id, product_status, created_at in products])
+    return changed
+
+
+def pending_application():
+    """
+    Whether the load has a customer payment application waiting for moderation, for Load annotations
+    """
+    return Exists(Payment.objects.filter(load=OuterRef('pk'), status__isnull=True, is_operator=False))
+
+
+def release_load_queryset():
+    """
+    Loads with customer and the products to release prefetched, as ReleaseLoadInfoSerializer reads them
+    """
+    return Load.objects.select_related('customer').prefetch_related(
+        Prefetch('customer__products', queryset=Product.objects.exclude(status__in=RELEASE_EXCLUDED_STATUSES),
+                 to_attr='release_products')
+    )
+
+
+BARCODE_CREATED = 'created'
+BARCODE_DUPLICATE = 'duplicate'
+BARCODE_UNKNOWN_CUSTOMER = 'unknown_customer'
+
+
+def resolve_customer_codes(customer_codes) -> dict:
+    """
+    Map full customer codes (HVP0001) to customer ids with one query, unknown codes are left out
+    """
+    split_codes = {customer_code: split_code(customer_code) for customer_code in customer_codes}
+    prefixes = {prefix for prefix, code in split_codes.values()}
+    codes = {code for prefix, code in split_codes.values()}
+    customers = {(prefix, code): customer_id for customer_id, prefix, code in
+                 Customer.objects.filter(prefix__in=prefixes, code__in=codes).values_list('id', 'prefix', 'code')}
+    return {customer_code: customers[split] for customer_code, split in split_codes.items() if split in customers}
+
 
+def connect_barcodes(items, user, customer_ids=None) -> list:
+    """
+    Create China products for a batch of scans [{barcode, customer_id, china_files}] with a few bulk queries.
+    Barcodes which already exist are reported as duplicates, so a retried batch creates nothing twice;
+    customer_ids is a preloaded {customer code: id} map, otherwise codes of the batch are resolved here
+    """
+    now = timezone.now()
+    if customer_ids is None:
+        customer_ids = resolve_customer_codes({item['customer_id'] for item in items
+                                               if split_code(item['customer_id']) != ('', '0')})
+    existing = dict(Product.objects.filter(barcode__in=[item['barcode'] for item in items])
+                    .values_list('barcode', 'id'))
 
+    results, first_results, new_products, files = [], {}, {}, {}
+    for item in items:
+        barcode = item['barcode']
+        result = {'barcode': barcode, 'status': BARCODE_DUPLICATE, 'product_id': existing.get(barcode)}
+        results.append(result)
+        if barcode in existing or barcode in first_results:
+            continue
+        first_results[barcode] = result
+        is_homeless = split_code(item['customer_id']) == ('', '0')
+        if not is_homeless and item['customer_id'] not in customer_ids:
+            result['status'] = BARCODE_UNKNOWN_CUSTOMER
+            continue
+        result['status'] = BARCODE_CREATED
+        new_products[barcode] = Product(barcode=barcode, is_homeless=is_homeless,
+                                        customer_id=None if is_homeless else customer_ids[item['customer_id']],
+                                        accepted_by_china=user, accepted_time_china=now)
+        files[barcode] = item.get('china_files') or []
+
+    with transaction.atomic():
+        # a concurrent retry of the same batch may insert some barcodes first
+        Product.objects.bulk_create(new_products.values(), batch_size=500, ignore_conflicts=True)
+        created = Product.objects.filter(barcode__in=new_products.keys()).values_list('barcode', 'id',
+                                                                                      'accepted_time_china')
+        file_products = {}
+        for barcode, product_id, accepted_time in created:
+            first_results[barcode]['product_id'] = product_id
+            if accepted_time != now:
+                first_results[barcode]['status'] = BARCODE_DUPLICATE
+                continue
+            for file_id in files[barcode]:
+                file_products[file_id] = product_id
+        if file_products:
+            File.objects.filter(id__in=file_products.keys()).update(china_product_id=Case(
+                *[When(id=file_id, then=Value(product_id)) for file_id, product_id in file_products.items()]
+            ))
+        if new_products:
+            refresh_daily_stats_on_commit([now])
+
+    for result in results:
+        # repeated scans inside the batch point to the product of the first one
+        if result['status'] == BARCODE_DUPLICATE and result['product_id'] is None:
+            result['product_id'] = first_results[result['barcode']]['product_id']
+    return results
+
+
+ACCEPT_CHUNK_SIZE = 500
+
+
+def accept_barcodes(barcodes, user) -> dict:
+    """
+    Move ON_WAY products to DELIVERED with one conditional UPDATE,
+    returns barcodes grouped into accepted (now), already_accepted and unknown
+    """
+    barcodes = list(dict.fromkeys(barcodes))
+    now = timezone.now()
+    with transaction.atomic():
+        Product.objects.filter(barcode__in=barcodes, status=PRODUCT_ON_WAY).update(
+            status=PRODUCT_DELIVERED, accepted_by_tashkent=user, accepted_time_tashkent=now, updated_at=now
+        )
+        # rows stamped by this UPDATE, a concurrent operator's accept has another time
+        products = Product.objects.filter(barcode__in=barcodes).values_list('barcode', 'accepted_by_tashkent',
+                                                                            'accepted_time_tashkent', 'created_at')
+        accepted, found, created_times = set(), set(), []
+        for barcode, accepted_by, accepted_time, created_at in products:
+            found.add(barcode)
+            if accepted_by == user.id and accepted_time == now:
+                accepted.add(barcode)
+                created_times.append(created_at)
+        refresh_daily_stats_on_commit(created_times)
+    return {
+        'accepted': [barcode for barcode in barcodes if barcode in accepted],
+        'already_accepted': [barcode for barcode in barcodes if barcode in found and barcode not in accepted],
+        'unknown': [barcode for barcode in barcodes if barcode not in found],
+    }
+
+
+def accept_barcodes_chunked(barcodes, user, chunk_size=ACCEPT_CHUNK_SIZE):
+    """
+    accept_barcodes() over chunks of a large manifest, yields progress after every committed chunk
+    """
+    barcodes = list(dict.fromkeys(barcodes))
+    for i in range(0, len(barcodes), chunk_size):
+        result = accept_barcodes(barcodes[i:i + chunk_size], user)
+        yield {'processed': min(i + chunk_size, len(barcodes)), 'total': len(barcodes), **result}
+
+
+def accept_barcodes_progress(barcodes, user, chunk_size=ACCEPT_CHUNK_SIZE):
+    """
+    accept_barcodes_chunked() for a streamed response, whose 200 status is sent before the first chunk:
+    a failed chunk ends the progress with an error item instead of raising. Chunks before it stay accepted,
+    so a progress which ends with an error means a partial acceptance, the rest can be sent again
+    """
+    processed, total = 0, len(set(barcodes))
+    try:
+        for chunk in accept_barcodes_chunked(barcodes, user, chunk_size):
+            processed = chunk['processed']
+            yield chunk
+    except Exception as exc:
+        logger.exception(f'batch accept stopped after {processed} of {total} barcodes: {exc}')
+        yield {'processed': processed, 'total': total,
+               'error': 'Accepting stopped, the barcodes after processed were not accepted'}
+
+
+@transaction.atomic
 def process_payment(request, application_id, payment_status, serializer_class=None):
     try:
-        instance = get_object_or_404(Payment, pk=application_id)
+        instance = get_object_or_404(Payment.objects.select_for_update(), pk=application_id)
         if instance.status:
             raise APIValidation('This payment was already processed', status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -16,26 +216,17 @@ def process_payment(request, application_id, payment_status, serializer_class=No
             serializer = serializer_class(instance, data=request.data)
             serializer.is_valid(raise_exception=True)
             instance: Payment = serializer.save()
-            instance.residue = instance.customer.debt
-            instance.customer.debt -= instance.paid_amount
-            instance.customer.save()
+            entry = pay(instance.customer, instance.paid_amount, payment=instance, load=instance.load,
+                        operator=request.user)
+            instance.residue = entry.balance_before
             instance.load.status = 'PARTIALLY_PAID'
             instance.load.save()
         instance.status = payment_status
         if payment_status == 'SUCCESSFUL':
-            instance.paid_amount = instance.customer.debt
-            instance.residue = instance.customer.debt
-            instance.customer.debt = 0
-            instance.customer.save()
-            if instance.customer.debt == 0:
-                instance.load.status = 'PAID'
-                instance.load.save()
-            elif instance.customer.debt == instance.load.cost:
-                instance.load.status = 'NOT_PAID'
-                instance.load.save()
-            elif instance.customer.debt != instance.load.customer:
-                instance.load.status = 'PARTIALLY_PAID'
-                instance.load.save()
+            entry = settle(instance.customer, payment=instance, load=instance.load, operator=request.user)
+            instance.paid_amount = instance.residue = entry.balance_before if entry else 0
+            instance.load.status = load_payment_status(instance.customer.debt, instance.load.cost)
+            instance.load.save()
         instance.operator_id = request.user.id
         instance.save()
         return {
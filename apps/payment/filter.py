@@ -3,7 +3,7 @@ from django_filters import FilterSet
 from rest_framework.filters import SearchFilter
 
 from apps.payment.models import Payment
-from apps.tools.utils.helpers import split_code
+from apps.tools.utils.search import exact_customer_ids, customer_ids, numeric_q
 
 
 class AdminPaymentFilter(FilterSet):
@@ -14,13 +14,13 @@ class AdminPaymentFilter(FilterSet):
 
 class PaymentSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_param = request.query_params.get('search', '')
+        search_param = request.query_params.get('search', '').strip()
         if search_param:
-            prefix, code = split_code(search_param)
+            exact = exact_customer_ids(search_param)
+            if exact:
+                return queryset.filter(customer_id__in=exact)
             queryset = queryset.filter(
-                Q(paid_amount__icontains=search_param) |
-                Q(
-                    Q(customer__prefix__icontains=prefix) & Q(customer__code__icontains=code)
-                )
+                numeric_q(search_param, 'paid_amount') |
+                Q(customer_id__in=customer_ids(search_param))
             )
         return queryset
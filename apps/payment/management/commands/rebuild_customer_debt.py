@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.payment.utils.ledger import ledger_mismatches, open_ledger, rebuild_balances
+
+
+class Command(BaseCommand):
+    help = 'Compare cached Customer.debt with the ledger and rebuild it from LedgerEntry rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--opening', action='store_true',
+                            help='Post OPENING entries for debt not backed by the ledger instead of rebuilding it')
+        parser.add_argument('--check', action='store_true', help='Only report mismatched customers')
+
+    def handle(self, *args, **options):
+        if options['opening']:
+            created = open_ledger()
+            self.stdout.write(self.style.SUCCESS(f'Opening entries posted: {created}'))
+            return
+
+        mismatches = ledger_mismatches().values('id', 'prefix', 'code', 'debt', 'ledger_debt')
+        for customer in mismatches:
+            self.stdout.write(f"#{customer['id']} {customer['prefix']}{customer['code']}: "
+                              f"debt {customer['debt']}, ledger {customer['ledger_debt']}")
+        if options['check']:
+            if mismatches:
+                raise CommandError(f'Customer debt differs from the ledger, customers: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS('Customer debt matches the ledger'))
+            return
+
+        corrected = rebuild_balances()
+        self.stdout.write(self.style.SUCCESS(f'Customer debt rebuilt, corrected: {corrected}'))
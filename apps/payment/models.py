@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 
 from apps.loads.models import Load
 from apps.user.models import Customer, User
@@ -34,3 +35,54 @@ class Payment(BaseModel):
 
     class Meta:
         db_table = 'Payment'
+        indexes = [
+            models.Index(fields=['paid_amount'], name='payment_paid_amount'),
+            models.Index(fields=['status', 'is_operator', 'load'], name='payment_status_operator_load'),
+            # applications waiting for moderation are a small slice of the table
+            models.Index(fields=['load', 'is_operator'], condition=Q(status__isnull=True), name='payment_pending_load'),
+            models.Index(fields=['customer', 'load'], condition=Q(status__isnull=True),
+                         name='payment_pending_customer'),
+        ]
+
+
+class LedgerEntry(BaseModel):
+    """
+    Append-only record of a customer debt change, Customer.debt is the running sum of amounts
+    """
+    CHARGE = 'CHARGE'
+    PAYMENT = 'PAYMENT'
+    ADJUSTMENT = 'ADJUSTMENT'
+    OPENING = 'OPENING'
+    ENTRY_TYPE_CHOICE = [
+        (CHARGE, 'Charge'),
+        (PAYMENT, 'Payment'),
+        (ADJUSTMENT, 'Adjustment'),
+        (OPENING, 'Opening balance'),
+    ]
+    entry_type = models.CharField(choices=ENTRY_TYPE_CHOICE, max_length=10)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)  # positive raises the debt, negative lowers it
+    balance_after = models.DecimalField(max_digits=14, decimal_places=2)
+    comment = models.TextField(null=True, blank=True)
+
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='ledger_entries')
+    load = models.ForeignKey(Load, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True,
+                                related_name='ledger_entries')
+    operator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='ledger_entries')
+
+    class Meta:
+        db_table = 'LedgerEntry'
+        indexes = [
+            models.Index(fields=['customer', 'id'], name='ledger_entry_customer'),
+        ]
+
+    @property
+    def balance_before(self):
+        return self.balance_after - self.amount
+
+    def save(self, *args, **kwargs):
+        if self.pk:
+            raise APIValidation('Ledger entries can not be changed, post a new entry instead')
+        super().save(*args, **kwargs)
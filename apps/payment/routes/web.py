@@ -1,24 +1,26 @@
+from django.db import transaction
 from django.utils.timezone import localdate
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
 from django.utils.translation import gettext_lazy as _
-from rest_framework import status
 
 from rest_framework.generics import ListAPIView, get_object_or_404
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.files.serializer import FileDataSerializer
 from apps.payment.filter import AdminPaymentFilter, PaymentSearchFilter
 from apps.payment.models import Payment
 from apps.payment.serializers.web import AdminPaymentOpenListSerializer, AdminPaymentClosedListSerializer, \
     AdminPaymentDeclineSerializer, AdminPaymentApplySerializer
+from apps.payment.utils.ledger import pay, settle, load_payment_status
 from config.core.api_exceptions import APIValidation
 from config.core.pagination import APIPagination
 from config.core.permissions.web import IsWebOperator
 
 
 class AdminPaymentOpenListAPIView(ListAPIView):
-    queryset = Payment.objects.filter(status__isnull=True)
+    queryset = Payment.objects.select_related('customer').prefetch_related('files').filter(status__isnull=True)
     serializer_class = AdminPaymentOpenListSerializer
     permission_classes = [IsWebOperator, ]
     pagination_class = APIPagination
@@ -27,7 +29,7 @@ class AdminPaymentOpenListAPIView(ListAPIView):
 
 
 class AdminPaymentClosedListAPIView(ListAPIView):
-    queryset = Payment.objects.filter(status__isnull=False)
+    queryset = Payment.objects.select_related('customer').prefetch_related('files').filter(status__isnull=False)
     serializer_class = AdminPaymentClosedListSerializer
     permission_classes = [IsWebOperator, ]
     pagination_class = APIPagination
@@ -41,24 +43,23 @@ class AdminPaymentApplyAPIView(APIView):
     permission_classes = [IsWebOperator, ]
 
     # @swagger_auto_schema(request_body=AdminPaymentApplySerializer)
+    @transaction.atomic
     def patch(self, request, payment_id, *args, **kwargs):
-        instance = get_object_or_404(Payment, pk=payment_id)
+        instance = get_object_or_404(Payment.objects.select_for_update(), pk=payment_id)
         if instance.status:
             raise APIValidation(_('Это заявка уже была обработана'))
-        instance.paid_amount = instance.customer.debt
-        instance.residue = instance.customer.debt
-        instance.customer.debt = 0
+        entry = settle(instance.customer, payment=instance, load=instance.load, operator=request.user)
+        instance.paid_amount = instance.residue = entry.balance_before if entry else 0
         instance.load.status = 'PAID'
         instance.status = 'SUCCESSFUL'
         instance.operator_id = request.user.id
-        instance.customer.save()
         instance.load.save()
         instance.save()
         return Response({
             'id': instance.id,
             'customer_id': f'{instance.customer.prefix}{instance.customer.code}',
             'date': localdate(instance.created_at),
-            'files': instance.files.values('name', 'size', 'path'),
+            'files': FileDataSerializer(instance.files.all(), many=True).data,
             'status': instance.status,
             'status_display': instance.get_status_display(),
             'debt': instance.customer.debt,
@@ -72,28 +73,21 @@ class AdminPaymentDeclineAPIView(APIView):
     permission_classes = [IsWebOperator, ]
 
     @swagger_auto_schema(request_body=AdminPaymentDeclineSerializer)
+    @transaction.atomic
     def patch(self, request, payment_id, *args, **kwargs):
-        instance = get_object_or_404(Payment, pk=payment_id)
+        instance = get_object_or_404(Payment.objects.select_for_update(), pk=payment_id)
         if instance.status:
             raise APIValidation(_('Это заявка уже была обработана'))
-        if instance.customer.debt < request.data.get('paid_amount'):
-            raise APIValidation(_('Выплаченная сумма больше долга клиента'), status_code=status.HTTP_400_BAD_REQUEST)
         serializer = self.serializer_class(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         data = serializer.data
-        instance.residue = instance.customer.debt
-        instance.customer.debt = instance.customer.debt - data.get('paid_amount', 0)
-        instance.customer.save()
-        if instance.customer.debt == 0:
-            instance.load.status = 'PAID'
-            instance.load.save()
-        elif instance.customer.debt == instance.load.cost:
-            instance.load.status = 'NOT_PAID'
-            instance.load.save()
-        elif instance.customer.debt != instance.load.cost:
-            instance.load.status = 'PARTIALLY_PAID'
-            instance.load.save()
+        # strict: the debt is compared with paid_amount under the customer lock
+        entry = pay(instance.customer, data.get('paid_amount', 0), payment=instance, load=instance.load,
+                    operator=request.user, strict=True)
+        instance.residue = entry.balance_before
+        instance.load.status = load_payment_status(instance.customer.debt, instance.load.cost)
+        instance.load.save()
         instance.status = 'DECLINED'
         instance.operator_id = request.user.id
         instance.save()
@@ -101,7 +95,7 @@ class AdminPaymentDeclineAPIView(APIView):
             'id': instance.id,
             'customer_id': f'{instance.customer.prefix}{instance.customer.code}',
             'date': localdate(instance.created_at),
-            'files': instance.files.values('name', 'size', 'path'),
+            'files': FileDataSerializer(instance.files.all(), many=True).data,
             'status': instance.status,
             'status_display': instance.get_status_display(),
             'debt': instance.customer.debt,
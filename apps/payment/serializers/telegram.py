@@ -1,4 +1,5 @@
 import xmltodict
+from django.db import transaction
 from django.utils import timezone
 from django.utils.timezone import localdate
 from rest_framework import serializers, status
@@ -6,10 +7,11 @@ from django.utils.translation import gettext_lazy as _
 
 from apps.bot.templates.text import delivery_text, request_location, mail_success
 from apps.bot.utils.keyboards import location_keyboard
-from apps.bot.views import avia_customer_bot, auto_customer_bot
+from apps.bot.utils.outbound import queue_message
 from apps.files.models import File
 from apps.integrations.emu.data import emu_order, emu_tracking_link
 from apps.integrations.serializer import OrderEMUSerializer
+from apps.loads.utils.services import release_load_products
 from apps.payment.models import Payment
 from apps.tools.models import Delivery
 from config.core.api_exceptions import APIValidation
@@ -73,12 +75,7 @@ class CustomerDeliverySerializer(serializers.ModelSerializer):
         instance.save()
 
         if instance.delivery_type == 'YANDEX':
-            if customer.user_type == 'AVIA':
-                avia_customer_bot.send_message(chat_id=customer.tg_id, text=request_location,
-                                               reply_markup=location_keyboard())
-            elif customer.user_type == 'AUTO':
-                auto_customer_bot.send_message(chat_id=customer.tg_id, text=request_location,
-                                               reply_markup=location_keyboard())
+            queue_message(customer.user_type, customer.tg_id, text=request_location, reply_markup=location_keyboard())
         elif instance.delivery_type == 'MAIL':
             load.status = 'DONE_MAIL'
             data = {
@@ -103,20 +100,14 @@ class CustomerDeliverySerializer(serializers.ModelSerializer):
                                                 comment=instance.comment, phone_number=customer.phone_number,
                                                 track_link=track_link, customer_id=f'{customer.prefix}{customer.code}')
             mail_success_message = mail_success.format(track_link=track_link)
-            if customer.user_type == 'AVIA':
-                avia_customer_bot.send_message(chat_id=-1002187675934, text=mail_message, parse_mode='HTML')
-                avia_customer_bot.send_message(chat_id=customer.tg_id, text=mail_success_message)
-            elif customer.user_type == 'AUTO':
-                auto_customer_bot.send_message(chat_id=-1002187675934, text=mail_message, parse_mode='HTML')
-                auto_customer_bot.send_message(chat_id=customer.tg_id, text=mail_success_message)
+            queue_message(customer.user_type, -1002187675934, text=mail_message, parse_mode='HTML')
+            queue_message(customer.user_type, customer.tg_id, text=mail_success_message)
 
-            products = load.products.all()
-            for product in products:
-                product.status = 'DONE'
-                product.save()
-            load.is_active = False
-            load.save()
-            instance.save()
+            with transaction.atomic():
+                load.is_active = False
+                load.save()
+                instance.save()
+                release_load_products(load)
         return instance
 
     class Meta:
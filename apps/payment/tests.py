@@ -1,3 +1,84 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, skipUnlessDBFeature
+
+from apps.payment.models import LedgerEntry
+from apps.payment.utils.ledger import charge, pay, settle, ledger_mismatches, load_payment_status
+from apps.tools.utils.seed import seed_customer
+from apps.user.models import Customer
+from config.core.choices import LOAD_PAID, LOAD_NOT_PAID, LOAD_PARTIALLY_PAID
+
+THREADS = 8
+
+
+class LoadPaymentStatusTest(SimpleTestCase):
+    def test_float_cost_is_compared_in_cents(self):
+        # 0.1 + 0.2 != 0.3 as floats, the debt is stored as Decimal('0.30')
+        self.assertEqual(load_payment_status(Decimal('0.30'), 0.1 + 0.2), LOAD_NOT_PAID)
+        self.assertEqual(load_payment_status(Decimal('120.50'), 120.5), LOAD_NOT_PAID)
+
+    def test_statuses(self):
+        self.assertEqual(load_payment_status(Decimal('0.00'), 120.5), LOAD_PAID)
+        self.assertEqual(load_payment_status(Decimal('20.50'), 120.5), LOAD_PARTIALLY_PAID)
+        self.assertEqual(load_payment_status(Decimal('-5.00'), 120.5), LOAD_PAID)
+
+
+@mock.patch('apps.tools.signals.queue_refresh')
+class SettleTest(TestCase):
+    def test_debt_is_paid_off(self, queue_refresh):
+        customer = seed_customer()
+        charge(customer, Decimal('12.30'))
+
+        entry = settle(customer)
+        self.assertEqual(entry.entry_type, LedgerEntry.PAYMENT)
+        self.assertEqual(entry.balance_before, Decimal('12.30'))
+        self.assertEqual(customer.debt, 0)
+
+    def test_nothing_is_posted_without_a_debt(self, queue_refresh):
+        customer = seed_customer()
+        self.assertIsNone(settle(customer))
+        # overpaid
+        pay(customer, Decimal('5'))
+        self.assertIsNone(settle(customer))
+
+        self.assertEqual(customer.debt, Decimal('-5'))
+        self.assertEqual(LedgerEntry.objects.filter(customer=customer).count(), 1)
+
+
+def post(customer_id, amount):
+    try:
+        customer = Customer.objects.get(pk=customer_id)
+        if amount > 0:
+            charge(customer, amount)
+        else:
+            pay(customer, -amount)
+    finally:
+        # every thread has its own connection
+        connection.close()
+
+
+# the rollups refresh after the customer is saved goes to redis and celery, which the test doesn't run
+@mock.patch('apps.tools.signals.queue_refresh')
+@skipUnlessDBFeature('has_select_for_update')
+class LedgerConcurrencyTest(TransactionTestCase):
+    def test_parallel_entries_keep_the_balance(self, queue_refresh):
+        customer = seed_customer()
+        amounts = [Decimal('10.10'), Decimal('-3.05'), Decimal('0.01'), Decimal('-0.02')] * 100
+
+        with ThreadPoolExecutor(THREADS) as pool:
+            list(pool.map(lambda amount: post(customer.id, amount), amounts))
+
+        customer.refresh_from_db()
+        self.assertEqual(customer.debt, sum(amounts))
+        self.assertFalse(ledger_mismatches(Customer.objects.filter(pk=customer.pk)).exists())
+        # every entry saw the balance the previous one left
+        balances = list(LedgerEntry.objects.filter(customer=customer).order_by('id')
+                        .values_list('amount', 'balance_after'))
+        self.assertEqual(len(balances), len(amounts))
+        balance = Decimal(0)
+        for amount, balance_after in balances:
+            balance += amount
+            self.assertEqual(balance_after, balance)
@@ -0,0 +1,118 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Sum, OuterRef, Subquery, Value, DecimalField
+from django.db.models.functions import Coalesce
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+
+from apps.payment.models import LedgerEntry
+from apps.user.models import Customer
+from config.core.api_exceptions import APIValidation
+from config.core.choices import LOAD_PAID, LOAD_NOT_PAID, LOAD_PARTIALLY_PAID
+
+CENT = Decimal('0.01')
+
+
+def to_amount(value) -> Decimal:
+    # str() first: Decimal(0.1) would carry the float error into the ledger
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def load_payment_status(debt, cost) -> str:
+    """
+    Load status after a payment of the customer: PAID without debt (or overpaid), NOT_PAID while the debt is still
+    the load cost, PARTIALLY_PAID otherwise. Load.cost is a float, it's compared in cents with the Decimal debt
+    """
+    if to_amount(debt) <= 0:
+        return LOAD_PAID
+    if to_amount(debt) == to_amount(cost):
+        return LOAD_NOT_PAID
+    return LOAD_PARTIALLY_PAID
+
+
+def post_entry(customer: Customer, amount, entry_type, load=None, payment=None, operator=None, comment=None,
+               strict=False) -> LedgerEntry:
+    """
+    Append a ledger entry and move the cached Customer.debt with it, both under the customer row lock;
+    customer.debt is refreshed in place. strict=True refuses payments above the debt
+    """
+    amount = to_amount(amount)
+    with transaction.atomic():
+        debt = Customer.objects.select_for_update().values_list('debt', flat=True).get(pk=customer.pk)
+        if strict and amount < 0 and -amount > debt:
+            raise APIValidation(_('Выплаченная сумма больше долга клиента'), status_code=status.HTTP_400_BAD_REQUEST)
+        Customer.objects.filter(pk=customer.pk).update(debt=F('debt') + amount)
+        customer.debt = debt + amount
+        return LedgerEntry.objects.create(customer=customer, entry_type=entry_type, amount=amount,
+                                          balance_after=customer.debt, load=load, payment=payment,
+                                          operator=operator, comment=comment)
+
+
+def charge(customer: Customer, amount, load=None, operator=None) -> LedgerEntry:
+    return post_entry(customer, amount, LedgerEntry.CHARGE, load=load, operator=operator)
+
+
+def adjust(customer: Customer, amount, load=None, operator=None, comment=None) -> LedgerEntry:
+    return post_entry(customer, amount, LedgerEntry.ADJUSTMENT, load=load, operator=operator,
+                      comment=comment)
+
+
+def pay(customer: Customer, amount, payment=None, load=None, operator=None, strict=False) -> LedgerEntry:
+    return post_entry(customer, -to_amount(amount), LedgerEntry.PAYMENT, load=load, payment=payment,
+                      operator=operator, strict=strict)
+
+
+def settle(customer: Customer, payment=None, load=None, operator=None) -> LedgerEntry | None:
+    """
+    Pay off the whole debt as it is at the moment of locking; None without a debt, as a zero entry says nothing
+    and "paying" an overpaid (negative) debt would be a charge
+    """
+    with transaction.atomic():
+        debt = Customer.objects.select_for_update().values_list('debt', flat=True).get(pk=customer.pk)
+        if debt <= 0:
+            customer.debt = debt
+            return None
+        return pay(customer, debt, payment=payment, load=load, operator=operator)
+
+
+def ledger_balance():
+    return Coalesce(
+        Subquery(LedgerEntry.objects.filter(customer=OuterRef('pk')).order_by()
+                 .values('customer').annotate(total=Sum('amount')).values('total')),
+        Value(Decimal(0)), output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def ledger_mismatches(customers=None):
+    """
+    Customers whose cached debt differs from the sum of their ledger entries
+    """
+    customers = Customer.objects.all() if customers is None else customers
+    return customers.annotate(ledger_debt=ledger_balance()).exclude(debt=F('ledger_debt'))
+
+
+def open_ledger(operator=None) -> int:
+    """
+    Post OPENING entries for debt which is not backed by the ledger yet (balances from before the ledger)
+    """
+    created = 0
+    for customer in ledger_mismatches().only('id', 'debt'):
+        with transaction.atomic():
+            customer = Customer.objects.select_for_update().annotate(ledger_debt=ledger_balance()).get(pk=customer.pk)
+            difference = customer.debt - customer.ledger_debt
+            if difference:
+                LedgerEntry.objects.create(customer=customer, entry_type=LedgerEntry.OPENING, amount=difference,
+                                           balance_after=customer.debt, operator=operator)
+                created += 1
+    return created
+
+
+def rebuild_balances(customers=None) -> int:
+    """
+    Recompute cached Customer.debt from the ledger, returns count of corrected customers
+    """
+    customer_ids = list(ledger_mismatches(customers).values_list('id', flat=True))
+    with transaction.atomic():
+        list(Customer.objects.select_for_update().filter(id__in=customer_ids).values_list('id', flat=True))
+        return Customer.objects.filter(id__in=customer_ids).update(debt=ledger_balance())
@@ -1,29 +1,100 @@
 import logging
+import time
+from datetime import timedelta
 
+from django.db import transaction
+from django.db.models import Max, Q
 from django.utils import timezone
 
-from apps.tools.utils.helpers import generate_non_active_id
+from apps.bot.tasks import send_outbound_message
+from apps.bot.utils.outbound import stale_messages
+from apps.files.tasks import collect_orphan_files
+from apps.tools.models import Newsletter
+from apps.tools.tasks import rebuild_all_daily_stats, send_newsletter
+from apps.tools.utils.helpers import non_active_codes
 from apps.user.models import Customer
+from config.core.choices import NEWSLETTER_SENDING
 
 logger = logging.getLogger()
 
 
-def non_active_customers():
-    now = timezone.now()
-
-    customers = Customer.objects.all()
-    for customer in customers:
-        joined_at = timezone.localtime(customer.user.date_joined)
-        joined_days_diff = (now - joined_at).days
-
-        latest_accepted_product = customer.products.order_by('accepted_time_china', 'accepted_time_tashkent').last()
-        latest_time = latest_accepted_product.accepted_time_tashkent or latest_accepted_product.accepted_time_china
-        latest_product_days_diff = (now - latest_time).days
-        if ((joined_days_diff > 90) and (not customer.products.exists())) or (latest_product_days_diff > 90):
-            prefix, code = generate_non_active_id()
-            ex_prefix, ex_code = customer.prefix, customer.code
-            customer.ex_prefix = ex_prefix
-            customer.ex_code = ex_code
-            customer.prefix = prefix
-            customer.code = code
-        customer.save()
+def non_active_customers(dry_run=False) -> dict:
+    """
+    Move customers without products for 90 days to DELETE prefix, keeping their code in ex_prefix/ex_code;
+    dry_run only reports the changes
+    """
+    started = time.monotonic()
+    threshold = timezone.now() - timedelta(days=91)  # more than 90 full days ago
+
+    customers = (
+        Customer.objects
+        .exclude(prefix='DELETE')
+        .filter(prefix__isnull=False, code__isnull=False)
+        .annotate(last_china=Max('products__accepted_time_china'),
+                  last_tashkent=Max('products__accepted_time_tashkent'))
+        .filter(
+            Q(last_china__isnull=True, last_tashkent__isnull=True, user__date_joined__lte=threshold) |
+            Q(last_china__lte=threshold, last_tashkent__lte=threshold) |
+            Q(last_china__lte=threshold, last_tashkent__isnull=True) |
+            Q(last_china__isnull=True, last_tashkent__lte=threshold)
+        )
+        .only('id', 'prefix', 'code', 'ex_prefix', 'ex_code')
+        .order_by('id')
+    )
+    customers = list(customers)
+    selected = time.monotonic()
+
+    changes = []
+    with transaction.atomic():
+        codes = non_active_codes(len(customers)) if customers else []
+        now = timezone.now()
+        for customer, code in zip(customers, codes):
+            changes.append((customer.id, f'{customer.prefix}{customer.code}', f'DELETE{code}'))
+            customer.ex_prefix, customer.ex_code = customer.prefix, customer.code
+            customer.prefix, customer.code = 'DELETE', code
+            customer.updated_at = now
+
+        if dry_run:
+            # give the allocated DELETE codes back
+            transaction.set_rollback(True)
+        else:
+            Customer.objects.bulk_update(customers, ['prefix', 'code', 'ex_prefix', 'ex_code', 'updated_at'],
+                                         batch_size=500)
+    finished = time.monotonic()
+
+    report = {
+        'dry_run': dry_run,
+        'changed': len(changes),
+        'changes': changes,
+        'select_seconds': round(selected - started, 3),
+        'update_seconds': round(finished - selected, 3),
+        'total_seconds': round(finished - started, 3),
+    }
+    logger.info(f"non_active_customers: {report['changed']} customers {'to move' if dry_run else 'moved'} "
+                f"to DELETE in {report['total_seconds']}s (select {report['select_seconds']}s, "
+                f"update {report['update_seconds']}s)")
+    return report
+
+
+def daily_stats():
+    rebuild_all_daily_stats.delay()
+
+
+def resume_newsletters():
+    # chunk tasks refresh updated_at, a SENDING newsletter untouched for an hour lost its workers
+    stale_time = timezone.now() - timedelta(hours=1)
+    stale_newsletters = Newsletter.objects.filter(status=NEWSLETTER_SENDING, updated_at__lt=stale_time)
+    for newsletter_id in stale_newsletters.values_list('id', flat=True):
+        logger.info(f'Resuming newsletter #{newsletter_id}')
+        send_newsletter.delay(newsletter_id)
+
+
+def resume_outbound_messages():
+    # bot messages whose task was lost (worker restart, broker outage) or whose worker died while sending
+    for message_id in stale_messages().values_list('id', flat=True):
+        logger.info(f'Resuming outbound message #{message_id}')
+        send_outbound_message.delay(message_id)
+
+
+def orphan_files():
+    collect_orphan_files.delay()
@@ -0,0 +1,19 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from apps.tools.utils.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyStat rollups from Load, Payment, Customer and Product tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat,
+                            help='From, Date format: 2024-01-25')
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat,
+                            help='To, Date format: 2024-01-25')
+
+    def handle(self, *args, **options):
+        rows = rebuild_daily_stats(options['from_date'], options['to_date'])
+        self.stdout.write(self.style.SUCCESS(f'Daily stats rebuilt, rows: {rows}'))
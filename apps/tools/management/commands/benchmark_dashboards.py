@@ -0,0 +1,100 @@
+import statistics
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.timezone import localdate
+
+from apps.loads.models import Load
+from apps.tools.utils.helpers import day_filter
+from apps.tools.utils.seed import seed_operator, seed_customer, seed_load_history
+from apps.tools.utils.stats import group_by_day, daily_stats, rebuild_daily_stats
+from config.core.choices import STAT_LOADS
+
+
+def python_buckets(start_date, end_date, user_type) -> dict:
+    # what the dashboards did before: every row (with its products) loaded and bucketed by localdate()
+    loads = (Load.objects
+             .select_related('customer', 'accepted_by')
+             .prefetch_related('products')
+             .filter(customer__user_type=user_type, **day_filter('created_at', start_date, end_date)))
+    days = defaultdict(lambda: {'count': 0, 'sum': 0})
+    for load in loads:
+        day = days[localdate(load.created_at)]
+        day['count'] += 1
+        day['sum'] += load.weight
+    return dict(days)
+
+
+def database_buckets(start_date, end_date, user_type) -> dict:
+    loads = Load.objects.filter(customer__user_type=user_type, **day_filter('created_at', start_date, end_date))
+    return {row['day']: {'count': row['count'], 'sum': row['total']}
+            for row in group_by_day(loads, 'customer__user_type', 'weight')}
+
+
+def rollup_buckets(start_date, end_date, user_type) -> dict:
+    return daily_stats(STAT_LOADS, user_type, start_date, end_date)
+
+
+STRATEGIES = [
+    ('rows bucketed in python', python_buckets),
+    ('database aggregation', database_buckets),
+    ('DailyStat rollups', rollup_buckets),
+]
+
+
+class Command(BaseCommand):
+    help = ('Time the first dashboard chart (loads per day) over generated loads: rows bucketed in python as before, '
+            'one TruncDate/Count/Sum query over the loads and the DailyStat rollups it reads now. '
+            'The generated rows are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Generated loads')
+        parser.add_argument('--days', type=int, default=365, help='Days the loads are spread over')
+        parser.add_argument('--period', type=int, default=90, help='Days of the measured chart')
+        parser.add_argument('--customers', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per strategy, the median is shown')
+
+    def handle(self, *args, **options):
+        if min(options['rows'], options['days'], options['period'], options['customers'], options['repeat']) < 1:
+            raise CommandError('--rows, --days, --period, --customers and --repeat must be positive')
+
+        end_date = timezone.localdate()
+        start_date = end_date - timedelta(days=options['period'] - 1)
+        with transaction.atomic():
+            started = time.monotonic()
+            operator = seed_operator()
+            customers = [seed_customer('AVIA' if i % 2 == 0 else 'AUTO', operator=operator)
+                         for i in range(options['customers'])]
+            seed_load_history(customers, options['rows'], options['days'])
+            self.stdout.write(f'{options["rows"]} loads over {options["days"]} days generated in '
+                              f'{time.monotonic() - started:.1f}s, chart of the last {options["period"]} days')
+            started = time.monotonic()
+            rows = rebuild_daily_stats()
+            self.stdout.write(f'{rows} rollup rows rebuilt in {time.monotonic() - started:.1f}s')
+
+            expected = None
+            for name, strategy in STRATEGIES:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    result = strategy(start_date, end_date, 'AVIA')
+                    timings.append((time.perf_counter() - started) * 1000)
+                # a separate run, tracing slows python down
+                tracemalloc.start()
+                strategy(start_date, end_date, 'AVIA')
+                peak_mb = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+
+                counts = {day: row['count'] for day, row in result.items()}
+                if expected is None:
+                    expected = counts
+                elif counts != expected:
+                    raise CommandError(f'{name} counted other loads than {STRATEGIES[0][0]}')
+                self.stdout.write(f'{name:<26} {statistics.median(timings):10.1f} ms {peak_mb:8.1f} MB peak '
+                                  f'({sum(counts.values())} loads, {len(counts)} days)')
+            transaction.set_rollback(True)
@@ -0,0 +1,81 @@
+import logging
+import statistics
+import tempfile
+import time
+from os.path import join as join_path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.loads.routes.telegram import BarcodeConnectionAPIView
+from apps.tools.utils.seed import seed_operator, seed_customer, seed_tag
+from config.core.log_handlers import QueueFileHandler
+
+# (name, handler factory, root level)
+SETUPS = [
+    ('sync FileHandler, DEBUG', lambda path: plain_file_handler(path), logging.DEBUG),
+    ('QueueFileHandler, DEBUG', lambda path: QueueFileHandler(path, max_bytes=50 * 1024 * 1024), logging.DEBUG),
+    ('QueueFileHandler, INFO', lambda path: QueueFileHandler(path, max_bytes=50 * 1024 * 1024), logging.INFO),
+]
+
+
+def plain_file_handler(path):
+    # the handler LOGGING had before
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter('%(asctime)s %(name)-12s %(levelname)-8s %(message)s'))
+    return handler
+
+
+class Command(BaseCommand):
+    help = ('Latency of the china barcode-connection request (it logs its request data at DEBUG) with the old '
+            'synchronous file handler and with the queue handler. Created rows are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per setup')
+        parser.add_argument('--warmup', type=int, default=20, help='Requests per setup left out of the results')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests must be positive')
+
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        try:
+            with tempfile.TemporaryDirectory() as log_dir, transaction.atomic():
+                operator = seed_operator(operator_type='CHINA')
+                customer = seed_customer(operator=operator)
+                customer_code = f'{customer.prefix}{customer.code}'
+                for name, handler_factory, setup_level in SETUPS:
+                    handler = handler_factory(join_path(log_dir, f'{seed_tag()}.log'))
+                    root.handlers, root.level = [handler], setup_level
+                    timings = self.run_requests(operator, customer_code, options['requests'], options['warmup'])
+                    handler.close()
+                    self.report(name, timings)
+                transaction.set_rollback(True)
+        finally:
+            root.handlers, root.level = handlers, level
+
+    @staticmethod
+    def run_requests(operator, customer_code, count, warmup) -> list:
+        factory, view = APIRequestFactory(), BarcodeConnectionAPIView.as_view()
+        timings = []
+        for i in range(warmup + count):
+            request = factory.post('/', {'barcode': f'SEED{seed_tag()}', 'customer_id': customer_code,
+                                         'note': 'x' * 500}, format='json')
+            force_authenticate(request, user=operator)
+            started = time.perf_counter()
+            response = view(request)
+            response.render()
+            elapsed = (time.perf_counter() - started) * 1000
+            if response.status_code != 201:
+                raise CommandError(f'{response.status_code} {response.content[:200]}')
+            if i >= warmup:
+                timings.append(elapsed)
+        return timings
+
+    def report(self, name, timings):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) >= 20 else timings[-1]
+        self.stdout.write(f'{name:<26} mean {statistics.mean(timings):7.3f} ms  '
+                          f'p50 {statistics.median(timings):7.3f} ms  p95 {p95:7.3f} ms')
@@ -0,0 +1,81 @@
+import os
+import random
+import tempfile
+import time
+from os.path import join as join_path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import override_settings
+
+from apps.files.models import File
+from apps.files.utils import upload_file, upload_files, upload_path, gen_new_name, media_path, get_extension, \
+    PARTIAL_DIR
+
+
+def upload_random_names(files):
+    # what upload_file did before content addressing: every upload under a new random name
+    uploaded = []
+    for file in files:
+        gen_name = gen_new_name(file)
+        with open(join_path(upload_path(), gen_name), 'wb+') as destination:
+            for chunk in file.chunks():
+                destination.write(chunk)
+        uploaded.append(File.objects.create(name=file.name, size=file.size, gen_name=gen_name,
+                                            path=media_path(gen_name), content_type=file.content_type,
+                                            extension=get_extension(filename=file.name)))
+    return uploaded
+
+
+STRATEGIES = [
+    ('random names, serial', upload_random_names),
+    ('content-addressed, serial', lambda files: [upload_file(file) for file in files]),
+    ('content-addressed, parallel', upload_files),
+]
+
+
+def disk_usage(directory) -> int:
+    total = 0
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = [name for name in dirs if name != PARTIAL_DIR]
+        total += sum(os.path.getsize(join_path(root, name)) for name in names)
+    return total
+
+
+class Command(BaseCommand):
+    help = ('Throughput and disk use of a multi-file upload with the former random-name storage and with '
+            'content-addressed storage, serial and parallel. Files go to a temporary directory, rows are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=12, help='Files per upload')
+        parser.add_argument('--size-kb', type=int, default=4096, help='Size of every file')
+        parser.add_argument('--duplicates', type=float, default=0.5,
+                            help='Share of files which repeat the content of another one')
+        parser.add_argument('--uploads', type=int, default=3, help='Uploads per strategy, all of the same files')
+
+    def handle(self, *args, **options):
+        if options['files'] < 1 or options['uploads'] < 1 or not 0 <= options['duplicates'] < 1:
+            raise CommandError('--files and --uploads must be positive, --duplicates in [0, 1)')
+
+        distinct = max(1, round(options['files'] * (1 - options['duplicates'])))
+        contents = [os.urandom(options['size_kb'] * 1024) for _ in range(distinct)]
+        contents += random.choices(contents, k=options['files'] - distinct)
+        total_mb = len(contents) * options['uploads'] * options['size_kb'] / 1024
+        self.stdout.write(f'{len(contents)} files of {options["size_kb"]} KB, {distinct} distinct, '
+                          f'{options["uploads"]} uploads per strategy')
+
+        for name, strategy in STRATEGIES:
+            with tempfile.TemporaryDirectory() as directory, override_settings(FILE_UPLOAD_DIR=directory), \
+                    transaction.atomic():
+                elapsed = 0.0
+                for _ in range(options['uploads']):
+                    files = [SimpleUploadedFile(f'photo-{i}.jpg', content, content_type='image/jpeg')
+                             for i, content in enumerate(contents)]
+                    started = time.perf_counter()
+                    strategy(files)
+                    elapsed += time.perf_counter() - started
+                disk_mb = disk_usage(directory) / 1024 / 1024
+                transaction.set_rollback(True)
+            self.stdout.write(f'{name:<28} {total_mb / elapsed:8.1f} MB/s  {disk_mb:8.1f} MB on disk '
+                              f'for {total_mb:.1f} MB uploaded')
@@ -0,0 +1,26 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.tools.utils.stats import check_daily_stats
+
+
+class Command(BaseCommand):
+    help = 'Compare DailyStat rollups with Load, Payment, Customer and Product tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='from_date', type=date.fromisoformat,
+                            help='From, Date format: 2024-01-25')
+        parser.add_argument('--to', dest='to_date', type=date.fromisoformat,
+                            help='To, Date format: 2024-01-25')
+
+    def handle(self, *args, **options):
+        mismatches = check_daily_stats(options['from_date'], options['to_date'])
+        for mismatch in mismatches:
+            self.stdout.write(
+                f"{mismatch['date']} {mismatch['user_type']} {mismatch['payment_type'] or '-'} {mismatch['metric']}: "
+                f"expected {mismatch['expected']}, actual {mismatch['actual']}"
+            )
+        if mismatches:
+            raise CommandError(f'Daily stats are inconsistent, mismatches: {len(mismatches)}')
+        self.stdout.write(self.style.SUCCESS('Daily stats are consistent'))
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from apps.loads.routes.telegram import CustomerOwnLoadsHistoryAPIView, ModerationNotProcessedLoadAPIView, \
+    ModerationProcessedLoadAPIView, CustomerProductsListAPIView
+from apps.loads.routes.web import AdminProductListAPIView, AdminLoadListAPIView
+from apps.payment.routes.web import AdminPaymentOpenListAPIView, AdminPaymentClosedListAPIView
+from apps.tools.utils.seed import seed_operator, seed_customer, seed_customer_rows
+from apps.user.routes.web import UserModelViewSet, CustomerModelViewSet, CustomerModerationListAPIView
+
+# (name, view, requested by the seeded customer instead of the operator)
+ENDPOINTS = [
+    ('admin products', AdminProductListAPIView.as_view(), False),
+    ('admin loads', AdminLoadListAPIView.as_view(), False),
+    ('admin open payments', AdminPaymentOpenListAPIView.as_view(), False),
+    ('admin closed payments', AdminPaymentClosedListAPIView.as_view(), False),
+    ('users', UserModelViewSet.as_view({'get': 'list'}), False),
+    ('customers', CustomerModelViewSet.as_view({'get': 'list'}), False),
+    ('customer moderation', CustomerModerationListAPIView.as_view(), False),
+    ('payment moderation not processed', ModerationNotProcessedLoadAPIView.as_view(), False),
+    ('payment moderation processed', ModerationProcessedLoadAPIView.as_view(), False),
+    ('customer loads history', CustomerOwnLoadsHistoryAPIView.as_view(), True),
+    ('customer products on way', CustomerProductsListAPIView.as_view(), True),
+]
+
+
+class Command(BaseCommand):
+    help = ('Count queries of list endpoints with few and with many seeded rows, '
+            'a count growing with the rows is an N+1. Seeded rows are rolled back')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--small', type=int, default=2, help='Rows per endpoint in the first run')
+        parser.add_argument('--large', type=int, default=20, help='Rows per endpoint in the second run')
+
+    def handle(self, *args, **options):
+        small, large = options['small'], options['large']
+        if not 0 < small < large:
+            raise CommandError('--small must be positive and less than --large')
+
+        with transaction.atomic():
+            operator = seed_operator()
+            customer = seed_customer(operator=operator)
+            self.seed(operator, customer, small)
+            counts_small = self.count_queries(operator, customer, large)
+            self.seed(operator, customer, large - small)
+            counts_large = self.count_queries(operator, customer, large)
+            transaction.set_rollback(True)
+
+        failures = []
+        for name, view, as_customer in ENDPOINTS:
+            grows = counts_large[name] != counts_small[name]
+            if grows:
+                failures.append(name)
+            self.stdout.write(f'{"FAIL" if grows else "ok  "} {name:<34} {counts_small[name]:>4} queries '
+                              f'with {small} rows, {counts_large[name]:>4} with {large}')
+        if failures:
+            raise CommandError(f'Query count grows with rows: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Query counts do not depend on the number of rows'))
+
+    @staticmethod
+    def seed(operator, own_customer, count):
+        """
+        count customers with their rows for the operator endpoints and as many rows of own_customer
+        for the customer endpoints
+        """
+        for _ in range(count):
+            seed_customer_rows(seed_customer(operator=operator), operator)
+            seed_customer_rows(own_customer, operator)
+
+    def count_queries(self, operator, customer, page_size) -> dict:
+        factory, counts = APIRequestFactory(), {}
+        for name, view, as_customer in ENDPOINTS:
+            request = factory.get('/', {'page_size': page_size})
+            force_authenticate(request, user=customer.user if as_customer else operator)
+            with CaptureQueriesContext(connection) as context:
+                response = view(request)
+                response.render()
+            if response.status_code != 200:
+                raise CommandError(f'{name}: {response.status_code} {response.content[:200]}')
+            counts[name] = len(context.captured_queries)
+        return counts
@@ -0,0 +1,67 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import setup_databases, teardown_databases, setup_test_environment, \
+    teardown_test_environment
+
+from apps.tools.utils.route_budgets import BUDGET_FILE, DEFAULT_CUSTOMERS, DEFAULT_REPEAT, temporary_settings, \
+    route_scenarios, seed_route_dataset, measure, budget_key, read_budget, write_budget, budget_problems, report
+
+
+class Command(BaseCommand):
+    help = ('Report of every route\'s query count and time against '
+            f'{BUDGET_FILE.name}, measured on a seeded test database. The check itself is RouteBudgetTest '
+            '(manage.py test apps.tools), this writes the markdown report and --update-budget')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=DEFAULT_CUSTOMERS,
+                            help='Seeded customers, each with all their rows')
+        parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                            help='Timed calls per route, the median is compared')
+        parser.add_argument('--report', default='perf_report.md', help='Markdown report path')
+        parser.add_argument('--update-budget', action='store_true',
+                            help=f'Write the measured numbers into {BUDGET_FILE.name} instead of checking them')
+
+    def handle(self, *args, **options):
+        if options['customers'] < 1 or options['repeat'] < 1:
+            raise CommandError('--customers and --repeat must be positive')
+        budget = {} if options['update_budget'] else read_budget()
+
+        # the same test database as manage.py test, the configured one is never written
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results, skipped = self.run_routes(options['customers'], options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        if options['update_budget']:
+            self.stdout.write(f'Budget of {write_budget(results)} routes written to {BUDGET_FILE}')
+        failures = [result for result in results
+                    if budget_problems(result, budget.get(budget_key(result)), options['update_budget'])]
+        Path(options['report']).write_text(report(results, skipped, failures))
+        for result in failures:
+            self.stdout.write(self.style.ERROR(f'{budget_key(result)}: {"; ".join(result["problems"])}'))
+
+        if failures:
+            raise CommandError(f'{len(failures)} routes over budget, see {options["report"]}')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} routes within budget, {len(skipped)} skipped, '
+                                             f'report: {options["report"]}'))
+
+    def run_routes(self, customers, repeat) -> tuple:
+        results, skipped = [], []
+        # rolled back as in a TestCase: no on_commit hook queues a celery task for the test database's rows
+        with temporary_settings(), transaction.atomic():
+            started = time.monotonic()
+            data = seed_route_dataset(customers)
+            self.stdout.write(f'Seeded {customers} customers in {time.monotonic() - started:.1f}s')
+            for route, spec, reason in route_scenarios():
+                if spec is None:
+                    skipped.append((route, reason))
+                else:
+                    results.append(measure(route, spec, data, repeat))
+            transaction.set_rollback(True)
+        return results, skipped
@@ -0,0 +1,73 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, connection
+from django.utils import timezone
+
+from apps.loads.models import Product, Load, LoadAccepted
+from apps.payment.models import Payment
+from apps.tools.utils.helpers import day_filter
+from apps.user.models import Customer
+
+
+def hot_queries():
+    """
+    (name, queryset, index expected in its plan) for the filters behind the busiest endpoints
+    """
+    today = timezone.localdate()
+    return [
+        ('customer products by status', Product.objects.filter(customer_id=1, status='ON_WAY'),
+         'product_customer_status'),
+        ('dashboard products of a period',
+         Product.objects.filter(status='ON_WAY', **day_filter('created_at', today, today)),
+         'product_status_created'),
+        ('admin products of a day', Product.objects.filter(**day_filter('updated_at', today, today)),
+         'product_updated'),
+        ('china operator accepted today',
+         Product.objects.filter(accepted_by_china_id=1, **day_filter('accepted_time_china', today, today)),
+         'product_china_accepted'),
+        ('tashkent operator accepted today',
+         Product.objects.filter(accepted_by_tashkent_id=1, **day_filter('accepted_time_tashkent', today, today)),
+         'product_tashkent_accepted'),
+        ('active load of customer', Load.objects.filter(customer_id=1, is_active=True), 'load_active_customer'),
+        ('admin loads of a day', Load.objects.filter(**day_filter('updated_at', today, today)), 'load_updated'),
+        ('loads accepted today',
+         LoadAccepted.objects.filter(accepted_by_id=1, **day_filter('accepted_time', today, today)),
+         'load_accepted_by_time'),
+        ('pending payments of load', Payment.objects.filter(load_id=1, is_operator=False, status__isnull=True),
+         'payment_pending_load'),
+        ('pending application of customer', Payment.objects.filter(customer_id=1, load_id=1, status__isnull=True),
+         'payment_pending_customer'),
+        ('processed payments of load', Payment.objects.filter(status='SUCCESSFUL', is_operator=False, load_id=1),
+         'payment_status_operator_load'),
+        ('customer by chat', Customer.objects.filter(tg_id='1', user_type='AVIA'), 'customer_tg_user_type'),
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Check that postgres plans of the hot filters use their indexes (sequential scans disabled)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are checked on postgresql only')
+
+        failures = []
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # tiny development tables are cheaper to scan, the check is whether an index can serve the filter
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset, index in hot_queries():
+                plan = queryset.explain()
+                used = re.search(rf'\b{index}\b', plan) is not None
+                if not used:
+                    failures.append(name)
+                self.stdout.write(f'{"ok  " if used else "FAIL"} {name}: {index}')
+                if options['verbose_plans'] or not used:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Indexes are not used by: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use their indexes'))
@@ -0,0 +1,83 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction, connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from apps.loads.filter import ProductSearchFilter, LoadSearchFilter
+from apps.loads.models import Product, Load
+from apps.payment.filter import PaymentSearchFilter
+from apps.payment.models import Payment
+from apps.user.filter import CustomerSearchFilter, CustomerModerationSearchFilter
+from apps.user.models import User, CustomerRegistration
+
+SEARCHES = [
+    ('products', ProductSearchFilter, Product, 'Product'),
+    ('loads', LoadSearchFilter, Load, 'Load'),
+    ('payments', PaymentSearchFilter, Payment, 'Payment'),
+    ('customers', CustomerSearchFilter, User, 'User'),
+    ('moderation', CustomerModerationSearchFilter, CustomerRegistration, 'CustomerRegistration'),
+]
+DEFAULT_TERMS = ['HVP0001', '77123', '12.5', 'ali']
+# the planner rightly prefers a sequential scan of small tables, only bigger ones are checked
+CHECK_MIN_ROWS = 10_000
+
+
+class Command(BaseCommand):
+    help = ('Time admin searches and check their postgres plans for sequential scans, '
+            'optionally on seeded products which are rolled back afterwards')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--term', action='append', dest='terms', help='Search term, may be repeated')
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many products before searching')
+        parser.add_argument('--check', action='store_true', help='Fail if a plan scans a searched table sequentially')
+
+    def handle(self, *args, **options):
+        terms = options['terms'] or DEFAULT_TERMS
+        with transaction.atomic():
+            if options['seed']:
+                self.seed(options['seed'])
+            failures = [failure for term in terms for failure in self.run_searches(term)]
+            transaction.set_rollback(True)
+
+        if failures and options['check']:
+            raise CommandError(f'Sequential scans: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def seed(self, count):
+        started, run_id = time.monotonic(), uuid.uuid4().hex[:8]
+        for start in range(0, count, 10_000):
+            Product.objects.bulk_create([Product(barcode=f'SEED{run_id}{i:09d}')
+                                         for i in range(start, min(start + 10_000, count))])
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE "Product"')
+        self.stdout.write(f'Seeded {count} products in {time.monotonic() - started:.1f}s')
+
+    def run_searches(self, term):
+        request = Request(APIRequestFactory().get('/', {'search': term}))
+        failures = []
+        for name, filter_class, model, table in SEARCHES:
+            started = time.monotonic()
+            queryset = filter_class().filter_queryset(request, model.objects.all(), None)
+            found = queryset.count()
+            seconds = time.monotonic() - started
+
+            seq_scan = False
+            if connection.vendor == 'postgresql':
+                seq_scan = (f'Seq Scan on "{table}"' in queryset.explain()
+                            and self.table_rows(table) >= CHECK_MIN_ROWS)
+                if seq_scan:
+                    failures.append(f'{name}:{term}')
+            self.stdout.write(f'{name:<11} {term!r:<12} {found:>8} rows {seconds * 1000:>9.1f} ms'
+                              f'{"  SEQ SCAN" if seq_scan else ""}')
+        return failures
+
+    @staticmethod
+    def table_rows(table):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+            row = cursor.fetchone()
+        return row[0] if row else 0
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.tools.cron import non_active_customers
+
+
+class Command(BaseCommand):
+    help = 'Move customers without products for 90 days to DELETE prefix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report customers which would be moved')
+
+    def handle(self, *args, **options):
+        report = non_active_customers(dry_run=options['dry_run'])
+        for customer_id, old_code, new_code in report['changes']:
+            self.stdout.write(f'#{customer_id}: {old_code} -> {new_code}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Would move' if report['dry_run'] else 'Moved'} {report['changed']} customers in "
+            f"{report['total_seconds']}s (select {report['select_seconds']}s, update {report['update_seconds']}s)"
+        ))
@@ -0,0 +1,73 @@
+import io
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from apps.tools.utils.profiling import QueryCollector, SerializerTimer, serializer_timer, patch_serializers, \
+    record_request
+
+TRACE_LINES = 40
+
+
+class ProfilingMiddleware:
+    """
+    Per-request wall, DB and serializer time, query count and repeated queries, aggregated per url route
+    (see apps.tools.utils.profiling). Removed from the middleware chain at startup unless PROFILING is enabled
+    """
+
+    def __init__(self, get_response):
+        if not settings.PROFILING['enabled']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.trace_sample_rate = settings.PROFILING['trace_sample_rate']
+        self.profiler = settings.PROFILING['profiler']
+        patch_serializers()
+
+    def __call__(self, request):
+        queries, timer = QueryCollector(), SerializerTimer()
+        # a trace can't be taken after the fact, so requests are sampled up front and kept when they were slow
+        profiler = self.start_profiler() if random.random() < self.trace_sample_rate else None
+        token = serializer_timer.set(timer)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+        finally:
+            wall_ms = (time.perf_counter() - started) * 1000
+            serializer_timer.reset(token)
+            trace = self.stop_profiler(profiler) if profiler else None
+
+        match = request.resolver_match
+        if match is not None:
+            record_request(match.route, match.view_name, wall_ms, queries, timer.ms, trace)
+        return response
+
+    def start_profiler(self):
+        if self.profiler == 'pyinstrument':
+            from pyinstrument import Profiler
+
+            profiler = Profiler()
+            profiler.start()
+        else:
+            import cProfile
+
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profiler(self, profiler) -> str:
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+            return profiler.output_text()
+
+        import pstats
+
+        profiler.disable()
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(TRACE_LINES)
+        return output.getvalue()
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 
 from apps.files.models import File
@@ -6,7 +7,8 @@ from apps.integrations.models import RegionEMU
 from apps.loads.models import Load
 from apps.user.models import Customer
 from config.core.choices import CAR_OR_AIR_CHOICE, DELIVERY_TYPE_CHOICE, TAKE_AWAY, NEWSLETTER_STATUS_CHOICE, \
-    NEWSLETTER_PENDING, EMU_SERVICE_CHOICE, TO_RECEIVER
+    NEWSLETTER_PENDING, EMU_SERVICE_CHOICE, TO_RECEIVER, DAILY_STAT_METRIC_CHOICE, NEWSLETTER_RECIPIENT_STATUS_CHOICE, \
+    RECIPIENT_PENDING, RECIPIENT_SENDING, RECIPIENT_SENT, RECIPIENT_FAILED
 from config.models import BaseModel
 
 
@@ -19,10 +21,49 @@ class Newsletter(BaseModel):
     photo_ru = models.ForeignKey(File, on_delete=models.SET_NULL, null=True, blank=True, related_name='newsletter_ru')
 
     status = models.CharField(choices=NEWSLETTER_STATUS_CHOICE, max_length=7, default=NEWSLETTER_PENDING)
+    photo_file_id = models.CharField(max_length=255, null=True, blank=True)  # telegram file_id after first upload
+
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    pending_count = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'Newsletter'
 
+    def refresh_counters(self):
+        """
+        Recount recipients by delivery status and store the counters
+        """
+        counters = self.recipients.aggregate(
+            sent_count=Count('id', filter=Q(status=RECIPIENT_SENT)),
+            failed_count=Count('id', filter=Q(status=RECIPIENT_FAILED)),
+            pending_count=Count('id', filter=Q(status__in=[RECIPIENT_PENDING, RECIPIENT_SENDING])),
+        )
+        for key, value in counters.items():
+            setattr(self, key, value)
+        self.save(update_fields=[*counters.keys(), 'updated_at'])
+        return counters
+
+
+class NewsletterRecipient(BaseModel):
+    newsletter = models.ForeignKey(Newsletter, on_delete=models.CASCADE, related_name='recipients')
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='newsletter_recipients')
+    tg_id = models.CharField(max_length=155)
+    status = models.CharField(choices=NEWSLETTER_RECIPIENT_STATUS_CHOICE, max_length=7, default=RECIPIENT_PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'NewsletterRecipient'
+        constraints = [
+            models.UniqueConstraint(fields=['newsletter', 'customer'], name='unique_newsletter_customer'),
+        ]
+        indexes = [
+            models.Index(fields=['newsletter', 'status'], name='newsletter_recipient_status'),
+        ]
+
 
 class Delivery(BaseModel):
     delivery_type = models.CharField("delivery type", max_length=9, choices=DELIVERY_TYPE_CHOICE,
@@ -42,3 +83,22 @@ class Delivery(BaseModel):
 
     class Meta:
         db_table = 'Delivery'
+
+
+class DailyStat(models.Model):
+    """
+    Per-day analytics rollup of Load, Payment, Customer and Product rows, grouped by local created_at date
+    """
+    date = models.DateField()
+    user_type = models.CharField("user type", max_length=4, choices=CAR_OR_AIR_CHOICE)
+    payment_type = models.CharField(max_length=5, blank=True, default='')  # only for PAYMENTS metric
+    metric = models.CharField(max_length=20, choices=DAILY_STAT_METRIC_CHOICE)
+    count = models.IntegerField(default=0)
+    total = models.FloatField(default=0)  # weight or paid_amount sum
+
+    class Meta:
+        db_table = 'DailyStat'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'user_type', 'payment_type', 'metric'],
+                                    name='unique_daily_stat'),
+        ]
@@ -66,7 +66,10 @@ class NewsletterListSerializer(serializers.ModelSerializer):
                   # 'photo_uz',
                   # 'photo_ru',
                   'status',
-                  'status_display', ]
+                  'status_display',
+                  'sent_count',
+                  'failed_count',
+                  'pending_count', ]
 
 
 class NewsletterSerializer(serializers.ModelSerializer):
@@ -81,7 +84,11 @@ class NewsletterSerializer(serializers.ModelSerializer):
                   'text_uz',
                   'text_ru',
                   'photo_uz',
-                  'photo_ru', ]
+                  'photo_ru',
+                  'status',
+                  'sent_count',
+                  'failed_count',
+                  'pending_count', ]
 
 
 class NewsletterPostSerializer(serializers.ModelSerializer):
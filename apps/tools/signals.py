@@ -0,0 +1,94 @@
+import logging
+
+import redis
+from django.db import transaction, connections
+from django.db.models.signals import post_init, post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from django.utils.timezone import localdate
+
+from apps.loads.models import Load, Product
+from apps.payment.models import Payment
+from apps.tools.tasks import refresh_daily_stats
+from apps.tools.utils.rate_limit import get_redis
+from apps.tools.utils.search import create_trigram_indexes
+from apps.user.models import Customer
+
+logger = logging.getLogger()
+
+# fields the rollups are computed from (apps.tools.utils.stats.raw_daily_stats), saves changing none of them
+# don't refresh anything
+STAT_FIELDS = {
+    Load: ['created_at', 'customer_id', 'weight', 'status'],
+    Payment: ['created_at', 'customer_id', 'paid_amount', 'payment_type'],
+    Customer: ['created_at', 'user_type'],
+    Product: ['created_at', 'customer_id', 'status'],
+}
+# set while a refresh of the day is queued, the task deletes it when it starts
+REFRESH_KEY = 'stats:refresh:{}'
+REFRESH_KEY_TTL = 10 * 60  # a lost task doesn't block the day for longer, the nightly rebuild covers the rest
+
+
+def stat_values(instance) -> tuple:
+    # from __dict__, reading a deferred field would be a query
+    return tuple(instance.__dict__.get(field) for field in STAT_FIELDS[type(instance)])
+
+
+@receiver(post_init, sender=Load)
+@receiver(post_init, sender=Payment)
+@receiver(post_init, sender=Customer)
+@receiver(post_init, sender=Product)
+def remember_stat_values(sender, instance, **kwargs):
+    instance._stat_values = stat_values(instance)
+
+
+@receiver([post_save, post_delete], sender=Load)
+@receiver([post_save, post_delete], sender=Payment)
+@receiver([post_save, post_delete], sender=Customer)
+@receiver([post_save, post_delete], sender=Product)
+def schedule_daily_stats_refresh(sender, instance, created=False, update_fields=None, **kwargs):
+    if not instance.created_at:
+        return
+    if kwargs['signal'] is post_save:
+        if update_fields is not None and not created and \
+                not {sender._meta.get_field(name).attname for name in update_fields} & set(STAT_FIELDS[sender]):
+            return
+        values = stat_values(instance)
+        changed = created or values != getattr(instance, '_stat_values', None)
+        instance._stat_values = values
+        if not changed:
+            return
+    refresh_daily_stats_on_commit([instance.created_at])
+
+
+def queue_refresh(day):
+    """
+    One refresh task per day at a time: a batch saving 2000 products of a day queues one
+    """
+    try:
+        if not get_redis().set(REFRESH_KEY.format(day), 1, nx=True, ex=REFRESH_KEY_TTL):
+            return
+    except redis.RedisError as exc:
+        logger.warning('daily stats refresh of %s is not deduplicated: %s', day, exc)
+    refresh_daily_stats.delay(day)
+
+
+def refresh_daily_stats_on_commit(created_times):
+    """
+    Refresh rollups of the local days of the given created_at values, for bulk updates which skip signals
+    """
+    for day in {localdate(created_at).isoformat() for created_at in created_times if created_at}:
+        transaction.on_commit(lambda day=day: queue_refresh(day))
+
+
+@receiver(post_migrate)
+def create_search_indexes(sender, using, **kwargs):
+    """
+    pg_trgm and the trigram search indexes (apps.tools.utils.search.TRIGRAM_INDEXES) are PostgreSQL only,
+    they are created here instead of the migrations, which must run on SQLite too
+    """
+    connection = connections[using]
+    if sender.label != 'tools' or connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    create_trigram_indexes(connection)
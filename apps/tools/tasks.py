@@ -2,42 +2,93 @@ import logging
 
 from celery import shared_task
 
+from config.core.choices import NEWSLETTER_SENT, NEWSLETTER_PENDING, NEWSLETTER_SENDING
+
 logger = logging.getLogger()
 
 
 @shared_task(name='send_newsletter')
 def send_newsletter(newsletter_id):
-    from rest_framework.generics import get_object_or_404
+    """
+    Snapshot recipients, upload the photo once and fan delivery out to chunk tasks;
+    calling it again for a SENDING newsletter resumes from the pending recipients
+    """
+    from apps.tools.models import Newsletter
+    from apps.tools.utils.newsletter import create_recipients, pending_chunks, upload_photo
+
+    newsletter = Newsletter.objects.filter(pk=newsletter_id).first()
+    if not newsletter:
+        return {'detail': f'Newsletter #{newsletter_id} not found', 'status': 404}
+    if newsletter.status == NEWSLETTER_SENT:
+        return {'detail': f'Newsletter #{newsletter_id} was sent already', 'status': 400}
+
+    if newsletter.status == NEWSLETTER_PENDING:
+        create_recipients(newsletter)
+        newsletter.status = NEWSLETTER_SENDING
+        newsletter.save(update_fields=['status', 'updated_at'])
+
+    upload_photo(newsletter)
+    chunks = 0
+    for recipient_ids in pending_chunks(newsletter):
+        send_newsletter_chunk.delay(newsletter_id, recipient_ids)
+        chunks += 1
+    if not chunks:
+        finish_newsletter(newsletter)
+    return {'detail': f'Newsletter #{newsletter_id} queued in {chunks} chunks', 'status': 200}
 
-    from apps.bot.views import avia_customer_bot, auto_customer_bot
+
+@shared_task(name='send_newsletter_chunk', acks_late=True)
+def send_newsletter_chunk(newsletter_id, recipient_ids):
     from apps.tools.models import Newsletter
-    from apps.user.models import Customer
+    from apps.tools.utils.newsletter import deliver, newsletter_photo, claim_recipient
+
+    newsletter = Newsletter.objects.filter(pk=newsletter_id).first()
+    if not newsletter:
+        return {'detail': f'Newsletter #{newsletter_id} not found', 'status': 404}
+
+    photo = newsletter_photo(newsletter)
+    for recipient_id in sorted(recipient_ids):
+        # delivered or claimed by another worker rows are skipped, so a redelivered chunk continues where it stopped
+        recipient = claim_recipient(recipient_id)
+        if recipient:
+            deliver(newsletter, recipient, photo)
+
+    finish_newsletter(newsletter)
+    return {'detail': f'Newsletter #{newsletter_id} chunk of {len(recipient_ids)} processed', 'status': 200}
 
+
+def finish_newsletter(newsletter):
+    counters = newsletter.refresh_counters()
+    if not counters['pending_count']:
+        newsletter.status = NEWSLETTER_SENT
+        newsletter.save(update_fields=['status', 'updated_at'])
+
+
+@shared_task(name='refresh_daily_stats')
+def refresh_daily_stats(day):
+    from datetime import date
+
+    import redis
+
+    from apps.tools.signals import REFRESH_KEY
+    from apps.tools.utils.rate_limit import get_redis
+    from apps.tools.utils.stats import rebuild_daily_stats
+
+    # changes committed from now on queue another refresh
     try:
-        newsletter = get_object_or_404(Newsletter, pk=newsletter_id)
-        if newsletter.status == 'SENT':
-            return {'detail': f'Newsletter #{newsletter_id} was sent already', 'status': 400}
-
-        message = newsletter.text_uz if newsletter.text_uz else newsletter.text_ru
-        photo_path = newsletter.photo_uz.path if newsletter.photo_uz else newsletter.photo_ru.path
-        photo_url = f'https://backend.gogocargo.uz/{photo_path}'
-        customers = Customer.objects.select_related('passport_photo', 'accepted_by', 'user').filter(tg_id__isnull=False)
-
-        if newsletter.bot_type == 'AVIA':
-            for customer in customers.filter(user_type='AVIA'):
-                try:
-                    avia_customer_bot.send_photo(customer.tg_id, photo_url, message)
-                except Exception as exc:
-                    continue
-        elif newsletter.bot_type == 'AUTO':
-            for customer in customers.filter(user_type='AUTO'):
-                try:
-                    auto_customer_bot.send_photo(customer.tg_id, photo_url, message)
-                except Exception as exc:
-                    continue
-
-        newsletter.status = 'SENT'
-        newsletter.save()
-        return {'detail': f'Newsletter #{newsletter_id} sent', 'status': 200}
-    except Newsletter.DoesNotExist:
-        pass
+        get_redis().delete(REFRESH_KEY.format(day))
+    except redis.RedisError as exc:
+        # queue_refresh queued this task without the key as well, the rollups are rebuilt anyway
+        logger.warning('daily stats refresh key of %s is not deleted: %s', day, exc)
+    day = date.fromisoformat(day)
+    rows = rebuild_daily_stats(day, day)
+    return {'detail': f'Daily stats of {day} refreshed, rows: {rows}', 'status': 200}
+
+
+@shared_task(name='rebuild_daily_stats')
+def rebuild_all_daily_stats():
+    from apps.tools.utils.stats import rebuild_daily_stats
+
+    rows = rebuild_daily_stats()
+    logger.info(f'Daily stats rebuilt, rows: {rows}')
+    return {'detail': f'Daily stats rebuilt, rows: {rows}', 'status': 200}
@@ -1,3 +1,52 @@
+from datetime import date
+from unittest import mock
+
+import redis
 from django.test import TestCase
 
-# Create your tests here.
+from apps.tools.tasks import refresh_daily_stats
+from apps.tools.utils.route_budgets import temporary_settings, route_scenarios, seed_route_dataset, measure, \
+    budget_key, read_budget, budget_problems
+
+
+class RouteBudgetTest(TestCase):
+    """
+    Every route called on the seeded dataset stays within its query count and time of config/perf_budget.json;
+    manage.py check_route_budgets writes the same numbers as a report or updates the budget
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        # routes read and write settings.json, they get a copy of it for the whole class
+        cls.settings_context = temporary_settings()
+        cls.settings_context.__enter__()
+        cls.addClassCleanup(cls.settings_context.__exit__, None, None, None)
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_route_dataset()
+
+    def test_routes_within_budget(self):
+        budget = read_budget()
+        self.assertTrue(budget, 'config/perf_budget.json is missing, write it with check_route_budgets --update-budget')
+        for route, spec, reason in route_scenarios():
+            if spec is None:
+                continue
+            with self.subTest(route=route):
+                result = measure(route, spec, self.data)
+                self.assertEqual(budget_problems(result, budget.get(budget_key(result))), [])
+
+    def test_budget_has_no_stale_routes(self):
+        measured = {f'{spec["method"].upper()} {route}' for route, spec, reason in route_scenarios() if spec}
+        self.assertEqual(set(read_budget()) - measured, set())
+
+
+class RefreshDailyStatsTest(TestCase):
+    @mock.patch('apps.tools.utils.stats.rebuild_daily_stats', return_value=0)
+    @mock.patch('apps.tools.utils.rate_limit.get_redis', side_effect=redis.ConnectionError('down'))
+    def test_rollups_are_rebuilt_when_redis_is_down(self, get_redis, rebuild_daily_stats):
+        with self.assertLogs(level='WARNING'):
+            refresh_daily_stats('2026-10-01')
+
+        rebuild_daily_stats.assert_called_once_with(date(2026, 10, 1), date(2026, 10, 1))
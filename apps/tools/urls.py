@@ -2,7 +2,7 @@ from django.urls import path
 
 from apps.tools.views import GetSettingsAPIView, PostSettingsAPIView, NewsletterListAPIView, NewsletterCreateAPIView, \
     NewsletterUpdateAPIView, NewsletterRetrieveAPIView, FourthDashboardAPIView, FirstDashboardAPIView, \
-    SecondDashboardAPIView, ThirdDashboardAPIView, FifthDashboardAPIView, NewsletterTestAPIView
+    SecondDashboardAPIView, ThirdDashboardAPIView, FifthDashboardAPIView, NewsletterTestAPIView, ProfilingStatsAPIView
 
 app_name = 'tool'
 urlpatterns = [
@@ -20,4 +20,5 @@ urlpatterns = [
     path('admin/dashboard/third-chart/', ThirdDashboardAPIView.as_view(), name='dashboard_third'),
     path('admin/dashboard/fourth-chart/', FourthDashboardAPIView.as_view(), name='dashboard_fourth'),
     path('admin/dashboard/fifth-chart/', FifthDashboardAPIView.as_view(), name='dashboard_fifth'),
+    path('admin/profiling/', ProfilingStatsAPIView.as_view(), name='profiling_stats'),
 ]
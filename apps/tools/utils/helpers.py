@@ -1,15 +1,19 @@
-import json
 import locale
-from collections import defaultdict
-from datetime import timedelta, datetime
+import logging
+from datetime import timedelta, datetime, time
 
+import redis
 from django.conf import settings
 from django.utils import timezone
-from django.utils.timezone import localdate
 
-from apps.tools.serializer import SettingsSerializer
 from apps.tools.tasks import send_newsletter
-from apps.user.models import Customer
+from apps.tools.utils.rate_limit import get_redis
+from apps.tools.utils.settings_store import get_validated_settings, get_settings
+from apps.user.utils.services import allocate_codes
+
+logger = logging.getLogger()
+
+PAYMENT_CARD_TURN_KEY = 'settings:payment-card-turn:{}'
 
 
 def division_return_zero(a, b):
@@ -31,88 +35,83 @@ def split_code(full_code):
     return prefix, code
 
 
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def day_filter(field, start_date=None, end_date=None) -> dict:
+    """
+    Local days as a [start, end) range over a datetime column; unlike field__date it can use an index
+    """
+    lookups = {}
+    if start_date:
+        lookups[f'{field}__gte'] = day_start(start_date)
+    if end_date:
+        lookups[f'{field}__lt'] = day_start(end_date + timedelta(days=1))
+    return lookups
+
+
 def products_accepted_today(user):
+    today = timezone.localdate()
     if user.operator.warehouse == 'CHINA':
-        count = user.products_china.filter(accepted_time_china__date=timezone.now().date()).count()
+        count = user.products_china.filter(**day_filter('accepted_time_china', today, today)).count()
     else:
-        count = user.products_tashkent.filter(accepted_time_tashkent__date=timezone.now().date()).count()
+        count = user.products_tashkent.filter(**day_filter('accepted_time_tashkent', today, today)).count()
     return count
 
 
 def loads_accepted_today(user):
+    today = timezone.localdate()
     count = (
         user.load_accepted
-        .filter(accepted_time__date=timezone.now().date())
+        .filter(**day_filter('accepted_time', today, today))
         .count()
     )
     return count if count else 0
 
 
 def get_price():
-    from apps.tools.views import settings_path
-
-    with open(settings_path, 'r') as file:
-        file_data = json.load(file)
-        settings_serializer = SettingsSerializer(data=file_data)
-        settings_serializer.is_valid(raise_exception=True)
-        settings_data = settings_serializer.validated_data
-        price = settings_data.get('price')
-        return price
+    settings_data = get_validated_settings()
+    price = settings_data.get('price')
+    return price
+
+
+def next_payment_card(user_type) -> str:
+    """
+    Cards of the user type in turn, starting at the selector of settings.json; the turn is a redis counter
+    shared by the workers, so handing out a card doesn't write the settings
+    """
+    key = 'auto' if user_type == 'AUTO' else 'avia'
+    payment_card = get_settings()['payment_card']
+    cards = payment_card[key].split(',')
+    try:
+        turn = get_redis().incr(PAYMENT_CARD_TURN_KEY.format(key)) - 1
+    except redis.RedisError as exc:
+        logger.warning('payment card turn is not available: %s', exc)
+        turn = 0
+    return cards[(payment_card[f'{key}_selector'] + turn) % len(cards)]
 
 
-def dashboard_chart_maker(objects, comparing_objects, start_date, end_date,
-                          date_weight_exists=None, date_payment_exists=None):
-    date_counts = defaultdict(int)
-    date_weight = defaultdict(int) if date_weight_exists else None
-    date_payment = defaultdict(int) if date_payment_exists else None
-    for obj in objects:
-        local_date = localdate(obj.created_at)
-        if not date_payment_exists:
-            date_counts[local_date] += 1
-            if date_weight_exists:
-                date_weight[local_date] += obj.weight
-        else:
-            paid_amount = obj.paid_amount or 0
-            date_payment[local_date] += paid_amount
-
-    c_date_counts = defaultdict(int)
-    c_date_weight = defaultdict(int) if date_weight_exists else None
-    c_date_payment = defaultdict(int) if date_payment_exists else None
-    for c_obj in comparing_objects:
-        c_local_date = localdate(c_obj.created_at)
-        if not date_payment_exists:
-            c_date_counts[c_local_date] += 1
-            if date_weight_exists:
-                c_date_weight[c_local_date] += c_obj.weight
-        else:
-            c_date_payment[c_local_date] += c_obj.paid_amount
+def date_range(start_date, end_date) -> list:
+    return [start_date + timedelta(days=x) for x in range((end_date - start_date).days + 1)]
 
-    all_dates = [start_date + timedelta(days=x) for x in range((end_date - start_date).days + 1)]
 
-    for date in all_dates:
-        if not date_payment_exists:
-            if date not in date_counts:
-                date_counts[date] = 0
-            if date_weight_exists:
-                if date not in date_weight:
-                    date_weight[date] = 0
-        else:
-            if date not in date_payment:
-                date_payment[date] = 0
+def chart_labels(dates) -> list:
+    locale.setlocale(locale.LC_TIME, settings.SET_LOCAL_LANGUAGE)
+    return [date.strftime('%b-%d').capitalize() for date in dates]
 
-    if not date_payment_exists:
-        sorted_dates = sorted(date_counts.keys())
-    else:
-        sorted_dates = sorted(date_payment.keys())
 
-    locale.setlocale(locale.LC_TIME, settings.SET_LOCAL_LANGUAGE)
-    labels = [date.strftime('%b-%d').capitalize() for date in sorted_dates]
-    if not date_payment_exists:
-        line1 = [date_counts[date] for date in sorted_dates]
-        c_line1 = [c_date_counts[date] for date in c_date_counts.keys()]
-    else:
-        line1 = [date_payment[date] for date in sorted_dates]
-        c_line1 = [c_date_payment[date] for date in c_date_payment.keys()]
+def dashboard_chart_maker(period, comparing_period, start_date, end_date,
+                          date_weight_exists=None, date_payment_exists=None):
+    """
+    period, comparing_period: {date: {'count': ..., 'sum': ...}}
+    """
+    line_key = 'sum' if date_payment_exists else 'count'
+    sorted_dates = sorted(set(date_range(start_date, end_date)) | set(period.keys()))
+
+    labels = chart_labels(sorted_dates)
+    line1 = [period[date][line_key] if date in period else 0 for date in sorted_dates]
+    c_line1 = [row[line_key] for row in comparing_period.values()]
     chart = {
         'line1': line1,
         # 'line2': line2,
@@ -122,26 +121,17 @@ def dashboard_chart_maker(objects, comparing_objects, start_date, end_date,
         'line1': sum(line1),
         'line1_percent': division_return_zero(line1, c_line1)
     }
-    if date_weight:
-        line2 = [date_weight[date] for date in sorted_dates]
-        c_line2 = [c_date_weight[date] for date in c_date_weight.keys()]
+    if date_weight_exists and sorted_dates:
+        line2 = [period[date]['sum'] if date in period else 0 for date in sorted_dates]
+        c_line2 = [row['sum'] for row in comparing_period.values()]
         chart['line2'] = line2
         totals_percent['line2'] = sum(line2)
         totals_percent['line2_percent'] = division_return_zero(line2, c_line2)
     return chart, totals_percent
 
 
-def generate_non_active_id() -> tuple:
-    prefix = 'DELETE'
-    customers = Customer.objects.filter(prefix=prefix).order_by('code')
-    codes = [int(c.code) for c in customers]
-    max_code = max(codes) if codes else 0
-    code = str(customers.count() + 1).zfill(4)
-    for i in range(1, max_code + 2):
-        if i not in codes:
-            code = str(i).zfill(4)
-            break
-    return prefix, code
+def non_active_codes(count: int) -> list:
+    return [code for prefix, code in allocate_codes('DELETE', count)]
 
 
 def create_newsletter_task(newsletter_id, schedule_time):
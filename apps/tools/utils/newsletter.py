@@ -0,0 +1,160 @@
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from telebot.apihelper import ApiTelegramException
+
+from apps.bot.utils.media import cached_file_id, remember_file_id
+from apps.bot.views import avia_customer_bot, auto_customer_bot
+from apps.files.utils import stored_path, file_sha256
+from apps.files.utils.serving import signed_url
+from apps.tools.models import Newsletter, NewsletterRecipient
+from apps.tools.utils.rate_limit import telegram_bucket, telegram_chat_bucket
+from apps.user.models import Customer
+from config.core.choices import RECIPIENT_PENDING, RECIPIENT_SENDING, RECIPIENT_SENT, RECIPIENT_FAILED
+
+logger = logging.getLogger()
+
+NEWSLETTER_CHUNK_SIZE = 300
+MAX_SEND_ATTEMPTS = 5
+UPLOAD_ATTEMPTS = 10
+# a recipient claimed for longer lost its worker (deliver gives up after a couple of minutes) and is sent again
+RECIPIENT_CLAIM_TIMEOUT = timedelta(minutes=15)
+
+newsletter_bots = {
+    'AVIA': avia_customer_bot,
+    'AUTO': auto_customer_bot,
+}
+
+
+def newsletter_message(newsletter: Newsletter) -> str:
+    return newsletter.text_uz if newsletter.text_uz else newsletter.text_ru
+
+
+def newsletter_photo(newsletter: Newsletter):
+    """
+    Cached telegram file_id, otherwise url of the photo for the first upload
+    """
+    if newsletter.photo_file_id:
+        return newsletter.photo_file_id
+    photo = newsletter.photo_uz or newsletter.photo_ru
+    if photo:
+        # telegram downloads it without a token
+        return f'https://backend.gogocargo.uz/{signed_url(photo.path)}'
+    return None
+
+
+def create_recipients(newsletter: Newsletter) -> int:
+    """
+    Snapshot customers of the bot as PENDING recipients, already created rows are kept
+    """
+    customers = (Customer.objects
+                 .filter(user_type=newsletter.bot_type, tg_id__isnull=False)
+                 .exclude(tg_id='')
+                 .values_list('id', 'tg_id'))
+    rows = [NewsletterRecipient(newsletter_id=newsletter.id, customer_id=customer_id, tg_id=tg_id)
+            for customer_id, tg_id in customers.iterator(chunk_size=2000)]
+    NewsletterRecipient.objects.bulk_create(rows, batch_size=1000, ignore_conflicts=True)
+    return len(rows)
+
+
+def claimable() -> Q:
+    return Q(status=RECIPIENT_PENDING) | Q(status=RECIPIENT_SENDING,
+                                           updated_at__lt=timezone.now() - RECIPIENT_CLAIM_TIMEOUT)
+
+
+def claim_recipient(recipient_id):
+    """
+    Mark the recipient SENDING in its own short UPDATE, so no transaction stays open while it's sent;
+    None when it was delivered or another worker has it
+    """
+    claimed = (NewsletterRecipient.objects.filter(claimable(), pk=recipient_id)
+               .update(status=RECIPIENT_SENDING, updated_at=timezone.now()))
+    return NewsletterRecipient.objects.get(pk=recipient_id) if claimed else None
+
+
+def pending_chunks(newsletter: Newsletter, chunk_size=NEWSLETTER_CHUNK_SIZE):
+    recipient_ids = list(newsletter.recipients.filter(claimable()).order_by('id')
+                         .values_list('id', flat=True))
+    for i in range(0, len(recipient_ids), chunk_size):
+        yield recipient_ids[i:i + chunk_size]
+
+
+def deliver(newsletter: Newsletter, recipient: NewsletterRecipient, photo=None):
+    """
+    Send the newsletter to one recipient within telegram rate limits and store the delivery state,
+    returns the sent message or None if delivery failed
+    """
+    bot = newsletter_bots[newsletter.bot_type]
+    message = newsletter_message(newsletter)
+    chat_bucket = telegram_chat_bucket(newsletter.bot_type, recipient.tg_id)
+    bot_bucket = telegram_bucket(newsletter.bot_type)
+
+    attempts, error = recipient.attempts, None
+    while attempts < MAX_SEND_ATTEMPTS:
+        attempts += 1
+        chat_bucket.acquire()
+        bot_bucket.acquire()
+        try:
+            if photo:
+                sent = bot.send_photo(recipient.tg_id, photo, caption=message)
+            else:
+                sent = bot.send_message(recipient.tg_id, message)
+        except ApiTelegramException as exc:
+            error = exc.description
+            if exc.error_code == 429:
+                time.sleep(exc.result_json.get('parameters', {}).get('retry_after', 1))
+                continue
+            # blocked bot, deleted account, chat not found: retrying won't help
+            break
+        except Exception as exc:
+            error = str(exc)
+            time.sleep(2 ** attempts)
+            continue
+
+        NewsletterRecipient.objects.filter(pk=recipient.pk).update(
+            status=RECIPIENT_SENT, attempts=attempts, error=None, sent_at=timezone.now()
+        )
+        return sent
+
+    logger.debug('newsletter %s to %s failed: %s', newsletter.id, recipient.tg_id, error)
+    NewsletterRecipient.objects.filter(pk=recipient.pk).update(status=RECIPIENT_FAILED, attempts=attempts, error=error)
+    return None
+
+
+def newsletter_photo_sha256(newsletter: Newsletter):
+    photo = newsletter.photo_uz or newsletter.photo_ru
+    if not photo or not photo.gen_name:
+        return None
+    # files uploaded before content addressing have no sha256 yet
+    path = stored_path(photo.gen_name)
+    return photo.sha256 or (file_sha256(path) if os.path.exists(path) else None)
+
+
+def upload_photo(newsletter: Newsletter):
+    """
+    Send to the first pending recipients until the photo is uploaded once, then keep its file_id for everyone else;
+    a photo any earlier newsletter of the bot uploaded already isn't uploaded again
+    """
+    photo = newsletter_photo(newsletter)
+    if not photo or newsletter.photo_file_id:
+        return
+    bot, sha256 = newsletter_bots[newsletter.bot_type], newsletter_photo_sha256(newsletter)
+    file_id = cached_file_id(bot, sha256) if sha256 else None
+    if file_id:
+        newsletter.photo_file_id = file_id
+        newsletter.save(update_fields=['photo_file_id', 'updated_at'])
+        return
+    recipients = newsletter.recipients.filter(status=RECIPIENT_PENDING).order_by('id')[:UPLOAD_ATTEMPTS]
+    for recipient in recipients:
+        sent = deliver(newsletter, recipient, photo)
+        if sent and sent.photo:
+            newsletter.photo_file_id = sent.photo[-1].file_id
+            newsletter.save(update_fields=['photo_file_id', 'updated_at'])
+            if sha256:
+                photo_name = (newsletter.photo_uz or newsletter.photo_ru).name
+                remember_file_id(bot, sha256, newsletter.photo_file_id, photo_name)
+            return
@@ -0,0 +1,167 @@
+import contextvars
+import json
+import logging
+import re
+import time
+from collections import Counter
+
+import redis
+from django.conf import settings
+from django.utils import timezone
+
+from apps.tools.utils.rate_limit import get_redis
+
+logger = logging.getLogger()
+
+ENDPOINTS_KEY = 'profiling:endpoints'
+ENDPOINT_KEY = 'profiling:endpoint:{}'
+DUPLICATES_KEY = 'profiling:duplicates:{}'
+TRACES_KEY = 'profiling:traces'
+TRACES_LIMIT = 50
+DUPLICATES_LIMIT = 20  # fingerprints shown per endpoint
+DUPLICATES_KEPT = 100  # the most repeated fingerprints kept per endpoint
+SQL_LENGTH = 500
+STAT_FIELDS = ['requests', 'slow', 'wall_ms', 'db_ms', 'queries', 'duplicate_queries', 'serializer_ms']
+
+# IN (%s, %s, ...) of any length is one fingerprint
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+# serializer time of the current request, None outside of profiled requests
+serializer_timer = contextvars.ContextVar('serializer_timer', default=None)
+
+
+class QueryCollector:
+    """
+    connection.execute_wrapper which counts queries, their time and repeated statements
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.db_ms = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_ms += (time.perf_counter() - started) * 1000
+            self.count += 1
+            # sql still has placeholders here, so the same statement with other params has the same fingerprint
+            self.fingerprints[IN_LIST_RE.sub('IN (...)', sql)[:SQL_LENGTH]] += 1
+
+    def duplicates(self) -> dict:
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+class SerializerTimer:
+    """
+    Time spent in outermost serializer.data calls, nested serializers are part of their parent
+    """
+
+    def __init__(self):
+        self.ms = 0.0
+        self.depth = 0
+
+
+def timed_serializer_data(data_property):
+    def data(serializer):
+        timer = serializer_timer.get()
+        if timer is None:
+            return data_property.fget(serializer)
+        timer.depth += 1
+        started = time.perf_counter()
+        try:
+            return data_property.fget(serializer)
+        finally:
+            timer.depth -= 1
+            if not timer.depth:
+                timer.ms += (time.perf_counter() - started) * 1000
+    return property(data)
+
+
+def patch_serializers():
+    """
+    Time BaseSerializer.data (Serializer.data and ListSerializer.data both go through it), done once
+    and only when profiling is enabled
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    if not getattr(BaseSerializer.data, 'profiled', False):
+        BaseSerializer.data = timed_serializer_data(BaseSerializer.data)
+        BaseSerializer.data.fget.profiled = True
+
+
+def record_request(route, name, wall_ms, queries: QueryCollector, serializer_ms, trace=None):
+    """
+    Add a request to the endpoint counters in redis, shared by every gunicorn worker; one round trip
+    """
+    slow = wall_ms >= settings.PROFILING['slow_ms']
+    duplicates = queries.duplicates()
+    key = ENDPOINT_KEY.format(route)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.sadd(ENDPOINTS_KEY, route)
+        pipe.hset(key, 'name', name or '')
+        pipe.hincrby(key, 'requests', 1)
+        pipe.hincrby(key, 'slow', int(slow))
+        pipe.hincrbyfloat(key, 'wall_ms', wall_ms)
+        pipe.hincrbyfloat(key, 'db_ms', queries.db_ms)
+        pipe.hincrby(key, 'queries', queries.count)
+        pipe.hincrby(key, 'duplicate_queries', sum(count - 1 for count in duplicates.values()))
+        pipe.hincrbyfloat(key, 'serializer_ms', serializer_ms)
+        for sql, count in duplicates.items():
+            pipe.zincrby(DUPLICATES_KEY.format(route), count - 1, sql)
+        if duplicates:
+            pipe.zremrangebyrank(DUPLICATES_KEY.format(route), 0, -DUPLICATES_KEPT - 1)
+        if trace is not None and slow:
+            pipe.lpush(TRACES_KEY, json.dumps({
+                'route': route, 'name': name, 'wall_ms': round(wall_ms, 1), 'time': timezone.now().isoformat(),
+                'trace': trace,
+            }))
+            pipe.ltrim(TRACES_KEY, 0, TRACES_LIMIT - 1)
+        pipe.execute()
+    except redis.RedisError as exc:
+        logger.warning('profiling stats of %s were not saved: %s', route, exc)
+
+
+def endpoint_stats() -> list:
+    """
+    Counters and averages of every profiled endpoint, the most expensive ones (total wall time) first
+    """
+    client = get_redis()
+    routes = sorted(route.decode() for route in client.smembers(ENDPOINTS_KEY))
+    pipe = client.pipeline(transaction=False)
+    for route in routes:
+        pipe.hgetall(ENDPOINT_KEY.format(route))
+        pipe.zrevrange(DUPLICATES_KEY.format(route), 0, DUPLICATES_LIMIT - 1, withscores=True)
+    replies = pipe.execute()
+
+    stats = []
+    for route, counters, duplicates in zip(routes, replies[::2], replies[1::2]):
+        counters = {key.decode(): value.decode() for key, value in counters.items()}
+        requests = int(counters.get('requests', 0)) or 1
+        totals = {field: float(counters.get(field, 0)) for field in STAT_FIELDS}
+        stats.append({
+            'route': route,
+            'name': counters.get('name') or None,
+            'requests': int(totals['requests']),
+            'slow': int(totals['slow']),
+            'total_wall_ms': round(totals['wall_ms'], 1),
+            **{f'avg_{field}': round(totals[field] / requests, 2)
+               for field in ['wall_ms', 'db_ms', 'queries', 'duplicate_queries', 'serializer_ms']},
+            'duplicates': [{'sql': sql.decode(), 'repeats': int(repeats)} for sql, repeats in duplicates],
+        })
+    return sorted(stats, key=lambda stat: stat['total_wall_ms'], reverse=True)
+
+
+def slow_traces(limit=TRACES_LIMIT) -> list:
+    return [json.loads(trace) for trace in get_redis().lrange(TRACES_KEY, 0, limit - 1)]
+
+
+def reset_stats():
+    client = get_redis()
+    routes = [route.decode() for route in client.smembers(ENDPOINTS_KEY)]
+    keys = [ENDPOINTS_KEY, TRACES_KEY]
+    keys += [key.format(route) for route in routes for key in [ENDPOINT_KEY, DUPLICATES_KEY]]
+    client.delete(*keys)
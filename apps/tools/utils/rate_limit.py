@@ -0,0 +1,71 @@
+import time
+
+import redis
+from django.conf import settings
+
+# Telegram Bot API limits: ~30 messages per second per bot, 1 message per second to the same chat
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+
+# refills the bucket for the time passed since the last call, then takes a token or returns seconds to wait
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+else
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+_redis_client = None
+
+
+def get_redis():
+    global _redis_client
+
+    if _redis_client is None:
+        _redis_client = redis.Redis.from_url(settings.CELERY_BROKER_URL)
+    return _redis_client
+
+
+class TokenBucket:
+    """
+    Token bucket kept in redis, so the limit is shared by every celery worker
+    """
+
+    def __init__(self, key: str, rate: float, capacity: float = None):
+        self.key = f'rate_limit:{key}'
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+
+    def try_acquire(self) -> float:
+        """
+        Take a token, returns 0 on success or seconds to wait before the next try
+        """
+        return float(self.script(keys=[self.key], args=[self.rate, self.capacity, time.time()]))
+
+    def acquire(self):
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+
+def telegram_bucket(bot_type: str) -> TokenBucket:
+    return TokenBucket(f'telegram:{bot_type}', TELEGRAM_GLOBAL_RATE)
+
+
+def telegram_chat_bucket(bot_type: str, chat_id) -> TokenBucket:
+    return TokenBucket(f'telegram:{bot_type}:{chat_id}', TELEGRAM_CHAT_RATE)
@@ -0,0 +1,360 @@
+import json
+import math
+import re
+import shutil
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from os.path import join as join_path, exists
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction, connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, URLResolver
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from apps.loads.models import Product, ManifestImport
+from apps.payment.models import Payment
+from apps.payment.utils.ledger import settle
+from apps.tools.models import Newsletter
+from apps.tools.utils import settings_store
+from apps.tools.utils.seed import seed_dataset, seed_file, seed_operator, seed_tag, SEED_PASSWORD
+from apps.user.models import Customer
+from config.core.choices import PRODUCT_ON_WAY, PRODUCT_DELIVERED, PRODUCT_LOADED, MANIFEST_DONE
+
+BUDGET_FILE = Path(settings.BASE_DIR) / 'config' / 'perf_budget.json'
+DEFAULT_CUSTOMERS = 30
+DEFAULT_REPEAT = 3
+TIME_HEADROOM = 3  # --update-budget stores measured ms times this, timings differ between machines
+MIN_TIME_BUDGET = 50
+
+# not called: they reach telegram, EMU or celery, or write to disk outside the database
+EXCLUDED_PREFIXES = {
+    'control-panel/': 'django admin',
+    '^static/': 'static files',
+    '^media/': 'media files',
+}
+EXCLUDED = {
+    'bot/webhook/avia/': 'telegram webhook',
+    'bot/webhook/auto/': 'telegram webhook',
+    'staff/customer-moderation/decline/<int:pk>/': 'sends a telegram message',
+    'staff/customer-moderation/accept/<int:pk>/': 'sends a telegram message',
+    'tool/newsletter/test/': 'sends a newsletter',
+    'tool/newsletter/create/': 'schedules a celery task',
+    'tool/newsletter/update/<int:pk>/': 'schedules a celery task',
+    'file/create/': 'writes uploaded files',
+    'file/upload-files/': 'writes uploaded files',
+    'file/upload-chunked/': 'writes uploaded files',
+    'file/upload-chunked/<uuid:pk>/': 'writes uploaded files',
+    'file/delete/<int:pk>/': 'deletes uploaded files',
+    'api/admin/delivery/manifest-import/': 'writes uploaded files',
+    'payment/customer/delivery/': 'sends a telegram message or an EMU order',
+    'tool/admin/profiling/': 'profiling stats are kept in redis',
+    'integration/emu/regions/': 'EMU api',
+    'integration/emu/districts/<str:region>/': 'EMU api',
+    'swagger<format>/': 'documentation',
+    'swagger/': 'documentation',
+}
+
+
+SEED_SETTINGS = {
+    'payment_card': {'avia': '8600000000000001,8600000000000002', 'avia_selector': 0,
+                     'auto': '8600000000000003', 'auto_selector': 0},
+    'price': {'avia': 10, 'auto': 5},
+    'address': {'avia': 'Seed address', 'auto': 'Seed address'},
+    'link': {'avia': 'https://t.me/seed', 'auto': 'https://t.me/seed'},
+    'support': {'avia': '@seed', 'auto': '@seed'},
+}
+
+
+@contextmanager
+def temporary_settings():
+    """
+    Routes read and write settings.json, the run works on a copy of it (or on SEED_SETTINGS when there is none)
+    """
+    original = settings_store.settings_path, settings_store.lock_path
+    with tempfile.TemporaryDirectory() as directory:
+        path = join_path(directory, 'settings.json')
+        if exists(settings_store.settings_path):
+            shutil.copyfile(settings_store.settings_path, path)
+        else:
+            with open(path, 'w') as file:
+                json.dump(SEED_SETTINGS, file)
+        settings_store.settings_path, settings_store.lock_path = path, f'{path}.lock'
+        try:
+            yield
+        finally:
+            settings_store.settings_path, settings_store.lock_path = original
+
+
+def scenario(method='get', customer=False, kwargs=None, query=None, data=None, setup=None, status=200):
+    """
+    How a route is called: kwargs, query and data are callables of the seeded dataset,
+    setup prepares the rows a write endpoint accepts (not counted in the measurement)
+    """
+    return {'method': method, 'customer': customer, 'kwargs': kwargs, 'query': query, 'data': data,
+            'setup': setup, 'status': status}
+
+
+def customer_code(data):
+    return f'{data["customer"].prefix}{data["customer"].code}'
+
+
+def dashboard_query(data):
+    today = timezone.localdate()
+    return {'user_type': 'AVIA', 'from': today - timedelta(days=30), 'to': today}
+
+
+def registration_data():
+    tag = seed_tag()
+    return {'tg_id': tag, 'full_name': 'Seed customer', 'phone_number': f'+{tag}', 'password': SEED_PASSWORD}
+
+
+def ready_for_release(data):
+    # fresh instances, the seeded ones are reused by the next calls after the rollback
+    Product.objects.filter(pk=data['products'][PRODUCT_DELIVERED].pk).delete()
+    settle(Customer.objects.get(pk=data['customer'].pk), load=data['load'])
+
+
+SCENARIOS = {
+    'staff/customer-moderation/retrieve/<int:pk>/': scenario(kwargs=lambda d: {'pk': d['registration'].pk}),
+    'staff/token/': scenario('post', data=lambda d: {'username': d['operator'].operator.tg_id,
+                                                     'password': SEED_PASSWORD}),
+    'staff/telegram/token/': scenario('post', data=lambda d: {'tg_id': d['operator'].operator.tg_id}),
+    'staff/token/refresh/': scenario('post', data=lambda d: {'refresh': str(RefreshToken.for_user(d['operator']))}),
+    'staff/customer-id/prefix-list/<str:user_type>/': scenario(kwargs=lambda d: {'user_type': 'AVIA'}),
+    'staff/customer/avia/registration/step-one/': scenario('post', data=lambda d: registration_data(), status=201),
+    'staff/customer/avia/registration/step-two/<int:pk>/': scenario(
+        'patch', kwargs=lambda d: {'pk': d['customer'].user_id},
+        data=lambda d: {'passport_photo': seed_file().pk, 'birth_date': '1990-01-01',
+                        'passport_serial_number': 'AA1234567'}),
+    'staff/customer/avia/registration/step-three/<int:pk>/': scenario(
+        'patch', kwargs=lambda d: {'pk': d['customer'].user_id}, data=lambda d: {'files': [seed_file().pk]}),
+    'staff/customer/auto/registration/step-one/': scenario('post', data=lambda d: registration_data(), status=201),
+    'staff/customer/auto/registration/step-two/<int:pk>/': scenario(
+        'patch', kwargs=lambda d: {'pk': d['customer'].user_id}, data=lambda d: {'files': [seed_file().pk]}),
+    'staff/customer/settings/password/update/': scenario('patch', customer=True,
+                                                         data=lambda d: {'password': SEED_PASSWORD}),
+    'staff/customer/settings/personal/update/': scenario('patch', customer=True,
+                                                         data=lambda d: {'full_name': 'Seed customer'}),
+    'staff/^users/(?P<pk>[^/.]+)/$': scenario(kwargs=lambda d: {'pk': d['operator'].pk}),
+    'staff/^customers/(?P<pk>[^/.]+)/$': scenario(kwargs=lambda d: {'pk': d['customer'].user_id}),
+    'api/open/product/<str:barcode>/': scenario(kwargs=lambda d: {'barcode': d['products'][PRODUCT_ON_WAY].barcode}),
+    'api/admin/delivery/product-add/': scenario('post', data=lambda d: {'barcode': f'SEED{seed_tag()}',
+                                                                        'customer_id': customer_code(d)},
+                                                status=201),
+    'api/admin/delivery/product-update/<int:pk>/': scenario(
+        'patch', kwargs=lambda d: {'pk': d['products'][PRODUCT_ON_WAY].pk}, data=lambda d: {'is_homeless': False}),
+    'api/admin/delivery/product-delete/<int:pk>/': scenario(
+        'delete', kwargs=lambda d: {'pk': d['products'][PRODUCT_ON_WAY].pk}, status=204),
+    'api/admin/delivery/manifest-import/<int:pk>/': scenario(kwargs=lambda d: {'pk': d['manifest'].pk}),
+    'api/admin/loads/retrieve/<int:pk>/': scenario(kwargs=lambda d: {'pk': d['load'].pk}),
+    'api/admin/loads/update/<int:pk>/': scenario('patch', kwargs=lambda d: {'pk': d['load'].pk},
+                                                 data=lambda d: {'customer_id': customer_code(d),
+                                                                 'status': 'NOT_PAID'}),
+    'api/operator/china/barcode-connection/': scenario('post', data=lambda d: {'barcode': f'SEED{seed_tag()}',
+                                                                               'customer_id': customer_code(d)},
+                                                       status=201),
+    'api/operator/china/barcode-connection/batch/': scenario('post', data=lambda d: {'products': [
+        {'barcode': f'SEED{seed_tag()}', 'customer_id': customer_code(d)} for _ in range(20)
+    ]}),
+    'api/operator/tashkent/accept-product/<str:barcode>/': scenario(
+        'post', kwargs=lambda d: {'barcode': d['products'][PRODUCT_ON_WAY].barcode}),
+    'api/operator/tashkent/accept-products/': scenario(
+        'post', data=lambda d: {'barcodes': list(Product.objects.filter(status=PRODUCT_ON_WAY)
+                                                 .values_list('barcode', flat=True)[:100])}),
+    'api/operator/tashkent/load-info/': scenario('post', data=lambda d: {'customer_id': customer_code(d),
+                                                                         'weight': 2}),
+    'api/operator/tashkent/add-load/': scenario('post', data=lambda d: {
+        'customer_id': customer_code(d), 'weight': 1, 'products': [d['products'][PRODUCT_DELIVERED].pk],
+        'image': seed_file().pk,
+    }, status=201),
+    'api/operator/tashkent/release/load-info/<str:customer_id>/': scenario(
+        kwargs=lambda d: {'customer_id': customer_code(d)}),
+    'api/operator/tashkent/release/payment/<str:customer_id>/': scenario(
+        'post', kwargs=lambda d: {'customer_id': customer_code(d)}, data=lambda d: {'payment_type': 'CASH'}),
+    'api/operator/tashkent/release/<str:customer_id>/': scenario(
+        'post', kwargs=lambda d: {'customer_id': customer_code(d)}, setup=ready_for_release),
+    'api/operator/tashkent/moderation/get-application/<str:application_id>/': scenario(
+        kwargs=lambda d: {'application_id': d['pending_payment'].pk}),
+    'api/operator/tashkent/moderation/apply-application/<str:application_id>/': scenario(
+        'post', kwargs=lambda d: {'application_id': d['pending_payment'].pk}),
+    'api/operator/tashkent/moderation/decline-application/<str:application_id>/': scenario(
+        'post', kwargs=lambda d: {'application_id': d['pending_payment'].pk},
+        data=lambda d: {'comment': 'Seed', 'paid_amount': 5}),
+    'api/customer/track/product/<str:barcode>/': scenario(
+        customer=True, kwargs=lambda d: {'barcode': d['products'][PRODUCT_LOADED].barcode}),
+    'tool/newsletter/retrieve/<int:pk>/': scenario(kwargs=lambda d: {'pk': d['newsletter'].pk}),
+    'tool/admin/dashboard/first-chart/': scenario(query=dashboard_query),
+    'tool/admin/dashboard/second-chart/': scenario(query=dashboard_query),
+    'tool/admin/dashboard/third-chart/': scenario(query=lambda d: {**dashboard_query(d), 'payment_type': 'CARD'}),
+    'tool/admin/dashboard/fourth-chart/': scenario(query=dashboard_query),
+    'tool/admin/dashboard/fifth-chart/': scenario(query=dashboard_query),
+    'tool/post-settings/': scenario('post', data=lambda d: {'price': {'avia': 12, 'auto': 6}}),
+    'payment/admin/apply/<int:payment_id>/': scenario('patch',
+                                                      kwargs=lambda d: {'payment_id': d['pending_payment'].pk}),
+    'payment/admin/decline/<int:payment_id>/': scenario(
+        'patch', kwargs=lambda d: {'payment_id': d['pending_payment'].pk},
+        data=lambda d: {'comment': 'Seed', 'paid_amount': 5}),
+    'payment/customer/load-payment/': scenario('post', customer=True, data=lambda d: {
+        'load': d['load'].pk, 'image': seed_file().pk, 'payment_card': '8600000000000000',
+    }, setup=lambda d: Payment.objects.filter(pk=d['pending_payment'].pk).delete(), status=201),
+}
+
+
+def routes(patterns=None, prefix=''):
+    """
+    (route, callback) of every url, format suffix duplicates and static files left out
+    """
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from routes(pattern.url_patterns, route)
+        elif 'format' not in pattern.pattern.regex.groupindex:
+            yield route, pattern.callback
+
+
+def allowed_methods(callback) -> list:
+    actions = getattr(callback, 'actions', None)
+    if actions:
+        return list(actions)
+    view_class = getattr(callback, 'view_class', None) or getattr(callback, 'cls', None)
+    return [method for method in getattr(view_class, 'http_method_names', []) if hasattr(view_class, method)
+            and method not in ('options', 'head')]
+
+
+def route_path(route, kwargs) -> str:
+    path = re.sub(r'<(?:\w+:)?(\w+)>|\(\?P<(\w+)>[^)]*\)',
+                  lambda match: str(kwargs[match.group(1) or match.group(2)]), route)
+    return '/' + path.replace('^', '').replace('$', '')
+
+
+def default_scenario(route, callback):
+    """
+    Parameterless GET routes need no scenario, /customer/ ones are called as a customer
+    """
+    if re.search(r'<|\(\?P', route) or 'get' not in allowed_methods(callback):
+        return None
+    return scenario(customer='customer' in route.split('/'))
+
+
+def route_scenarios():
+    """
+    (route, scenario, skip reason) of every route, the scenario is None for the skipped ones;
+    admin, static and media routes are left out
+    """
+    for route, callback in routes():
+        if route.startswith(tuple(EXCLUDED_PREFIXES)):
+            continue
+        spec = SCENARIOS.get(route) or default_scenario(route, callback)
+        excluded = EXCLUDED.get(route)
+        if excluded or spec is None:
+            yield route, None, excluded or 'no scenario'
+        else:
+            yield route, spec, None
+
+
+def seed_route_dataset(count=DEFAULT_CUSTOMERS) -> dict:
+    """
+    seed_dataset with a Tashkent telegram operator, a done manifest import and a newsletter
+    """
+    operator = seed_operator('TELEGRAM', 'TASHKENT')
+    data = seed_dataset(count, operator=operator)
+    data['manifest'] = ManifestImport.objects.create(file=seed_file(), created_by=operator, status=MANIFEST_DONE)
+    data['newsletter'] = Newsletter.objects.create(bot_type='AVIA', text_uz='Seed', text_ru='Seed',
+                                                   send_date=timezone.now())
+    return data
+
+
+def measure(route, spec, data, repeat=DEFAULT_REPEAT) -> dict:
+    """
+    Call the route repeat + 1 times, every call rolled back; returns the status, the query count of the last call
+    and the median time of all but the first, which warms up imports and caches
+    """
+    client = APIClient()
+    client.raise_request_exception = False
+    client.force_authenticate(user=data['customer'].user if spec['customer'] else data['operator'])
+
+    queries, timings, status_code = None, [], None
+    for attempt in range(repeat + 1):
+        with transaction.atomic():
+            if spec['setup']:
+                spec['setup'](data)
+            path = route_path(route, spec['kwargs'](data) if spec['kwargs'] else {})
+            body = spec['data'](data) if spec['data'] else None
+            query = spec['query'](data) if spec['query'] else None
+            call = getattr(client, spec['method'])
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = call(path, query) if spec['method'] == 'get' else call(path, body, format='json')
+                if getattr(response, 'streaming', False):
+                    b''.join(response.streaming_content)
+                elapsed = (time.perf_counter() - started) * 1000
+            transaction.set_rollback(True)
+        if attempt:
+            timings.append(elapsed)
+            queries = len(context.captured_queries)
+        status_code = response.status_code
+
+    return {'route': route, 'method': spec['method'].upper(), 'status': status_code,
+            'expected_status': spec['status'], 'queries': queries, 'ms': statistics.median(timings)}
+
+
+def budget_key(result) -> str:
+    return f'{result["method"]} {result["route"]}'
+
+
+def read_budget() -> dict:
+    return json.loads(BUDGET_FILE.read_text()) if BUDGET_FILE.exists() else {}
+
+
+def write_budget(results) -> int:
+    budget = {budget_key(result): {
+        'queries': result['queries'],
+        'ms': max(math.ceil(result['ms'] * TIME_HEADROOM), MIN_TIME_BUDGET),
+    } for result in results}
+    BUDGET_FILE.write_text(json.dumps(budget, indent=2, sort_keys=True) + '\n')
+    return len(budget)
+
+
+def budget_problems(result, limits, updating=False) -> list:
+    """
+    What is wrong with a measured result against its budget entry (None when the route has none)
+    """
+    problems = []
+    if result['status'] != result['expected_status']:
+        problems.append(f'status {result["status"]}, expected {result["expected_status"]}')
+    if limits is None:
+        if not updating:
+            problems.append('no budget')
+    else:
+        result['budget'] = limits
+        if result['queries'] > limits['queries']:
+            problems.append(f'{result["queries"]} queries > {limits["queries"]}')
+        if result['ms'] > limits['ms']:
+            problems.append(f'{result["ms"]:.0f} ms > {limits["ms"]}')
+    result['problems'] = problems
+    return problems
+
+
+def report(results, skipped, failures) -> str:
+    lines = [
+        '# Route performance report', '',
+        f'{timezone.localtime():%Y-%m-%d %H:%M}, {connection.vendor}, '
+        f'{len(results)} routes measured, {len(failures)} failed, {len(skipped)} skipped', '',
+        '| Route | Method | Status | Queries | Query budget | ms | ms budget | Result |',
+        '|---|---|---|---|---|---|---|---|',
+    ]
+    for result in results:
+        limits = result.get('budget', {})
+        lines.append(f'| `{result["route"]}` | {result["method"]} | {result["status"]} | {result["queries"]} '
+                     f'| {limits.get("queries", "-")} | {result["ms"]:.1f} | {limits.get("ms", "-")} '
+                     f'| {"; ".join(result["problems"]) or "ok"} |')
+    lines += ['', '## Skipped', '', '| Route | Reason |', '|---|---|']
+    lines += [f'| `{route}` | {reason} |' for route, reason in skipped]
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,105 @@
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast, Concat, Upper
+
+from apps.loads.models import Product
+from apps.user.models import Customer, User
+from config.core.choices import PREFIX_CHOICES
+
+PREFIXES = {prefix for prefix, label in PREFIX_CHOICES}
+CUSTOMER_CODE_RE = re.compile(r'([A-Z]+)(\d+)')
+NUMBER_RE = re.compile(r'\d+([.,]\d+)?')
+# icontains is rendered as UPPER("col"::text) LIKE UPPER(...), the indexes have the same expressions.
+# gin_trgm_ops exists only in PostgreSQL, so they are created after migrate (apps.tools.signals) instead of Meta.indexes
+TRIGRAM_INDEXES = [
+    (Product, GinIndex(OpClass(Upper(Cast('barcode', TextField())), name='gin_trgm_ops'), name='product_barcode_trgm')),
+    (User, GinIndex(OpClass(Upper(Cast('full_name', TextField())), name='gin_trgm_ops'), name='user_full_name_trgm')),
+    (Customer, GinIndex(OpClass(Upper(Cast('phone_number', TextField())), name='gin_trgm_ops'),
+                        name='customer_phone_trgm')),
+    (Customer, GinIndex(OpClass(Upper(Cast(Concat('prefix', 'code'), TextField())), name='gin_trgm_ops'),
+                        name='customer_code_trgm')),
+]
+
+
+def create_trigram_indexes(connection):
+    """
+    Create the missing TRIGRAM_INDEXES, PostgreSQL only
+    """
+    tables = set(connection.introspection.table_names())
+    with connection.schema_editor() as editor:
+        for model, index in TRIGRAM_INDEXES:
+            if model._meta.db_table not in tables:
+                continue
+            sql = str(index.create_sql(model, editor))
+            editor.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+
+
+def customer_code(term):
+    """
+    (prefix, code) if the search term is a full customer code like HVP0001 or hvp1, otherwise None
+    """
+    match = CUSTOMER_CODE_RE.fullmatch(term.strip().upper())
+    if match and match.group(1) in PREFIXES:
+        return match.group(1), match.group(2)
+    return None
+
+
+def exact_customer_ids(term, field='id') -> list:
+    """
+    Exact match fast path over the (prefix, code) unique index, empty if the term is not a code of anybody
+    (a partial code like HVP00 then goes through the trigram search)
+    """
+    code = customer_code(term)
+    if not code:
+        return []
+    prefix, code = code
+    # codes are stored zero padded (0001), operators often type them without zeros
+    return list(Customer.objects.filter(prefix=prefix, code__in={code, code.zfill(4)}).values_list(field, flat=True))
+
+
+def numeric_range(term):
+    """
+    [low, high) of numbers which start with the typed digits: 12 -> [12, 13), 12.5 -> [12.5, 12.6)
+    """
+    term = term.strip().replace(',', '.')
+    if not NUMBER_RE.fullmatch(term):
+        return None
+    try:
+        low = Decimal(term)
+    except InvalidOperation:
+        return None
+    return low, low + Decimal(1).scaleb(low.as_tuple().exponent)
+
+
+def numeric_q(term, *fields) -> Q:
+    """
+    Range predicates instead of icontains on number columns, which casts every row to text
+    """
+    bounds = numeric_range(term)
+    q = Q(pk__in=[])
+    if bounds:
+        for field in fields:
+            q |= Q(**{f'{field}__gte': bounds[0], f'{field}__lt': bounds[1]})
+    return q
+
+
+def customer_ids(term, phone=False, extra=None, field='id') -> list:
+    """
+    Ids of customers whose code contains the term (or phone number and extra conditions when asked),
+    resolved in a query of their own so callers filter on an indexed id column instead of OR across a join
+    """
+    # the expression is the same as in TRIGRAM_INDEXES, otherwise the trigram index is not used
+    q = Q(customer_code__icontains=term)
+    if phone:
+        q |= Q(phone_number__icontains=term)
+    if extra is not None:
+        q |= extra
+    return list(Customer.objects.annotate(customer_code=Concat('prefix', 'code')).filter(q)
+                .values_list(field, flat=True))
+
+
+def user_ids(term) -> list:
+    return list(User.objects.filter(full_name__icontains=term).values_list('id', flat=True))
@@ -0,0 +1,111 @@
+import random
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+
+from apps.files.models import File
+from apps.loads.models import Product, Load, LoadAccepted
+from apps.payment.models import Payment
+from apps.payment.utils.ledger import charge
+from apps.tools.models import Delivery
+from apps.user.models import User, Customer, CustomerRegistration, Operator
+from apps.user.utils.services import allocate_codes
+from config.core.choices import PRODUCT_ON_WAY, PRODUCT_DELIVERED, PRODUCT_LOADED, PRODUCT_DONE
+
+SEED_PASSWORD = 'seed-password'
+
+
+def seed_tag() -> str:
+    return str(uuid.uuid4().int)[:12]
+
+
+def seed_file(**kwargs) -> File:
+    gen_name = f'{seed_tag()}.jpg'
+    return File.objects.create(name='seed.jpg', gen_name=gen_name, size=1, path=f'/media/{gen_name}',
+                               content_type='image/jpeg', extension='jpg', **kwargs)
+
+
+def seed_operator(operator_type='WEB', warehouse=None, superuser=True) -> User:
+    tag = seed_tag()
+    user = User.objects.create_user(username=f'seed-operator-{tag}', password=SEED_PASSWORD,
+                                    full_name='Seed operator', is_superuser=superuser)
+    Operator.objects.create(user=user, tg_id=f'seed-{tag}', operator_type=operator_type, warehouse=warehouse)
+    return user
+
+
+def seed_customer(user_type='AVIA', operator=None) -> Customer:
+    tag = seed_tag()
+    user = User.objects.create(username=f'seed-customer-{tag}', full_name=f'Seed customer {tag}')
+    prefix, code = allocate_codes(user_type)[0]
+    return Customer.objects.create(user=user, prefix=prefix, code=code, user_type=user_type, tg_id=f'seed-{tag}',
+                                   phone_number=f'+{tag}', accepted_by=operator, accepted_time=timezone.now())
+
+
+def seed_customer_rows(customer: Customer, operator: User) -> dict:
+    """
+    What a customer typically has: a done registration, products in every status,
+    an active charged load with a delivery, a released load and a pending and a processed payment
+    """
+    registration = CustomerRegistration.objects.create(customer=customer, done=True)
+    seed_file(customer_registration=registration)
+
+    tag = seed_tag()
+    products = {status: Product.objects.create(barcode=f'SEED{tag}{status}', customer=customer, status=status,
+                                               accepted_by_china=operator, accepted_time_china=timezone.now())
+                for status in [PRODUCT_ON_WAY, PRODUCT_DELIVERED, PRODUCT_LOADED, PRODUCT_DONE]}
+    seed_file(china_product=products[PRODUCT_ON_WAY])
+
+    load = Load.objects.create(customer=customer, weight=2, cost=20, accepted_by=operator,
+                               accepted_time=timezone.now())
+    load.products.add(products[PRODUCT_LOADED])
+    seed_file(loads=load)
+    LoadAccepted.objects.create(load=load, accepted_by=operator, accepted_time=timezone.now())
+    charge(customer, load.cost, load=load, operator=operator)
+    Delivery.objects.create(customer=customer, load=load, address='Seed address', phone_number='+998900000000',
+                            message_sent=True)
+
+    done_load = Load.objects.create(customer=customer, weight=1, cost=10, status='DONE', is_active=False)
+    done_load.products.add(products[PRODUCT_DONE])
+
+    pending = Payment.objects.create(customer=customer, load=load, paid_amount=5, residue=15)
+    seed_file(payments=pending)
+    processed = Payment.objects.create(customer=customer, load=done_load, paid_amount=10, residue=0,
+                                       status=Payment.SUCCESSFUL, operator=operator)
+    return {'registration': registration, 'products': products, 'load': load, 'done_load': done_load,
+            'pending_payment': pending, 'processed_payment': processed}
+
+
+def seed_dataset(count, operator=None) -> dict:
+    """
+    count customers with seed_customer_rows, alternately AVIA and AUTO;
+    the rows of the first customer are returned to build requests with
+    """
+    operator = operator or seed_operator()
+    customers, first = [], None
+    for i in range(count):
+        customer = seed_customer('AVIA' if i % 2 == 0 else 'AUTO', operator=operator)
+        rows = seed_customer_rows(customer, operator)
+        customers.append(customer)
+        first = first or {'customer': customer, **rows}
+    return {'operator': operator, 'customers': customers, **(first or {})}
+
+
+def seed_load_history(customers, rows, days) -> int:
+    """
+    rows loads of the given customers spread over the last days, bulk created a day at a time;
+    created_at is set by an UPDATE as bulk_create fills auto_now_add fields with the current time
+    """
+    now, created = timezone.now(), 0
+    for day in range(days):
+        count = rows // days + (1 if day < rows % days else 0)
+        loads = Load.objects.bulk_create([
+            Load(customer=random.choice(customers), weight=round(random.uniform(0.5, 30), 2), is_active=False,
+                 cost=round(random.uniform(5, 300), 2), status='DONE')
+            for _ in range(count)
+        ], batch_size=5000)
+        if loads:
+            Load.objects.filter(id__gte=loads[0].id, id__lte=loads[-1].id).update(
+                created_at=now - timedelta(days=day, minutes=random.randint(0, 600)))
+        created += count
+    return created
@@ -0,0 +1,88 @@
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from os.path import join as join_path, dirname, exists
+
+from django.conf import settings
+
+from apps.tools.serializer import SettingsSerializer
+
+settings_path = join_path(settings.BASE_DIR, 'apps', 'tools', 'settings.json')
+lock_path = f'{settings_path}.lock'
+
+_snapshot = {'version': None, 'data': None, 'validated': None}
+_snapshot_lock = threading.Lock()
+
+
+def file_version(stat_result) -> tuple:
+    # os.replace gives the file a new inode, so every write changes the version for all workers
+    return stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_size
+
+
+def load_snapshot() -> dict:
+    """
+    Parsed settings.json, re-read only when the file on disk was replaced
+    """
+    global _snapshot
+
+    snapshot = _snapshot
+    if snapshot['version'] == file_version(os.stat(settings_path)):
+        return snapshot
+    with _snapshot_lock:
+        with open(settings_path, 'r') as file:
+            version = file_version(os.fstat(file.fileno()))
+            if _snapshot['version'] != version:
+                _snapshot = {'version': version, 'data': json.load(file), 'validated': None}
+        return _snapshot
+
+
+def get_settings() -> dict:
+    return copy.deepcopy(load_snapshot()['data'])
+
+
+def get_validated_settings() -> dict:
+    snapshot = load_snapshot()
+    if snapshot['validated'] is None:
+        serializer = SettingsSerializer(data=snapshot['data'])
+        serializer.is_valid(raise_exception=True)
+        snapshot['validated'] = serializer.validated_data
+    return copy.deepcopy(snapshot['validated'])
+
+
+def write_settings(data: dict) -> None:
+    """
+    Replace settings.json atomically (temp file + rename), readers never see a half-written file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=dirname(settings_path), prefix='.settings.', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(data, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        if exists(settings_path):
+            os.chmod(tmp_path, os.stat(settings_path).st_mode & 0o777)
+        os.replace(tmp_path, settings_path)
+    except BaseException:
+        if exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def settings_transaction():
+    """
+    Read-modify-write of settings.json, exclusive across gunicorn workers;
+    yields settings dict which is written back on exit
+    """
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            data = get_settings()
+            yield data
+            write_settings(data)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,153 @@
+from django.db import transaction
+from django.db.models import Count, Sum, Value, F, Q
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from apps.loads.models import Load, Product
+from apps.payment.models import Payment
+from apps.tools.models import DailyStat
+from apps.tools.utils.helpers import date_range, chart_labels, day_filter
+from apps.user.models import Customer
+from config.core.choices import (STAT_LOADS, STAT_LOADS_DONE, STAT_PAYMENTS, STAT_CUSTOMERS, STAT_PRODUCTS_ON_WAY,
+                                 STAT_PRODUCTS_DELIVERED, STAT_PRODUCTS_LOADED, STAT_PRODUCTS_DONE, PRODUCT_ON_WAY,
+                                 PRODUCT_DELIVERED, PRODUCT_LOADED, PRODUCT_DONE, LOAD_DONE, LOAD_DONE_MAIL)
+
+
+PRODUCT_STATUS_STATS = {
+    PRODUCT_ON_WAY: STAT_PRODUCTS_ON_WAY,
+    PRODUCT_DELIVERED: STAT_PRODUCTS_DELIVERED,
+    PRODUCT_LOADED: STAT_PRODUCTS_LOADED,
+    PRODUCT_DONE: STAT_PRODUCTS_DONE,
+}
+DASHBOARD_STATUS_KEYS = {
+    PRODUCT_ON_WAY: 'china',
+    PRODUCT_DELIVERED: 'tashkent',
+    PRODUCT_LOADED: 'waiting_delivery',
+    PRODUCT_DONE: 'done',
+}
+STAT_KEY_FIELDS = ['date', 'user_type', 'payment_type', 'metric']
+
+
+def period_filter(queryset, start_date=None, end_date=None, field='created_at'):
+    if queryset.model._meta.get_field(field).get_internal_type() == 'DateTimeField':
+        return queryset.filter(**day_filter(field, start_date, end_date))
+    if start_date:
+        queryset = queryset.filter(**{f'{field}__gte': start_date})
+    if end_date:
+        queryset = queryset.filter(**{f'{field}__lte': end_date})
+    return queryset
+
+
+def group_by_day(queryset, user_type_field, sum_field=None, extra_fields=()):
+    """
+    Group rows by local created_at date and user type in one query
+    """
+    aggregations = {'count': Count('id')}
+    if sum_field:
+        aggregations['total'] = Coalesce(Sum(sum_field), Value(0.0))
+    return (
+        queryset
+        .filter(**{f'{user_type_field}__isnull': False})
+        .annotate(day=TruncDate('created_at', tzinfo=timezone.get_current_timezone()),
+                  stat_user_type=F(user_type_field))
+        .order_by()
+        .values('day', 'stat_user_type', *extra_fields)
+        .annotate(**aggregations)
+    )
+
+
+def raw_daily_stats(start_date=None, end_date=None) -> dict:
+    """
+    Compute rollups from raw tables, returns {(date, user_type, payment_type, metric): {'count': ..., 'total': ...}}
+    """
+    loads = period_filter(Load.objects.all(), start_date, end_date)
+    sources = [
+        (STAT_LOADS, group_by_day(loads, 'customer__user_type', 'weight')),
+        (STAT_LOADS_DONE, group_by_day(loads.filter(status__in=[LOAD_DONE, LOAD_DONE_MAIL]),
+                                       'customer__user_type', 'weight')),
+        (STAT_PAYMENTS, group_by_day(period_filter(Payment.objects.all(), start_date, end_date),
+                                     'customer__user_type', 'paid_amount', extra_fields=['payment_type'])),
+        (STAT_CUSTOMERS, group_by_day(period_filter(Customer.objects.all(), start_date, end_date), 'user_type')),
+        (None, group_by_day(period_filter(Product.objects.all(), start_date, end_date),
+                            'customer__user_type', extra_fields=['status'])),
+    ]
+    stats = {}
+    for metric, rows in sources:
+        for row in rows:
+            key = (row['day'], row['stat_user_type'], row.get('payment_type', ''),
+                   metric or PRODUCT_STATUS_STATS[row['status']])
+            stats[key] = {'count': row['count'], 'total': row.get('total', 0)}
+    return stats
+
+
+def rebuild_daily_stats(start_date=None, end_date=None) -> int:
+    """
+    Recompute DailyStat rows of the given period (whole history if no period was given)
+    """
+    stats = raw_daily_stats(start_date, end_date)
+    rows = [DailyStat(**dict(zip(STAT_KEY_FIELDS, key)), **value) for key, value in stats.items()]
+    with transaction.atomic():
+        existing = period_filter(DailyStat.objects.all(), start_date, end_date, field='date')
+        existing.update(count=0, total=0)
+        DailyStat.objects.bulk_create(rows, batch_size=1000, update_conflicts=True,
+                                      unique_fields=STAT_KEY_FIELDS, update_fields=['count', 'total'])
+        existing.filter(count=0).delete()
+    return len(rows)
+
+
+def check_daily_stats(start_date=None, end_date=None) -> list:
+    """
+    Compare DailyStat rows with raw tables, returns list of mismatched keys
+    """
+    raw = raw_daily_stats(start_date, end_date)
+    stored = {
+        tuple(row[field] for field in STAT_KEY_FIELDS): {'count': row['count'], 'total': row['total']}
+        for row in period_filter(DailyStat.objects.all(), start_date, end_date, field='date').values()
+    }
+    mismatches = []
+    for key in sorted(set(raw.keys()) | set(stored.keys())):
+        expected = raw.get(key, {'count': 0, 'total': 0})
+        actual = stored.get(key, {'count': 0, 'total': 0})
+        if expected['count'] != actual['count'] or abs(expected['total'] - actual['total']) > 0.001:
+            mismatches.append({
+                **dict(zip(STAT_KEY_FIELDS, key)),
+                'expected': expected,
+                'actual': actual,
+            })
+    return mismatches
+
+
+def daily_stats(metric, user_type, start_date, end_date, payment_type=None) -> dict:
+    """
+    Read rollups of a metric, returns {date: {'count': ..., 'sum': ...}} for dashboard_chart_maker
+    """
+    queryset = period_filter(DailyStat.objects.filter(metric=metric, user_type=user_type),
+                             start_date, end_date, field='date')
+    if payment_type:
+        queryset = queryset.filter(payment_type=payment_type)
+    rows = queryset.values('date').annotate(day_count=Sum('count'), day_total=Sum('total')).order_by()
+    return {row['date']: {'count': row['day_count'], 'sum': row['day_total']} for row in rows}
+
+
+def status_histogram(user_type, statuses, start_date, end_date, per_day=False) -> dict:
+    """
+    Count products of every requested status in a single scan of the rollups (Sum with filter=Q(metric=...)),
+    per_day=True groups the same scan by date
+    """
+    aggregations = {
+        DASHBOARD_STATUS_KEYS[s]: Coalesce(Sum('count', filter=Q(metric=PRODUCT_STATUS_STATS[s])), 0)
+        for s in statuses
+    }
+    queryset = period_filter(
+        DailyStat.objects.filter(user_type=user_type, metric__in=[PRODUCT_STATUS_STATS[s] for s in statuses]),
+        start_date, end_date, field='date'
+    )
+    if not per_day:
+        return queryset.aggregate(**aggregations)
+
+    days = {row['date']: row for row in queryset.values('date').annotate(**aggregations).order_by()}
+    sorted_dates = date_range(start_date, end_date)
+    chart = {'labels': chart_labels(sorted_dates)}
+    for key in aggregations.keys():
+        chart[key] = [days[date][key] if date in days else 0 for date in sorted_dates]
+    return chart
@@ -1,7 +1,5 @@
-import json
 from collections import defaultdict
 from datetime import datetime
-from os.path import join as join_path
 
 from django.conf import settings
 from django.utils.timezone import localdate
@@ -14,20 +12,19 @@ from rest_framework.generics import ListAPIView, CreateAPIView, UpdateAPIView, R
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.loads.models import Load, Product
-from apps.payment.models import Payment
 from apps.tools.models import Newsletter
 from apps.tools.serializer import SettingsSerializer, NewsletterListSerializer, NewsletterSerializer, \
     NewsletterPostSerializer
 from apps.tools.tasks import send_newsletter
 from apps.tools.utils.helpers import dashboard_chart_maker
-from apps.user.models import Customer
+from apps.tools.utils.profiling import endpoint_stats, slow_traces, reset_stats
+from apps.tools.utils.settings_store import get_validated_settings, settings_transaction
+from apps.tools.utils.stats import daily_stats, status_histogram, DASHBOARD_STATUS_KEYS
 from config.core.api_exceptions import APIValidation
+from config.core.choices import STAT_LOADS, STAT_LOADS_DONE, STAT_PAYMENTS, STAT_CUSTOMERS
 from config.core.pagination import APIPagination
 from config.core.permissions.web import IsWebOperator
 
-settings_path = join_path(settings.BASE_DIR, 'apps', 'tools', 'settings.json')
-
 
 class GetSettingsAPIView(APIView):
     permission_classes = [IsWebOperator, ]
@@ -35,11 +32,7 @@ class GetSettingsAPIView(APIView):
 
     @swagger_auto_schema(responses={status.HTTP_200_OK: SettingsSerializer})
     def get(self, request, *args, **kwargs):
-        with open(settings_path, 'r') as file:
-            settings_data = json.load(file)
-            serializer = self.serializer_class(data=settings_data)
-            serializer.is_valid(raise_exception=True)
-            return Response(serializer.validated_data)
+        return Response(get_validated_settings())
 
 
 class PostSettingsAPIView(APIView):
@@ -48,15 +41,12 @@ class PostSettingsAPIView(APIView):
 
     @swagger_auto_schema(request_body=SettingsSerializer)
     def post(self, request, *args, **kwargs):
-        with open(settings_path, 'r') as file:
-            existing_settings = json.load(file)
+        with settings_transaction() as existing_settings:
             serializer = self.serializer_class(data=request.data, context={'settings_data': existing_settings})
             serializer.is_valid(raise_exception=True)
-        with open(settings_path, 'w') as new_file:
             new_settings = dict(serializer.data)
             if new_settings:
                 existing_settings.update(new_settings)
-            json.dump(existing_settings, new_file, indent=2)
         existing_settings['payment_card'].pop('avia_selector')
         existing_settings['payment_card'].pop('auto_selector')
         return Response(existing_settings)
@@ -109,17 +99,8 @@ class FirstDashboardAPIView(APIView):
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             comparing_start_date = start_date - (end_date - start_date)
             comparing_end_date = end_date - (end_date - start_date)
-            loads = (Load.objects
-                     .select_related('customer', 'accepted_by')
-                     .prefetch_related('products')
-                     .filter(created_at__date__gte=from_date, created_at__date__lte=to_date,
-                             customer__user_type=user_type))
-            comparing_loads = (Load.objects
-                               .select_related('customer', 'accepted_by')
-                               .prefetch_related('products')
-                               .filter(created_at__date__gte=comparing_start_date,
-                                       created_at__date__lte=comparing_end_date,
-                                       customer__user_type=user_type))
+            loads = daily_stats(STAT_LOADS, user_type, start_date, end_date)
+            comparing_loads = daily_stats(STAT_LOADS, user_type, comparing_start_date, comparing_end_date)
 
             chart, totals = dashboard_chart_maker(loads, comparing_loads, start_date, end_date, date_weight_exists=True)
         else:
@@ -146,17 +127,8 @@ class SecondDashboardAPIView(APIView):
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             comparing_start_date = start_date - (end_date - start_date)
             comparing_end_date = end_date - (end_date - start_date)
-            loads = (Load.objects
-                     .select_related('customer', 'accepted_by')
-                     .prefetch_related('products')
-                     .filter(created_at__date__gte=from_date, created_at__date__lte=to_date,
-                             customer__user_type=user_type, status__in=['DONE', 'DONE_MAIL']))
-            comparing_loads = (Load.objects
-                               .select_related('customer', 'accepted_by')
-                               .prefetch_related('products')
-                               .filter(created_at__date__gte=comparing_start_date,
-                                       created_at__date__lte=comparing_end_date,
-                                       customer__user_type=user_type, status__in=['DONE', 'DONE_MAIL']))
+            loads = daily_stats(STAT_LOADS_DONE, user_type, start_date, end_date)
+            comparing_loads = daily_stats(STAT_LOADS_DONE, user_type, comparing_start_date, comparing_end_date)
 
             chart, totals = dashboard_chart_maker(loads, comparing_loads, start_date, end_date, date_weight_exists=True)
         else:
@@ -186,15 +158,9 @@ class ThirdDashboardAPIView(APIView):
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             comparing_start_date = start_date - (end_date - start_date)
             comparing_end_date = end_date - (end_date - start_date)
-            payments = (Payment.objects
-                        .select_related('customer', 'operator', 'load')
-                        .filter(created_at__date__gte=from_date, created_at__date__lte=to_date,
-                                customer__user_type=user_type, payment_type=payment_type))
-            comparing_payments = (Payment.objects
-                                  .select_related('customer', 'operator', 'load')
-                                  .filter(created_at__date__gte=comparing_start_date,
-                                          created_at__date__lte=comparing_end_date,
-                                          customer__user_type=user_type, payment_type=payment_type))
+            payments = daily_stats(STAT_PAYMENTS, user_type, start_date, end_date, payment_type=payment_type)
+            comparing_payments = daily_stats(STAT_PAYMENTS, user_type, comparing_start_date, comparing_end_date,
+                                             payment_type=payment_type)
 
             chart, totals = dashboard_chart_maker(payments, comparing_payments, start_date, end_date,
                                                   date_weight_exists=False, date_payment_exists=True)
@@ -222,13 +188,8 @@ class FourthDashboardAPIView(APIView):
             end_date = datetime.strptime(to_date, '%Y-%m-%d').date()
             comparing_start_date = start_date - (end_date - start_date)
             comparing_end_date = end_date - (end_date - start_date)
-            customers = (Customer.objects
-                         .select_related('passport_photo', 'accepted_by', 'user')
-                         .filter(created_at__date__gte=from_date, created_at__date__lte=to_date, user_type=user_type))
-            comparing_customers = (Customer.objects
-                                   .select_related('passport_photo', 'accepted_by', 'user')
-                                   .filter(created_at__date__gte=comparing_start_date,
-                                           created_at__date__lte=comparing_end_date, user_type=user_type))
+            customers = daily_stats(STAT_CUSTOMERS, user_type, start_date, end_date)
+            comparing_customers = daily_stats(STAT_CUSTOMERS, user_type, comparing_start_date, comparing_end_date)
 
             chart, totals = dashboard_chart_maker(customers, comparing_customers, start_date, end_date,
                                                   date_weight_exists=False)
@@ -244,6 +205,10 @@ class FifthDashboardAPIView(APIView):
         Parameter('user_type', IN_QUERY, description="Type of User: AVIA or AUTO", type=TYPE_STRING, required=True),
         Parameter('from', IN_QUERY, description="From, Date format: 2024-01-25", type=TYPE_STRING, required=True),
         Parameter('to', IN_QUERY, description="To, Date format: 2024-01-25", type=TYPE_STRING, required=True),
+        Parameter('statuses', IN_QUERY, description="Comma separated product statuses: ON_WAY,DELIVERED,LOADED,DONE",
+                  type=TYPE_STRING, required=False),
+        Parameter('per_day', IN_QUERY, description="Breakdown by day: true or false", type=TYPE_STRING,
+                  required=False),
     ])
     # @method_decorator(cache_page(60 * 60 * 1))  # cache for an hour
     # @method_decorator(vary_on_cookie)
@@ -252,37 +217,16 @@ class FifthDashboardAPIView(APIView):
         from_date = request.query_params.get('from')
         to_date = request.query_params.get('to')
         if from_date and to_date and user_type:
-            products = (
-                Product.objects
-                .select_related('customer', 'accepted_by_china', 'accepted_by_tashkent')
-                .filter(customer__user_type=user_type, created_at__date__gte=from_date, created_at__date__lte=to_date)
-            )
-            china = (
-                products
-                .filter(status='ON_WAY')
-                .count()
-            )
-            tashkent = (
-                products
-                .filter(status='DELIVERED')
-                .count()
-            )
-            waiting_delivery = (
-                products
-                .filter(status='LOADED')
-                .count()
-            )
-            done = (
-                products
-                .filter(status='DONE')
-                .count()
-            )
-            chart = {
-                'china': china,
-                'tashkent': tashkent,
-                'waiting_delivery': waiting_delivery,
-                'done': done
-            }
+            statuses = request.query_params.get('statuses')
+            statuses = statuses.split(',') if statuses else list(DASHBOARD_STATUS_KEYS.keys())
+            if not set(statuses) <= set(DASHBOARD_STATUS_KEYS.keys()):
+                raise APIValidation(f'statuses accepts only: {", ".join(DASHBOARD_STATUS_KEYS.keys())}',
+                                    status_code=status.HTTP_400_BAD_REQUEST)
+            per_day = request.query_params.get('per_day') in ['1', 'true', 'True']
+            chart = status_histogram(user_type, statuses,
+                                     start_date=datetime.strptime(from_date, '%Y-%m-%d').date(),
+                                     end_date=datetime.strptime(to_date, '%Y-%m-%d').date(),
+                                     per_day=per_day)
         else:
             raise APIValidation('Some of query params was missed', status_code=status.HTTP_400_BAD_REQUEST)
         return Response(chart)
@@ -292,3 +236,21 @@ class NewsletterTestAPIView(APIView):
     def get(self, request):
         send_newsletter(newsletter_id=1)
         return Response('OK')
+
+
+class ProfilingStatsAPIView(APIView):
+    permission_classes = [IsWebOperator, ]
+
+    @swagger_auto_schema(manual_parameters=[
+        Parameter('traces', IN_QUERY, description="Include sampled traces of slow requests: 1", type=TYPE_STRING),
+    ])
+    def get(self, request, *args, **kwargs):
+        response = {'enabled': settings.PROFILING['enabled'], 'slow_ms': settings.PROFILING['slow_ms'],
+                    'endpoints': endpoint_stats()}
+        if request.query_params.get('traces') == '1':
+            response['traces'] = slow_traces()
+        return Response(response)
+
+    def delete(self, request, *args, **kwargs):
+        reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -2,7 +2,7 @@ from django.db.models import Q
 from django_filters import FilterSet, ChoiceFilter
 from rest_framework.filters import SearchFilter
 
-from apps.tools.utils.helpers import split_code
+from apps.tools.utils.search import exact_customer_ids, customer_ids, user_ids, numeric_q
 from apps.user.models import User, CustomerRegistration
 from config.core.choices import WEB_OR_TELEGRAM_CHOICE, WAREHOUSE_CHOICE
 
@@ -33,34 +33,31 @@ class CustomerModerationFilter(FilterSet):
 
 class CustomerSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_param = request.query_params.get('search', '')
+        search_param = request.query_params.get('search', '').strip()
         if search_param:
-            prefix, code = split_code(search_param)
+            exact = exact_customer_ids(search_param, field='user_id')
+            if exact:
+                return queryset.filter(id__in=exact)
             queryset = queryset.filter(
-                Q(customer__phone_number__icontains=search_param) |
                 Q(full_name__icontains=search_param) |
-                Q(
-                    Q(customer__prefix__icontains=prefix) &
-                    Q(customer__code__icontains=code)
-                )
+                Q(id__in=customer_ids(search_param, phone=True, field='user_id'))
             )
         return queryset
 
 
 class CustomerModerationSearchFilter(SearchFilter):
     def filter_queryset(self, request, queryset, view):
-        search_param = request.query_params.get('search', '')
+        search_param = request.query_params.get('search', '').strip()
         if search_param:
-            prefix, code = split_code(search_param)
-            queryset = queryset.filter(
-                Q(customer__user_type__icontains=search_param) |
-                Q(customer__phone_number__icontains=search_param) |
-                Q(customer__debt__icontains=search_param) |
-                Q(customer__user__full_name__icontains=search_param) |
-                Q(customer__accepted_by__full_name__icontains=search_param) |
-                Q(
-                    Q(customer__prefix__icontains=prefix) &
-                    Q(customer__code__icontains=code)
-                )
-            )
+            exact = exact_customer_ids(search_param)
+            if exact:
+                return queryset.filter(customer_id__in=exact)
+            users = user_ids(search_param)
+            queryset = queryset.filter(customer_id__in=customer_ids(
+                search_param, phone=True,
+                extra=(Q(user_type__icontains=search_param) |
+                       numeric_q(search_param, 'debt') |
+                       Q(user_id__in=users) |
+                       Q(accepted_by_id__in=users))
+            ))
         return queryset
@@ -39,7 +39,7 @@ class User(AbstractUser):
 class Customer(BaseModel):
     prefix = models.CharField("prefix", max_length=6, choices=PREFIX_CHOICES, null=True, blank=True)
     code = models.CharField(max_length=255, null=True, blank=True)
-    debt = models.FloatField(default=0)
+    debt = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # cached sum of ledger entries
     phone_number = models.CharField(_("phone number"), max_length=35, null=True, blank=True)
     tg_id = models.CharField(max_length=155, null=True, blank=True)
     language = models.CharField(max_length=2, choices=settings.LANGUAGES, default='uz')
@@ -69,6 +69,19 @@ class Customer(BaseModel):
                 fields=['user_type', 'phone_number'], name='unique_user_type_phone_number'
             ),
         ]
+        # trigram indexes of phone_number and prefix||code are PostgreSQL only, apps.tools.utils.search.TRIGRAM_INDEXES
+        indexes = [
+            # bot handlers look customers up by chat id and bot
+            models.Index(fields=['tg_id', 'user_type'], name='customer_tg_user_type'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # debt is written only by the ledger (apps/payment/utils/ledger.py),
+        # a plain save must not put back a stale value
+        if not self._state.adding and not kwargs.get('update_fields') and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name != 'debt']
+        super().save(*args, **kwargs)
 
 
 class Operator(BaseModel):
@@ -95,3 +108,29 @@ class CustomerRegistration(BaseModel):
     # registration_screenshots on File model
     class Meta:
         db_table = 'CustomerRegistration'
+
+
+class CodeSequence(models.Model):
+    """
+    Customer code allocation state: current prefix and the highest code handed out under it
+    """
+    name = models.CharField(max_length=6, unique=True)  # user type or DELETE
+    prefix = models.CharField("prefix", max_length=6, choices=PREFIX_CHOICES)
+    last_code = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'CodeSequence'
+
+
+class FreeCode(models.Model):
+    """
+    Released codes below last_code of a prefix, handed out again before the sequence grows
+    """
+    prefix = models.CharField("prefix", max_length=6, choices=PREFIX_CHOICES)
+    code = models.IntegerField()
+
+    class Meta:
+        db_table = 'FreeCode'
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'code'], name='unique_free_code'),
+        ]
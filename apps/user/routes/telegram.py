@@ -1,13 +1,11 @@
-import json
-
 from rest_framework import status
 from rest_framework.generics import CreateAPIView, UpdateAPIView, RetrieveAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.tools.utils.helpers import get_price
-from apps.tools.views import settings_path
+from apps.tools.utils.helpers import get_price, next_payment_card
+from apps.tools.utils.settings_store import get_settings
 from apps.user.models import User
 from apps.user.serializers.telegram import (CustomerAviaRegistrationStepOneSerializer,
                                             CustomerAviaRegistrationStepTwoSerializer,
@@ -97,7 +95,8 @@ class CustomerStatAPIView(APIView):
             # weight = 0
             # load = customer.loads.filter(is_active=True).exclude(status='PAID')
             debt = customer.debt
-            price_per_kg = get_price().get('auto') if customer.user_type == 'AUTO' else get_price().get('avia')
+            price = get_price()
+            price_per_kg = price.get('auto') if customer.user_type == 'AUTO' else price.get('avia')
             weight = 0
             if price_per_kg != 0:
                 weight = round((debt / price_per_kg), 2)
@@ -120,32 +119,7 @@ class CustomerPaymentCardAPIView(APIView):
 
     def get(self, request, *args, **kwargs):
         try:
-            user_type = request.user.customer.user_type
-            with open(settings_path, 'r') as file:
-                file_data = json.load(file)
-                avia_selector = file_data['payment_card']['avia_selector']
-                auto_selector = file_data['payment_card']['auto_selector']
-                if user_type == 'AUTO':
-                    try:
-                        auto_selector = file_data['payment_card']['auto_selector']
-                        returning_card = file_data['payment_card']['auto'].split(',')[auto_selector]
-                    except IndexError:
-                        auto_selector = 0
-                        returning_card = file_data['payment_card']['auto'].split(',')[auto_selector]
-                    auto_selector += 1
-                else:
-                    try:
-                        avia_selector = file_data['payment_card']['avia_selector']
-                        returning_card = file_data['payment_card']['avia'].split(',')[avia_selector]
-                    except IndexError:
-                        avia_selector = 0
-                        returning_card = file_data['payment_card']['avia'].split(',')[avia_selector]
-                    avia_selector += 1
-            with open(settings_path, 'w') as new_file:
-                file_data['payment_card']['avia_selector'] = avia_selector
-                file_data['payment_card']['auto_selector'] = auto_selector
-                json.dump(file_data, new_file, indent=2)
-            return Response({'payment_card': returning_card})
+            return Response({'payment_card': next_payment_card(request.user.customer.user_type)})
         except Exception as exc:
             raise APIValidation(f'Error occurred: {exc.args}', status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -156,13 +130,12 @@ class CustomerCompanyAddressAPIView(APIView):
     def get(self, request, *args, **kwargs):
         try:
             user_type = request.user.customer.user_type
-            with open(settings_path, 'r') as file:
-                file_data = json.load(file)
-                if user_type == 'AUTO':
-                    response = {'address': file_data['address']['auto']}
-                else:
-                    response = {'address': file_data['address']['avia']}
-                return Response(response)
+            file_data = get_settings()
+            if user_type == 'AUTO':
+                response = {'address': file_data['address']['auto']}
+            else:
+                response = {'address': file_data['address']['avia']}
+            return Response(response)
         except Exception as exc:
             raise APIValidation(f'Error occurred: {exc.args}', status_code=status.HTTP_400_BAD_REQUEST)
 
@@ -173,20 +146,19 @@ class CustomerFooterAPIView(APIView):
     def get(self, request, *args, **kwargs):
         try:
             user_type = request.user.customer.user_type
-            with open(settings_path, 'r') as file:
-                file_data = json.load(file)
-                if user_type == 'AUTO':
-                    response = {
-                        'address': file_data['address']['auto'],
-                        'channel': file_data['link']['auto'],
-                        'support': file_data['support']['auto'],
-                    }
-                else:
-                    response = {
-                        'address': file_data['address']['avia'],
-                        'channel': file_data['link']['avia'],
-                        'support': file_data['support']['avia'],
-                    }
-                return Response(response)
+            file_data = get_settings()
+            if user_type == 'AUTO':
+                response = {
+                    'address': file_data['address']['auto'],
+                    'channel': file_data['link']['auto'],
+                    'support': file_data['support']['auto'],
+                }
+            else:
+                response = {
+                    'address': file_data['address']['avia'],
+                    'channel': file_data['link']['avia'],
+                    'support': file_data['support']['avia'],
+                }
+            return Response(response)
         except Exception as exc:
             raise APIValidation(f'Error occurred: {exc.args}', status_code=status.HTTP_400_BAD_REQUEST)
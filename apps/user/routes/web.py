@@ -1,3 +1,5 @@
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg.utils import swagger_auto_schema
@@ -10,8 +12,7 @@ from rest_framework.views import APIView
 from apps.bot.templates.text import reg_moderation_accept_uz, reg_moderation_accept_ru, reg_moderation_decline_ru, \
     reg_moderation_decline_uz, customer_menu_instruction_ru, customer_menu_instruction_uz
 from apps.bot.utils.keyboards import reg_link_web_app_keyboard, copy_customer_id_keyboard
-from apps.bot.utils.tools import send_instruction
-from apps.bot.views import avia_customer_bot, auto_customer_bot
+from apps.bot.utils.outbound import queue_message
 from apps.files.models import File
 from apps.user.filter import UserStaffFilter, CustomerModerationFilter, CustomerSearchFilter, \
     CustomerModerationSearchFilter
@@ -21,14 +22,16 @@ from apps.user.serializers.web import (PostUserSerializer, GetUserSerializer, Po
                                        PostResponseCustomerSerializer, PostResponseUserSerializer,
                                        CustomerModerationListSerializer, CustomerModerationRetrieveSerializer,
                                        CustomerModerationDeclineSerializer, CustomerModerationAcceptSerializer)
+from apps.user.utils.services import release_code
 from config.core.api_exceptions import APIValidation
+from config.core.choices import OUTBOUND_SEND_INSTRUCTION
 from config.core.pagination import APIPagination
 from config.core.permissions import IsOperator
 from config.views import ModelViewSetPack
 
 
 class UserModelViewSet(ModelViewSetPack):
-    queryset = User.objects.filter(operator__isnull=False)
+    queryset = User.objects.select_related('operator').filter(operator__isnull=False)
     serializer_class = GetUserSerializer
     permission_classes = [IsOperator, ]
     post_serializer_class = PostUserSerializer
@@ -69,7 +72,9 @@ class UserModelViewSet(ModelViewSetPack):
 
 
 class CustomerModelViewSet(ModelViewSetPack):
-    queryset = User.objects.filter(customer__isnull=False, is_active=True)
+    queryset = (User.objects
+                .select_related('customer', 'customer__accepted_by', 'customer__passport_photo')
+                .filter(customer__isnull=False, is_active=True))
     serializer_class = GetCustomerSerializer
     permission_classes = [IsOperator, ]
     post_serializer_class = PostCustomerSerializer
@@ -78,6 +83,17 @@ class CustomerModelViewSet(ModelViewSetPack):
     search_fields = ['customer__user_type', 'customer__prefix', 'customer__code', 'full_name', 'customer__phone_number',
                      'customer__debt']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('retrieve', 'update', 'partial_update'):
+            # loads and customer_info of RetrieveCustomerSerializer / PostResponseCustomerSerializer, both joins
+            # are counted, so the counts are distinct
+            queryset = queryset.prefetch_related('customer__loads').annotate(
+                on_way_count=Count('customer__products', filter=Q(customer__products__status='ON_WAY'), distinct=True),
+                loads_count=Count('customer__loads', distinct=True),
+            )
+        return queryset
+
     def get_serializer(self, *args, **kwargs):
         if self.action == 'retrieve':
             return RetrieveCustomerSerializer(args[0])
@@ -134,7 +150,10 @@ class CustomerIDPrefix(APIView):
 
 
 class CustomerModerationListAPIView(ListAPIView):
-    queryset = CustomerRegistration.objects.select_related('customer').filter(done=True).order_by('-id')
+    queryset = (CustomerRegistration.objects
+                .select_related('customer__user', 'customer__accepted_by')
+                .prefetch_related('files')
+                .filter(done=True).order_by('-id'))
     serializer_class = CustomerModerationListSerializer
     permission_classes = [IsOperator, ]
     pagination_class = APIPagination
@@ -145,7 +164,10 @@ class CustomerModerationListAPIView(ListAPIView):
 
 
 class CustomerModerationRetrieveAPIView(RetrieveAPIView):
-    queryset = CustomerRegistration.objects.select_related('customer').filter(done=True)
+    queryset = (CustomerRegistration.objects
+                .select_related('customer__user', 'customer__accepted_by', 'customer__passport_photo')
+                .prefetch_related('files')
+                .filter(done=True))
     serializer_class = CustomerModerationRetrieveSerializer
     permission_classes = [IsOperator, ]
 
@@ -169,10 +191,12 @@ class CustomerModerationDeclineAPIView(APIView):
         customer_registration.customer.save()
 
         customer = customer_registration.customer
+        prefix, code = customer.prefix, customer.code
         customer.prefix = None
         customer.code = None
         customer.phone_number = customer.phone_number + ' '
         customer.save()
+        release_code(prefix, code)
 
         response_serializer = CustomerModerationRetrieveSerializer(instance=customer_registration)
         response = response_serializer.data
@@ -180,10 +204,7 @@ class CustomerModerationDeclineAPIView(APIView):
             message = reg_moderation_decline_uz.format(reject_message=customer_registration.reject_message)
         else:
             message = reg_moderation_decline_ru.format(reject_message=customer_registration.reject_message)
-        if customer.user_type == 'AUTO':
-            auto_customer_bot.send_message(chat_id=customer.tg_id, text=message)
-        elif customer.user_type == 'AVIA':
-            avia_customer_bot.send_message(chat_id=customer.tg_id, text=message)
+        queue_message(customer.user_type, customer.tg_id, text=message)
         return Response(response)
 
 
@@ -212,12 +233,6 @@ class CustomerModerationAcceptAPIView(APIView):
         customer.birth_date = data.get('birth_date', customer.birth_date)
         customer.passport_serial_number = data.get('passport_serial_number', customer.passport_serial_number)
         customer.passport_photo_id = data.get('passport_photo', customer.passport_photo_id)
-        user.save()
-        customer.save()
-        customer_registration.save()
-
-        response_serializer = CustomerModerationRetrieveSerializer(instance=customer_registration)
-        response = response_serializer.data
         if customer.language == 'uz':
             message = reg_moderation_accept_uz.format(customer_id=f'{customer.prefix}{customer.code}')
             instruction_message = customer_menu_instruction_uz
@@ -228,16 +243,17 @@ class CustomerModerationAcceptAPIView(APIView):
             instruction_message = customer_menu_instruction_ru
             loader_text = "Файл отправляется..."
             file_name = "Руководство (Клиент).mp4"
-        if customer.user_type == 'AUTO':
-            auto_customer_bot.send_message(chat_id=customer.tg_id, text=message, parse_mode='MarkdownV2')
-
-            send_instruction(message=customer.tg_id, bot=auto_customer_bot, caption=instruction_message,
-                             file_name=file_name, loader_text=loader_text,
-                             keyboard=reg_link_web_app_keyboard('https://auto.gogocargo.uz', customer.language, True))
-        elif customer.user_type == 'AVIA':
-            avia_customer_bot.send_message(chat_id=customer.tg_id, text=message, parse_mode='MarkdownV2')
-
-            send_instruction(message=customer.tg_id, bot=avia_customer_bot, caption=instruction_message,
-                             file_name=file_name, loader_text=loader_text,
-                             keyboard=reg_link_web_app_keyboard('https://avia.gogocargo.uz', customer.language, True))
-        return Response(response)
+        web_app_link = 'https://auto.gogocargo.uz' if customer.user_type == 'AUTO' else 'https://avia.gogocargo.uz'
+        # the messages are queued when the acceptance commits, the instruction one after the first is stored
+        with transaction.atomic():
+            user.save()
+            customer.save()
+            customer_registration.save()
+            accepted_message = queue_message(customer.user_type, customer.tg_id, text=message,
+                                             parse_mode='MarkdownV2')
+            queue_message(customer.user_type, customer.tg_id, OUTBOUND_SEND_INSTRUCTION, previous=accepted_message,
+                          caption=instruction_message, file_name=file_name, loader_text=loader_text,
+                          keyboard=reg_link_web_app_keyboard(web_app_link, customer.language, True))
+
+        response_serializer = CustomerModerationRetrieveSerializer(instance=customer_registration)
+        return Response(response_serializer.data)
@@ -1,3 +1,4 @@
+from django.db import transaction
 from rest_framework import serializers, status
 from django.utils.translation import gettext_lazy as _
 
@@ -61,9 +62,10 @@ class CustomerAviaRegistrationStepOneSerializer(serializers.ModelSerializer):
             deleted_customer.is_data_transferred = True
             deleted_customer.save()
         else:
-            prefix, code = generate_code({'user_type': 'AVIA'})
-            customer = Customer.objects.create(user_id=instance.id, prefix=prefix, code=code,
-                                               user_type='AVIA', **customer_data)
+            with transaction.atomic():
+                prefix, code = generate_code({'user_type': 'AVIA'})
+                customer = Customer.objects.create(user_id=instance.id, prefix=prefix, code=code,
+                                                   user_type='AVIA', **customer_data)
         instance.customer_id = customer.id
         instance.is_active = False
         instance.set_password(password)
@@ -186,9 +188,10 @@ class CustomerAutoRegistrationStepOneSerializer(serializers.ModelSerializer):
             deleted_customer.is_data_transferred = True
             deleted_customer.save()
         else:
-            prefix, code = generate_code({'user_type': 'AUTO'})
-            customer = Customer.objects.create(user_id=instance.id, prefix=prefix, code=code,
-                                               user_type='AUTO', **customer_data)
+            with transaction.atomic():
+                prefix, code = generate_code({'user_type': 'AUTO'})
+                customer = Customer.objects.create(user_id=instance.id, prefix=prefix, code=code,
+                                                   user_type='AUTO', **customer_data)
         instance.customer_id = customer.id
         instance.is_active = False
         instance.set_password(password)
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from django.db import transaction
 from rest_framework import serializers, status
 
 from apps.files.models import File
@@ -114,6 +115,23 @@ class PostResponseUserSerializer(serializers.ModelSerializer):
 
 
 # CUSTOMERS
+def customer_info(obj: User) -> dict:
+    """
+    CustomerModelViewSet annotates on_way_count and loads_count, other callers count them with a query
+    """
+    on_way = getattr(obj, 'on_way_count', None)
+    if on_way is None:
+        on_way = obj.customer.products.filter(status='ON_WAY').count()
+    loads = getattr(obj, 'loads_count', None)
+    if loads is None:
+        loads = obj.customer.loads.count()
+    return {
+        'on_way': on_way,
+        'loads': loads,
+        'debt': obj.customer.debt,
+    }
+
+
 class GetCustomerSerializer(serializers.ModelSerializer):
     debt = serializers.CharField(source='customer.debt', allow_null=True)
     customer_code = serializers.SerializerMethodField(allow_null=True)
@@ -166,11 +184,7 @@ class RetrieveCustomerSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_customer_info(obj: User):
-        return {
-            'on_way': obj.customer.products.filter(status='ON_WAY').count(),
-            'loads': obj.customer.loads.count(),
-            'debt': obj.customer.debt,
-        }
+        return customer_info(obj)
 
     class Meta:
         model = User
@@ -215,11 +229,7 @@ class PostResponseCustomerSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_customer_info(obj: User):
-        return {
-            'on_way': obj.customer.products.filter(status='ON_WAY').count(),
-            'loads': obj.customer.loads.count(),
-            'debt': obj.customer.debt,
-        }
+        return customer_info(obj)
 
     @staticmethod
     def get_customer_code(obj):
@@ -273,14 +283,15 @@ class PostCustomerSerializer(serializers.ModelSerializer):
 
             request = self.context.get('request')
             customer_data = validated_data.pop('customer', {})
-            prefix, code = generate_code(customer_data)
+            with transaction.atomic():
+                prefix, code = generate_code(customer_data)
 
-            user = super().create(validated_data)
-            user.set_password(user_password)
-            user.save()
+                user = super().create(validated_data)
+                user.set_password(user_password)
+                user.save()
 
-            Customer.objects.create(user=user, prefix=prefix, code=code, accepted_time=datetime.now(),
-                                    accepted_by=request.user, **customer_data)
+                Customer.objects.create(user=user, prefix=prefix, code=code, accepted_time=datetime.now(),
+                                        accepted_by=request.user, **customer_data)
             return user
         except Exception as exc:
             if 'user' in locals() and user:
@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from apps.user.models import Customer
+from apps.user.utils.services import release_code
+
+
+@receiver(post_delete, sender=Customer)
+def release_customer_code(sender, instance, **kwargs):
+    release_code(instance.prefix, instance.code)
+    if instance.prefix == 'DELETE' and not instance.is_data_transferred:
+        release_code(instance.ex_prefix, instance.ex_code)
@@ -1,3 +1,77 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from apps.user.models import User, Customer
+from apps.user.utils import services
+from apps.user.utils.services import allocate_codes, release_code
+
+THREADS = 8
+
+
+def register(number, user_type='AVIA') -> tuple:
+    # what a registration does: the code is allocated and the customer created in one transaction
+    try:
+        with transaction.atomic():
+            prefix, code = allocate_codes(user_type)[0]
+            user = User.objects.create(username=f'stress-{user_type}-{number}')
+            Customer.objects.create(user=user, user_type=user_type, prefix=prefix, code=code)
+        return prefix, code
+    finally:
+        # every thread has its own connection
+        connection.close()
+
+
+# the rollups refresh after every customer save goes to redis and celery, which the test doesn't run
+@mock.patch('apps.tools.signals.queue_refresh')
+@skipUnlessDBFeature('has_select_for_update')
+class AllocateCodesConcurrencyTest(TransactionTestCase):
+    def register_in_parallel(self, numbers, user_type='AVIA') -> list:
+        with ThreadPoolExecutor(THREADS) as pool:
+            return list(pool.map(lambda number: register(number, user_type), numbers))
+
+    def assertUniqueCodes(self):
+        codes = list(Customer.objects.values_list('prefix', 'code'))
+        self.assertEqual(len(codes), len(set(codes)))
+
+    def test_parallel_registrations_get_unique_consecutive_codes(self, queue_refresh):
+        codes = self.register_in_parallel(range(300))
+
+        self.assertEqual(len(set(codes)), 300)
+        self.assertEqual({prefix for prefix, code in codes}, {'HVP'})
+        self.assertEqual(sorted(int(code) for prefix, code in codes), list(range(1, 301)))
+        self.assertUniqueCodes()
+
+    def test_released_codes_are_handed_out_once(self, queue_refresh):
+        self.register_in_parallel(range(100))
+        released = Customer.objects.filter(code__in=[str(code).zfill(4) for code in range(10, 40)])
+        for prefix, code in released.values_list('prefix', 'code'):
+            release_code(prefix, code)
+        released.delete()
+
+        codes = self.register_in_parallel(range(100, 160))
+
+        self.assertEqual(sorted(int(code) for prefix, code in codes), list(range(10, 40)) + list(range(101, 131)))
+        self.assertUniqueCodes()
+
+    def test_parallel_registrations_roll_over_to_the_next_prefix(self, queue_refresh):
+        with mock.patch.object(services, 'PREFIX_CAPACITY', 40):
+            codes = self.register_in_parallel(range(100))
+
+        per_prefix = {prefix: sorted(int(code) for code_prefix, code in codes if code_prefix == prefix)
+                      for prefix in {prefix for prefix, code in codes}}
+        self.assertEqual(per_prefix, {'HVP': list(range(1, 41)), 'LXE': list(range(1, 41)),
+                                      'GZG': list(range(1, 21))})
+        self.assertUniqueCodes()
+
+    def test_user_types_have_separate_sequences(self, queue_refresh):
+        with ThreadPoolExecutor(THREADS) as pool:
+            avia = pool.map(lambda number: register(number, 'AVIA'), range(50))
+            auto = pool.map(lambda number: register(number, 'AUTO'), range(50))
+            avia, auto = list(avia), list(auto)
+
+        self.assertEqual({prefix for prefix, code in avia}, {'HVP'})
+        self.assertEqual({prefix for prefix, code in auto}, {'WSC'})
+        self.assertUniqueCodes()
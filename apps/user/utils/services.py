@@ -2,10 +2,13 @@ from rest_framework import status
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
+from django.db import transaction
 
-from apps.user.models import Customer
+from apps.user.models import Customer, CodeSequence, FreeCode
 from config.core.api_exceptions import APIValidation
 
+PREFIX_CAPACITY = 3000
+
 
 def start_prefix(user_type):
     if user_type == 'AUTO':
@@ -29,36 +32,89 @@ def next_prefix(last_prefix, user_type):
         raise APIValidation('user_type must be AUTO or AVIA')
 
 
+def prefix_codes(prefix, with_reserved=True) -> set:
+    """
+    Codes taken under the prefix, including ex codes of DELETE customers waiting for data transfer
+    """
+    codes = Customer.objects.filter(prefix=prefix, code__isnull=False).values_list('code', flat=True)
+    codes = {int(code) for code in codes if code.isdigit()}
+    if with_reserved:
+        reserved = Customer.objects.filter(prefix='DELETE', ex_prefix=prefix, ex_code__isnull=False,
+                                           is_data_transferred=False).values_list('ex_code', flat=True)
+        codes |= {int(code) for code in reserved if code.isdigit()}
+    return codes
+
+
+def scan_prefix(prefix, with_reserved=True) -> int:
+    """
+    Store gaps of the prefix as free codes, returns the highest taken code
+    """
+    codes = prefix_codes(prefix, with_reserved)
+    last_code = max(codes, default=0)
+    FreeCode.objects.bulk_create([FreeCode(prefix=prefix, code=code) for code in range(1, last_code)
+                                  if code not in codes], batch_size=1000, ignore_conflicts=True)
+    return last_code
+
+
+def init_code_sequence(name) -> None:
+    if name == 'DELETE':
+        prefix = 'DELETE'
+    else:
+        last_customer = (Customer.objects.filter(user_type=name, prefix__isnull=False, code__isnull=False)
+                         .exclude(prefix='DELETE').order_by('id').last())
+        prefix = last_customer.prefix if last_customer else start_prefix(name)
+    last_code = scan_prefix(prefix, with_reserved=name != 'DELETE')
+    CodeSequence.objects.get_or_create(name=name, defaults={'prefix': prefix, 'last_code': last_code})
+
+
+def allocate_codes(name, count=1) -> list:
+    """
+    Hand out `count` (prefix, code) pairs of a sequence (AUTO, AVIA or DELETE), released codes first.
+    The sequence row is locked until the surrounding transaction ends, so create the customers inside it
+    """
+    with transaction.atomic():
+        sequence = CodeSequence.objects.select_for_update().filter(name=name).first()
+        if sequence is None:
+            init_code_sequence(name)
+            sequence = CodeSequence.objects.select_for_update().get(name=name)
+
+        codes = []
+        while len(codes) < count:
+            needed = count - len(codes)
+            free_codes = list(FreeCode.objects.filter(prefix=sequence.prefix).order_by('code')[:needed])
+            if free_codes:
+                FreeCode.objects.filter(id__in=[free_code.id for free_code in free_codes]).delete()
+                candidates = [free_code.code for free_code in free_codes]
+            else:
+                if name != 'DELETE' and next_prefix(sequence.prefix, name) != sequence.prefix:
+                    needed = min(needed, PREFIX_CAPACITY - sequence.last_code)
+                    if needed <= 0:
+                        sequence.prefix = next_prefix(sequence.prefix, name)
+                        sequence.last_code = scan_prefix(sequence.prefix)
+                        continue
+                candidates = range(sequence.last_code + 1, sequence.last_code + needed + 1)
+                sequence.last_code = candidates[-1]
+
+            candidates = [str(code).zfill(4) for code in candidates]
+            # codes may also be set by hand, skip the taken ones
+            taken = set(Customer.objects.filter(prefix=sequence.prefix, code__in=candidates)
+                        .values_list('code', flat=True))
+            codes += [(sequence.prefix, code) for code in candidates if code not in taken]
+
+        sequence.save()
+        return codes
+
+
+def release_code(prefix, code) -> None:
+    if prefix and code and str(code).isdigit():
+        FreeCode.objects.bulk_create([FreeCode(prefix=prefix, code=int(code))], ignore_conflicts=True)
+
+
 def generate_code(customer_data: dict) -> tuple:
     user_type = customer_data.get('user_type')
-    query = Customer.objects.filter(user_type=user_type, prefix__isnull=False, code__isnull=False).order_by('id')
-    if query.exists():
-        last_prefix = query.last().prefix
-    else:
-        last_prefix = start_prefix(user_type)
-
-    customers_with_last_prefix = query.filter(prefix=last_prefix).order_by('code')
-    codes = [int(c.code) for c in customers_with_last_prefix]
-    max_code = max(codes) if codes else 0
-    next_code = None
-    for i in range(1, max_code + 2):
-        if i not in codes:
-            next_code = str(i).zfill(4)
-            break
-
-    customers_count = query.filter(prefix=last_prefix).count()
-    if customers_count > 3000:
-        prefix = last_prefix
-        code = next_code if next_code else str(customers_count).zfill(4)
-        return prefix, code
-    elif customers_count == 3000 and last_prefix not in ['ZRD', 'GZG']:
-        prefix = next_code if next_code else next_prefix(last_prefix, user_type)
-        code = str(1).zfill(4)
-        return prefix, code
-
-    prefix = last_prefix
-    code = next_code if next_code else str(customers_count + 1).zfill(4)
-    return prefix, code
+    if user_type not in ['AUTO', 'AVIA']:
+        raise APIValidation('user_type must be AUTO or AVIA')
+    return allocate_codes(user_type)[0]
 
 
 def prefix_check(prefix, user_type):
@@ -94,6 +94,17 @@ LOAD_STATUS_CHOICE = [
     (LOAD_DONE_MAIL, _('Готово-почта')),
 ]
 
+MANIFEST_PENDING = 'PENDING'
+MANIFEST_PROCESSING = 'PROCESSING'
+MANIFEST_DONE = 'DONE'
+MANIFEST_FAILED = 'FAILED'
+MANIFEST_STATUS_CHOICE = [
+    (MANIFEST_PENDING, _('В ожидании')),
+    (MANIFEST_PROCESSING, _('Обрабатывается')),
+    (MANIFEST_DONE, _('Завершен')),
+    (MANIFEST_FAILED, _('Ошибка')),
+]
+
 # Tools
 TAKE_AWAY = 'TAKE_AWAY'
 TAKE_AWAY_DISPLAY = _('Самовывоз')
@@ -109,9 +120,62 @@ DELIVERY_TYPE_CHOICE = [
 
 NEWSLETTER_SENT = 'SENT'
 NEWSLETTER_PENDING = 'PENDING'
+NEWSLETTER_SENDING = 'SENDING'
 NEWSLETTER_STATUS_CHOICE = [
     (NEWSLETTER_SENT, _('Опубликован')),
-    (NEWSLETTER_PENDING, _('В ожидании'))
+    (NEWSLETTER_PENDING, _('В ожидании')),
+    (NEWSLETTER_SENDING, _('Рассылается')),
+]
+
+RECIPIENT_PENDING = 'PENDING'
+RECIPIENT_SENDING = 'SENDING'  # claimed by a chunk task, being sent
+RECIPIENT_SENT = 'SENT'
+RECIPIENT_FAILED = 'FAILED'
+NEWSLETTER_RECIPIENT_STATUS_CHOICE = [
+    (RECIPIENT_PENDING, _('В ожидании')),
+    (RECIPIENT_SENDING, _('Отправляется')),
+    (RECIPIENT_SENT, _('Доставлено')),
+    (RECIPIENT_FAILED, _('Ошибка')),
+]
+
+# Outbound telegram messages
+OUTBOUND_PENDING = 'PENDING'
+OUTBOUND_SENDING = 'SENDING'  # claimed by a worker, being sent
+OUTBOUND_SENT = 'SENT'
+OUTBOUND_FAILED = 'FAILED'
+OUTBOUND_STATUS_CHOICE = [
+    (OUTBOUND_PENDING, _('В ожидании')),
+    (OUTBOUND_SENDING, _('Отправляется')),
+    (OUTBOUND_SENT, _('Доставлено')),
+    (OUTBOUND_FAILED, _('Ошибка')),
+]
+OUTBOUND_SEND_MESSAGE = 'send_message'
+OUTBOUND_SEND_LOCATION = 'send_location'
+OUTBOUND_SEND_INSTRUCTION = 'send_instruction'
+OUTBOUND_METHOD_CHOICE = [
+    (OUTBOUND_SEND_MESSAGE, OUTBOUND_SEND_MESSAGE),
+    (OUTBOUND_SEND_LOCATION, OUTBOUND_SEND_LOCATION),
+    (OUTBOUND_SEND_INSTRUCTION, OUTBOUND_SEND_INSTRUCTION),
+]
+
+# Analytics
+STAT_LOADS = 'LOADS'
+STAT_LOADS_DONE = 'LOADS_DONE'
+STAT_PAYMENTS = 'PAYMENTS'
+STAT_CUSTOMERS = 'CUSTOMERS'
+STAT_PRODUCTS_ON_WAY = 'PRODUCTS_ON_WAY'
+STAT_PRODUCTS_DELIVERED = 'PRODUCTS_DELIVERED'
+STAT_PRODUCTS_LOADED = 'PRODUCTS_LOADED'
+STAT_PRODUCTS_DONE = 'PRODUCTS_DONE'
+DAILY_STAT_METRIC_CHOICE = [
+    (STAT_LOADS, _('Загрузки')),
+    (STAT_LOADS_DONE, _('Выданные загрузки')),
+    (STAT_PAYMENTS, _('Оплаты')),
+    (STAT_CUSTOMERS, _('Клиенты')),
+    (STAT_PRODUCTS_ON_WAY, _('Посылки в пути')),
+    (STAT_PRODUCTS_DELIVERED, _('Посылки в Ташкенте')),
+    (STAT_PRODUCTS_LOADED, _('Посылки ожидают выдачи')),
+    (STAT_PRODUCTS_DONE, _('Выданные посылки')),
 ]
 
 # Integrations
@@ -0,0 +1,109 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# attributes every LogRecord has, anything else came in with extra={...}
+RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    One json object per line: time, level, logger, message, where it was logged and the extra={...} fields
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRS})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SharedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler for a file written by several processes (gunicorn workers, celery children):
+    when another process has already rotated the file, reopen it instead of rotating it once more
+    """
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self.rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+        return super().shouldRollover(record)
+
+    def rotated_elsewhere(self) -> bool:
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+
+class QueueFileHandler(QueueHandler):
+    """
+    Puts records on a queue, a listener thread formats them and writes them to a rotating file,
+    so a log call in a request doesn't wait for the disk.
+    The listener is started per process on the first record, forked gunicorn and celery workers get their own
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0):
+        super().__init__(queue.SimpleQueue())
+        self.target = SharedRotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                encoding='utf-8', delay=True)
+        self.target.setFormatter(JsonFormatter())
+        self.listener = None
+        self.pid = None
+
+    def setFormatter(self, fmt):
+        # the formatter is applied in the listener thread, prepare() only merges the message args
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # args are merged now, they may change before the listener gets to them; the traceback is rendered
+        # now as well so the record doesn't keep the frames alive in the queue
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def start(self):
+        # a queue inherited from the parent process has no listener in this one
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.pid = os.getpid()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+
+    def close(self):
+        self.stop()
+        self.target.close()
+        super().close()
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # libs
     'rest_framework',
@@ -55,6 +56,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'apps.tools.middleware.ProfilingMiddleware',  # outermost to see the whole request, off unless PROFILING=1
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -105,6 +107,15 @@ DATABASES = {
         'PORT': getenv('POSTGRES_PORT'),
     }
 }
+# manage.py test (the route budgets of apps/tools/tests.py too) runs without a PostgreSQL server:
+# SQLITE_DATABASE=db.sqlite3 python manage.py test, the PostgreSQL only tests are skipped
+if getenv('SQLITE_DATABASE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / getenv('SQLITE_DATABASE'),
+        }
+    }
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -155,6 +166,17 @@ STATIC_ROOT = join_path(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = join_path(BASE_DIR, 'media')
 FILE_UPLOAD_DIR = join_path(MEDIA_ROOT, 'uploads')
+# who sends the bytes of /media/ once the view checked access: django (FileResponse, sendfile under gunicorn),
+# accel (nginx X-Accel-Redirect to an internal location aliased to MEDIA_ROOT) or sendfile (apache/lighttpd X-Sendfile)
+MEDIA_SERVING = {
+    'backend': getenv('MEDIA_SERVING', 'django'),
+    'accel_prefix': getenv('MEDIA_ACCEL_PREFIX', '/protected-media/'),
+}
+# orphan File rows (nothing links to them) older than min_age_hours are deleted nightly, batch_size at a time
+FILE_GC = {
+    'min_age_hours': int(getenv('FILE_GC_MIN_AGE_HOURS', 48)),
+    'batch_size': int(getenv('FILE_GC_BATCH_SIZE', 500)),
+}
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -175,6 +197,12 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'Asia/Tashkent'
+# bot updates and messages get their own worker (start_apps/telegram_worker), newsletters and imports
+# don't hold them back
+CELERY_TASK_ROUTES = {
+    'process_bot_updates': {'queue': 'telegram'},
+    'send_outbound_message': {'queue': 'telegram'},
+}
 
 # RestFramework
 REST_FRAMEWORK = {
@@ -190,6 +218,10 @@ REST_FRAMEWORK = {
 # CRONJOB
 CRONJOBS = [
     ('0 0 * * *', "apps.tools.cron.non_active_customers"),
+    ('30 0 * * *', "apps.tools.cron.daily_stats"),
+    ('*/30 * * * *', "apps.tools.cron.resume_newsletters"),
+    ('*/10 * * * *', "apps.tools.cron.resume_outbound_messages"),
+    ('0 3 * * *', "apps.tools.cron.orphan_files"),
 ]
 
 # Integrations
@@ -203,11 +235,21 @@ INTEGRATIONS = {
     }
 }
 
+# Profiling, per-endpoint stats on /tool/admin/profiling/
+PROFILING = {
+    'enabled': bool(int(getenv('PROFILING', 0))),
+    'slow_ms': int(getenv('PROFILING_SLOW_MS', 500)),
+    'trace_sample_rate': float(getenv('PROFILING_TRACE_SAMPLE_RATE', 0)),  # share of requests run under a profiler
+    'profiler': getenv('PROFILING_PROFILER', 'cprofile'),  # cprofile or pyinstrument (not in requirements)
+}
+
 # TG bot tokens
 BOT_TOKENS = {
     'avia_customer': getenv('AVIA_BOT_TOKEN'),
     'auto_customer': getenv('AUTO_BOT_TOKEN'),
 }
+# another Bot API server, e.g. fake_telegram_server in development: http://127.0.0.1:8081
+TELEGRAM_API_URL = getenv('TELEGRAM_API_URL')
 
 # Swagger
 SWAGGER_SETTINGS = {
@@ -221,6 +263,11 @@ SWAGGER_SETTINGS = {
 }
 
 # Logging
+# records go through a queue to a listener thread which writes json lines to a rotating file;
+# LOG_LEVELS overrides single loggers: "apps.bot=DEBUG,django.db.backends=DEBUG"
+LOG_LEVEL = getenv('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO')
+LOG_LEVELS = dict(item.strip().split('=') for item in getenv('LOG_LEVELS', '').split(',') if '=' in item)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -228,8 +275,8 @@ LOGGING = {
         'console': {
             'format': '%(name)-12s %(levelname)-8s %(message)s'
         },
-        'file': {
-            'format': '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
+        'json': {
+            '()': 'config.core.log_handlers.JsonFormatter'
         }
     },
     'handlers': {
@@ -238,21 +285,32 @@ LOGGING = {
             'formatter': 'console'
         },
         'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'formatter': 'file',
-            'filename': join_path(BASE_DIR, 'logs.log')
+            '()': 'config.core.log_handlers.QueueFileHandler',
+            'formatter': 'json',
+            'filename': join_path(BASE_DIR, 'logs.log'),
+            'max_bytes': int(getenv('LOG_MAX_BYTES', 50 * 1024 * 1024)),
+            'backup_count': int(getenv('LOG_BACKUP_COUNT', 5))
         }
     },
+    'root': {
+        'level': LOG_LEVEL,
+        'handlers': ['file']
+    },
     'loggers': {
-        '': {
-            'level': 'DEBUG',
-            'handlers': ['file']
-        },
         'django.request': {
-            'level': 'DEBUG',
-            'handlers': ['file']
-        }
+            'level': 'INFO'
+        },
+        # sql of every query at DEBUG
+        'django.db.backends': {
+            'level': 'INFO'
+        },
+        'urllib3': {
+            'level': 'WARNING'
+        },
+        'TeleBot': {
+            'level': 'INFO'
+        },
+        **{name: {'level': level.upper()} for name, level in LOG_LEVELS.items()}
     }
 }
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
@@ -7,6 +7,8 @@ from drf_yasg import openapi
 from django.conf import settings
 from django.conf.urls.static import static
 
+from apps.files.views import MediaAPIView
+
 swagger_description = """
 __Authorization: Bearer <ACCESS_TOKEN>__, Get tokens from __/staff/token/__ and __/staff/telegram/token/__
 
@@ -127,6 +129,7 @@ urlpatterns = [
     path('file/', include('apps.files.urls')),
     path('payment/', include('apps.payment.urls')),
     path('integration/', include('apps.integrations.urls')),
+    # media goes through the access check, the bytes through X-Accel-Redirect/X-Sendfile or sendfile
+    re_path(r'^media/(?P<name>.+)$', MediaAPIView.as_view(), name='media'),
 ]
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)